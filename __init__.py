@@ -26,11 +26,14 @@
 # NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
 # SOFTWARE,  EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, \
+    wait
 from enum import Enum
-from threading import Thread
-from time import time
+from os.path import join
+from threading import Event, Semaphore, Thread
+from time import time, monotonic
+from typing import Callable, Dict, Iterator, List, Optional
 
-from lingua_franca.format import nice_duration
 from ovos_bus_client.message import Message
 from ovos_utils import classproperty
 from ovos_utils.log import LOG
@@ -38,9 +41,26 @@ from ovos_utils.process_utils import RuntimeRequirements
 from ovos_workshop.skills.fallback import FallbackSkill
 from ovos_workshop.decorators import intent_handler, fallback_handler
 from neon_utils.message_utils import get_message_user, dig_for_message
-from neon_utils.user_utils import get_user_prefs
-from neon_utils.hana_utils import request_backend
-from neon_mq_connector.utils.client_utils import send_mq_request
+
+from .client import AsyncLLMClient, get_hana_auth_headers
+from .cache import ResponseCache, SingleFlight, normalize_utterance
+from .emails import EmailQueue
+from .history import ChatHistory, SQLiteHistoryStore, Turn, \
+    get_context_window, to_payload
+from .metrics import LatencyMetrics
+from .prefilter import UtteranceFilter
+from .ratelimit import UserRateLimiter
+from .router import LLMRouter
+from .resilience import CircuitBreaker, CircuitOpenError, \
+    call_with_retries, is_transient_error
+from .sessions import DeltaSessions, is_session_mismatch
+from .session_store import MemorySessionStore, SQLiteSessionStore, \
+    SessionStore
+from .speculative import Speculation, SpeculativeRequests
+from .streaming import SentenceSegmenter
+from .summarizer import RollingSummarizer, build_summary_prompt
+from .transcript import split_transcript
+from .workers import Priority, UserWorkQueue
 
 
 class LLM(Enum):
@@ -51,11 +71,67 @@ class LLM(Enum):
 class LLMSkill(FallbackSkill):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        self.chat_history = dict()
+        self.chat_history = self._init_chat_history()
         self._default_user = "local"
         self._default_llm = LLM.FASTCHAT
-        self.chatting = dict()
+        self.chatting = self._init_session_store()
+        self._sweeper_stopped = Event()
+        self.trimmed_history_entries = 0
+        self._metrics = LatencyMetrics()
+        self._utterance_filter = UtteranceFilter(
+            min_words=self.settings.get("prefilter_min_words") or 1)
+        self._noise_vocab: Dict[str, frozenset] = dict()
+        self._workers = UserWorkQueue(self.worker_threads,
+                                      self.max_queued_requests)
+        self._rate_limiter = UserRateLimiter(
+            self.rate_limit_per_minute,
+            self.settings.get("rate_limit_burst") or 5) if \
+            self.rate_limit_per_minute else None
+        self._response_cache = ResponseCache(
+            self.response_cache_size, self.response_cache_ttl) if \
+            self.response_cache_size else None
+        self._single_flight = SingleFlight()
+        self._email_queue = EmailQueue(
+            self._send_email_request,
+            self.settings.get("email_retries") or 3,
+            self.settings.get("email_retry_seconds") or 10)
+        self._delta_sessions = DeltaSessions() if \
+            self.settings.get("delta_sessions") else None
+        self._summarizer = RollingSummarizer(
+            self._summarize_history,
+            self.settings.get("compaction_threshold") or 20,
+            self.settings.get("compaction_keep_entries") or 8,
+            self.settings.get("history_cache_users") or 1000) if \
+            self.settings.get("compact_history") else None
+        self._speculative = SpeculativeRequests(
+            self.settings.get("speculative_requests") or 2,
+            self.settings.get("speculative_ttl") or 30) if \
+            self.settings.get("speculative_dispatch") else None
+        self._llm_client = AsyncLLMClient(
+            self.backend_url, self.max_backend_connections,
+            get_headers=lambda refresh=False: get_hana_auth_headers(
+                self.backend_url, refresh)) if \
+            self.settings.get("async_client") else None
+        self._router = LLMRouter(
+            hedge_percentile=self.settings.get("hedge_percentile") or 95) if \
+            self.settings.get("adaptive_routing") else None
+        self._hedge_executor = ThreadPoolExecutor(
+            2 * self.worker_threads, thread_name_prefix="llm_hedge") if \
+            self._router and self.settings.get("hedge_requests") else None
+        # Requests are only hedged with an idle executor thread to run them
+        self._hedge_slots = Semaphore(2 * self.worker_threads)
+        self._circuit_breakers: Dict[str, CircuitBreaker] = {
+            self._get_endpoint(llm): CircuitBreaker(
+                self.circuit_breaker_threshold,
+                self.circuit_breaker_reset_seconds) for llm in LLM}
+        Thread(target=self._run_session_sweeper, daemon=True,
+               name="llm_session_sweeper").start()
         self.register_entity_file("llm.entity")
+        self.add_event("skill.fallback_llm.metrics", self.handle_get_metrics)
+        if self._speculative:
+            self.add_event("recognizer_loop:utterance", self.handle_speculate)
+            self.add_event("ovos.utterance.handled",
+                           self.handle_utterance_handled)
 
     @classproperty
     def runtime_requirements(self):
@@ -73,30 +149,331 @@ class LLMSkill(FallbackSkill):
     def chat_timeout_seconds(self):
         return self.settings.get("chat_timeout_seconds") or 300
 
+    @property
+    def session_sweep_seconds(self) -> float:
+        """
+        Seconds between checks for expired chat sessions
+        """
+        return self.settings.get("session_sweep_seconds") or 5
+
     @property
     def fallback_enabled(self):
         return self.settings.get("fallback_enabled", False)
 
+    @property
+    def prefilter_enabled(self) -> bool:
+        """
+        If True, skip fallback requests for utterances that are likely noise
+        """
+        return self.settings.get("prefilter_enabled", False)
+
+    @property
+    def worker_threads(self) -> int:
+        """
+        Number of threads used to handle fallback and conversation requests
+        """
+        return self.settings.get("worker_threads") or 4
+
+    @property
+    def max_queued_requests(self) -> int:
+        """
+        Max number of requests waiting to be handled for a single user
+        """
+        return self.settings.get("max_queued_requests") or 3
+
+    @property
+    def rate_limit_per_minute(self) -> float:
+        """
+        Sustained number of LLM requests allowed per user per minute
+        (0 to disable rate limiting)
+        """
+        return self.settings.get("rate_limit_per_minute") or 0
+
+    @property
+    def backend_url(self) -> str:
+        """
+        Base URL of the HANA server used for LLM requests
+        """
+        return self.settings.get("backend_url") or \
+            self.config_core.get("hana", {}).get("url") or \
+            "https://hana.neonaiservices.com"
+
+    @property
+    def max_backend_connections(self) -> int:
+        """
+        Max number of connections the async LLM client keeps open
+        """
+        return self.settings.get("max_backend_connections") or 8
+
+    @property
+    def request_timeout(self) -> float:
+        """
+        Max seconds to wait for an LLM response, including retries
+        """
+        return self.settings.get("request_timeout") or 60
+
+    @property
+    def request_retries(self) -> int:
+        """
+        Max number of times to retry an LLM request after a transient error
+        """
+        return self.settings.get("request_retries", 2)
+
+    @property
+    def circuit_breaker_threshold(self) -> int:
+        """
+        Number of consecutive failed requests after which an LLM endpoint is
+        considered unavailable
+        """
+        return self.settings.get("circuit_breaker_threshold") or 5
+
+    @property
+    def circuit_breaker_reset_seconds(self) -> int:
+        """
+        Seconds to wait before retrying an unavailable LLM endpoint
+        """
+        return self.settings.get("circuit_breaker_reset_seconds") or 30
+
+    @property
+    def history_store(self) -> str:
+        """
+        Where chat history is kept; `memory` or `sqlite`
+        """
+        return self.settings.get("history_store") or "memory"
+
+    @property
+    def history_path(self) -> str:
+        """
+        Path to the SQLite database for persistent history and sessions
+        """
+        return self.settings.get("history_path") or \
+            join(self.file_system.path, "chat_history.sqlite")
+
+    @property
+    def email_format(self) -> str:
+        """
+        Format of chat history emails; `text` or `html`
+        """
+        return self.settings.get("email_format") or "text"
+
+    @property
+    def session_store(self) -> str:
+        """
+        Where active chat sessions are kept; `memory` or `sqlite` to share
+        sessions and history with other instances on this host
+        """
+        return self.settings.get("session_store") or "memory"
+
+    @property
+    def history_max_bytes(self) -> int:
+        """
+        Approximate max bytes of chat history to hold in memory for all users
+        """
+        return int((self.settings.get("history_max_mb") or 64) * 1024 * 1024)
+
+    @property
+    def context_max_turns(self) -> int:
+        """
+        Max number of query/response exchanges to send as LLM context
+        (0 for no limit)
+        """
+        return self.settings.get("context_max_turns") or 0
+
+    @property
+    def context_max_tokens(self) -> int:
+        """
+        Approximate max number of history tokens to send as LLM context
+        (0 for no limit)
+        """
+        return self.settings.get("context_max_tokens") or 0
+
+    @property
+    def response_cache_size(self) -> int:
+        """
+        Max number of responses to history-free queries to cache
+        (0 to disable caching)
+        """
+        return self.settings.get("response_cache_size") or 0
+
+    @property
+    def response_cache_ttl(self) -> int:
+        """
+        Seconds after which a cached response expires
+        """
+        return self.settings.get("response_cache_ttl") or 3600
+
+    @property
+    def stream_responses(self) -> bool:
+        """
+        If True, split LLM responses into sentences that are spoken one at a
+        time
+        """
+        return self.settings.get("stream_responses", False)
+
+    def _init_chat_history(self) -> ChatHistory:
+        """
+        Initialize chat history storage based on skill settings
+        :returns: ChatHistory object to hold chat history for all users
+        """
+        shared = self.session_store == "sqlite"
+        if self.history_store == "memory":
+            if shared:
+                raise ValueError("A shared session_store requires "
+                                 "history_store: sqlite")
+            return ChatHistory(max_bytes=self.history_max_bytes,
+                               on_drop=self._on_history_dropped)
+        if self.history_store != "sqlite":
+            raise ValueError(f"Invalid history_store: {self.history_store}")
+        path = self.history_path
+        LOG.info(f"Loading chat history from {path}")
+        return ChatHistory(
+            SQLiteHistoryStore(path),
+            max_users=self.settings.get("history_cache_users") or 1000,
+            max_entries=self.settings.get("history_cache_entries") or 100,
+            idle_seconds=self.settings.get("history_idle_seconds") or 3600,
+            max_bytes=self.history_max_bytes, shared=shared,
+            on_drop=self._on_history_dropped)
+
+    def _on_history_dropped(self, user: str):
+        """
+        Discard state derived from a user's history when it is removed
+        :param user: user whose history was removed
+        """
+        if self._summarizer:
+            self._summarizer.reset(user)
+
+    def _init_session_store(self) -> SessionStore:
+        """
+        Initialize chat session storage based on skill settings
+        :returns: SessionStore object to hold active chat sessions
+        """
+        if self.session_store == "memory":
+            return MemorySessionStore()
+        if self.session_store != "sqlite":
+            raise ValueError(f"Invalid session_store: {self.session_store}")
+        LOG.info(f"Sharing chat sessions in {self.history_path}")
+        return SQLiteSessionStore(self.history_path,
+                                  encode=lambda llm: llm.name,
+                                  decode=lambda name: LLM[name])
+
     @fallback_handler(85)
     def fallback_llm(self, message):
+        started = monotonic()
         if not self.fallback_enabled:
             LOG.info("LLM Fallback Disabled")
             return False
         utterance = message.data['utterance']
+        if self.prefilter_enabled:
+            rejected_by = self._utterance_filter.check(
+                utterance, self._get_noise_vocab(message.data.get("lang")))
+            if rejected_by:
+                LOG.info(f"Ignoring utterance ({rejected_by}): {utterance}")
+                return False
         LOG.info(f"Getting LLM response to: {utterance}")
         user = get_message_user(message) or self._default_user
+        llms = self._rank_llms()
+        if not llms:
+            LOG.warning(f"No LLM is available; skipping LLM fallback")
+            return False
+        llm = llms[0]
+        hedge_llm = llms[1] if self._hedge_executor and len(llms) > 1 \
+            else None
+        endpoint = self._get_endpoint(llm)
+        # Claim the speculation now, before this utterance is marked handled
+        speculation = self._speculative.take(
+            user, (endpoint, normalize_utterance(utterance))) if \
+            self._speculative else None
 
-        def _threaded_get_response(utt, usr):
-            answer = self._get_llm_response(utt, usr, self._default_llm)
+        def _threaded_get_response(utt, usr, spec):
+            self._metrics.record("queue_wait", monotonic() - started)
+            answer = self._speak_llm_response(utt, usr, llm, spec, hedge_llm)
             if not answer:
                 LOG.info(f"No fallback response")
-                return
-            self.speak(answer)
+            self._metrics.record("fallback_llm", monotonic() - started)
 
         # TODO: Speak filler?
-        Thread(target=_threaded_get_response, args=(utterance, user), daemon=True).start()
+        if not self._schedule(user, _threaded_get_response, utterance, user,
+                              speculation) and speculation:
+            self._speculative.release(speculation)
         return True
 
+    def _schedule(self, user: str, func: Callable, *args,
+                  priority: Priority = Priority.BACKGROUND) -> bool:
+        """
+        Queue an LLM request for a user. If the request is shed because the
+        user is over their rate limit or the queue is full, the user is told.
+        :param user: Username making the request
+        :param func: callable that handles the request
+        :param args: positional args to pass to `func`
+        :param priority: scheduling priority of the request
+        :returns: True if the request was queued
+        """
+        if self._rate_limiter and not self._rate_limiter.allow(user):
+            LOG.info(f"Rate limit exceeded for {user}")
+            self.speak_dialog("llm_rate_limited")
+            return False
+        if not self._workers.submit(user, func, *args, priority=priority):
+            self.speak_dialog("llm_busy")
+            return False
+        return True
+
+    def handle_speculate(self, message):
+        """
+        Start an LLM request for an utterance entering the intent pipeline,
+        in case it reaches the LLM fallback
+        :param message: Message containing recognized utterances
+        """
+        if not self.fallback_enabled:
+            return
+        utterance = (message.data.get("utterances") or [""])[0]
+        # Don't count the utterance in filter stats; it is checked again if
+        # it reaches the fallback
+        if self.prefilter_enabled and self._utterance_filter.check(
+                utterance, self._get_noise_vocab(message.data.get("lang")),
+                count=False):
+            return
+        user = get_message_user(message) or self._default_user
+        if user in self.chatting:
+            # Utterances in a chat session are handled by converse
+            return
+        if self._rate_limiter and not self._rate_limiter.has_capacity(user):
+            return
+        llms = self._rank_llms()
+        if not llms:
+            return
+        endpoint = self._get_endpoint(llms[0])
+
+        def _speculate():
+            history_count = self.chat_history.count(user)
+            history = self._get_llm_context(user)
+            return history_count, "".join(
+                self._fetch_llm_response(endpoint, utterance, history))
+
+        self._speculative.start(user,
+                                (endpoint, normalize_utterance(utterance)),
+                                _speculate)
+
+    def handle_utterance_handled(self, message):
+        """
+        Discard any unclaimed speculation for an utterance that was handled
+        :param message: Message emitted after an utterance is handled
+        """
+        self._speculative.discard(get_message_user(message) or
+                                  self._default_user)
+
+    def _get_noise_vocab(self, lang: Optional[str] = None) -> frozenset:
+        """
+        Get normalized phrases that should not be sent to an LLM
+        :param lang: language to get phrases for, else the skill language
+        :returns: set of normalized noise phrases
+        """
+        lang = lang or self.lang
+        if lang not in self._noise_vocab:
+            self._noise_vocab[lang] = frozenset(
+                normalize_utterance(phrase) for phrase in
+                self.voc_list("noise", lang))
+        return self._noise_vocab[lang]
+
     @intent_handler("enable_fallback.intent")
     def handle_enable_fallback(self, message):
         if not self.fallback_enabled:
@@ -111,18 +488,31 @@ class LLMSkill(FallbackSkill):
 
     @intent_handler("ask_llm.intent")
     def handle_ask_chatgpt(self, message):
+        started = monotonic()
         utterance = message.data['utterance']
         llm = self._get_requested_llm(message)
         user = get_message_user(message) or self._default_user
-        try:
-            resp = self._get_llm_response(utterance, user, llm)
-            self.speak(resp)
-        except Exception as e:
-            LOG.exception(e)
-            self.speak_dialog("no_chatgpt")
+        done = Event()
+
+        def _threaded_ask():
+            self._metrics.record("queue_wait", monotonic() - started)
+            try:
+                self._speak_llm_response(utterance, user, llm)
+            except Exception as e:
+                LOG.exception(e)
+                self.speak_dialog("no_chatgpt")
+            finally:
+                done.set()
+
+        if self._schedule(user, _threaded_ask,
+                          priority=Priority.INTERACTIVE):
+            # Allow for time spent queued behind other requests
+            done.wait(2 * self.request_timeout)
+        self._metrics.record("ask_llm", monotonic() - started)
 
     @intent_handler("chat_with_llm.intent")
     def handle_chat_with_llm(self, message):
+        from lingua_franca.format import nice_duration
         user = get_message_user(message) or self._default_user
         self.gui.show_controlled_notification(
             self.translate("notify_llm_active"))
@@ -134,6 +524,7 @@ class LLMSkill(FallbackSkill):
 
     @intent_handler("email_chat_history.intent")
     def handle_email_chat_history(self, message):
+        from neon_utils.user_utils import get_user_prefs
         user_prefs = get_user_prefs(message)['user']
         username = user_prefs['username']
         email_addr = user_prefs['email']
@@ -151,61 +542,442 @@ class LLMSkill(FallbackSkill):
         self._send_email(username, email_addr)
 
     def _send_email(self, username: str, email: str):
-        history = self.chat_history.get(username)
-        email_text = ""
-        for entry in history:
-            formatted = entry[1].replace('\n\n', '\n').replace('\n', '\n\t...')
-            email_text += f"[{entry[0]}] {formatted}\n"
-        self.send_email("LLM Conversation", email_text, email_addr=email)
+        """
+        Queue a chat history email to be sent in the background
+        :param username: user whose history to send
+        :param email: address to send history to
+        """
+        if not self._email_queue.submit(
+                (username, email),
+                lambda: self._build_history_email(username, email)):
+            LOG.warning(f"Email queue full; not sending history for "
+                        f"{username}")
+
+    def _build_history_email(self, username: str, email: str) -> dict:
+        """
+        Render a user's chat history as an email request
+        :param username: user whose history to send
+        :param email: address to send history to
+        :returns: email request data for the email service
+        """
+        body, attachments = split_transcript(
+            self.chat_history.get_full(username), self.email_format,
+            (self.settings.get("email_max_kb") or 256) * 1024)
+        return {"recipient": email,
+                "subject": "LLM Conversation",
+                "body": body,
+                "attachments": attachments or None}
+
+    @staticmethod
+    def _send_email_request(request_data: dict) -> bool:
+        """
+        Send an email request to the email service
+        :param request_data: recipient, subject, body, and attachments
+        :returns: True if the email was sent
+        """
+        from neon_mq_connector.utils.client_utils import send_mq_request
+        data = send_mq_request("/neon_emails", request_data,
+                               "neon_emails_input")
+        return bool(data.get("success"))
 
     def _stop_chatting(self, message):
         user = get_message_user(message) or self._default_user
         self.gui.remove_controlled_notification()
-        self.chatting.pop(user)
+        self.chatting.pop(user, None)
         self.speak_dialog("end_chat")
-        event_name = f"end_converse.{user}"
-        self.cancel_scheduled_event(event_name)
 
-    def _get_llm_response(self, query: str, user: str, llm: LLM) -> str:
+    def _run_session_sweeper(self):
+        """
+        Periodically end expired chat sessions until the skill is shut down
+        """
+        while not self._sweeper_stopped.wait(self.session_sweep_seconds):
+            try:
+                self._end_expired_chats()
+                if self._rate_limiter:
+                    self._rate_limiter.prune()
+            except Exception as e:
+                LOG.exception(e)
+
+    def _end_expired_chats(self):
+        """
+        End all chat sessions that have been inactive for longer than
+        `chat_timeout_seconds`
+        """
+        for user in self.chatting.pop_expired(self.chat_timeout_seconds):
+            LOG.info(f"Chat session expired for {user}")
+            self._stop_chatting(Message("neon.fallback_llm.chat_expired",
+                                        {"user": user}, {"username": user}))
+
+    def _speak_llm_response(self, query: str, user: str, llm: LLM,
+                            speculation: Optional[Speculation] = None,
+                            hedge_llm: Optional[LLM] = None) -> str:
+        """
+        Get a response from an LLM and speak it. If `stream_responses` is
+        enabled, the response is split into sentences that are spoken one at a
+        time; each is spoken as soon as the backend has returned it.
+        :param query: User utterance to generate a response to
+        :param user: Username making the request
+        :param llm: LLM to get a response from
+        :param speculation: request already started for this query, if any
+        :param hedge_llm: LLM to also query if `llm` responds slowly
+        :returns: Full response spoken to the user
+        """
+        def _speak(utterance):
+            with self._metrics.span("speak"):
+                self.speak(utterance)
+
+        if not self.stream_responses:
+            resp = self._get_llm_response(query, user, llm, speculation,
+                                          hedge_llm)
+            if resp:
+                _speak(resp)
+            return resp
+        segmenter = SentenceSegmenter()
+        resp = ""
+        for chunk in self._stream_llm_response(query, user, llm, speculation,
+                                               hedge_llm):
+            resp += chunk
+            for sentence in segmenter.feed(chunk):
+                _speak(sentence)
+        remaining = segmenter.flush()
+        if remaining:
+            _speak(remaining)
+        return resp
+
+    def _get_llm_response(self, query: str, user: str, llm: LLM,
+                          speculation: Optional[Speculation] = None,
+                          hedge_llm: Optional[LLM] = None) -> str:
         """
         Get a response from an LLM
         :param query: User utterance to generate a response to
         :param user: Username making the request
+        :param llm: LLM to get a response from
+        :param speculation: request already started for this query, if any
+        :param hedge_llm: LLM to also query if `llm` responds slowly
         :returns: Speakable response to the user's query
         """
-        if llm == LLM.GPT:
-            endpoint = "chatgpt"
-        elif llm == LLM.FASTCHAT:
-            endpoint = "fastchat"
+        return "".join(self._stream_llm_response(query, user, llm,
+                                                 speculation, hedge_llm))
+
+    def _stream_llm_response(self, query: str, user: str, llm: LLM,
+                             speculation: Optional[Speculation] = None,
+                             hedge_llm: Optional[LLM] = None) -> \
+            Iterator[str]:
+        """
+        Get a response from an LLM as chunks of text. Current backends return
+        the complete response as a single chunk. Chat history is updated
+        after the full response is received.
+        :param query: User utterance to generate a response to
+        :param user: Username making the request
+        :param llm: LLM to get a response from
+        :param speculation: request already started for this query, if any
+        :param hedge_llm: LLM to also query if `llm` responds slowly
+        :returns: Iterator of partial response text
+        """
+        started = monotonic()
+        endpoint = self._get_endpoint(llm)
+        resp = self._speculative.get_result(
+            speculation, self.chat_history.count(user),
+            self.request_timeout) if speculation else None
+        if resp:
+            LOG.debug(f"Using speculative response for: {query}")
+            yield resp
         else:
-            raise ValueError(f"Expected LLM, got: {llm}")
-        self.chat_history.setdefault(user, list())
-        resp = request_backend(f"/llm/{endpoint}", {"query": query, "history": self.chat_history[user]})
+            resp = ""
+            for chunk in self._fetch_llm_response(
+                    endpoint, query, self._get_llm_context(user), user,
+                    self._get_endpoint(hedge_llm) if hedge_llm else None):
+                resp += chunk
+                yield chunk
 
-        resp = resp.get("response") or ""
         if resp:
             username = "user" if user == self._default_user else user
-            self.chat_history[user].append((username, query))
-            self.chat_history[user].append(("llm", resp))
+            self.chat_history.append(user, Turn(username, query),
+                                     Turn("llm", resp, llm.name))
+            if self._summarizer:
+                self._summarizer.maybe_compact(endpoint, user,
+                                               self.chat_history[user],
+                                               self.chat_history.count(user))
+        self._metrics.record(f"llm_response.{llm.name}", monotonic() - started)
         LOG.debug(f"Got LLM response: {resp}")
+
+    def _get_llm_context(self, user: str) -> list:
+        """
+        Get the chat history to send with a user's next LLM request
+        :param user: Username making the request
+        :returns: list of (speaker, text) entries, oldest first
+        """
+        entries = self.chat_history.get(user, [])
+        summary = []
+        if self._summarizer and entries:
+            summary, entries = self._summarizer.get_context(
+                user, entries, self.chat_history.count(user))
+        history, trimmed = get_context_window(entries,
+                                              self.context_max_turns,
+                                              self.context_max_tokens)
+        if trimmed:
+            self.trimmed_history_entries += trimmed
+            LOG.debug(f"Trimmed {trimmed} history entries for {user}")
+        return summary + history
+
+    def _fetch_llm_response(self, endpoint: str, query: str, history: list,
+                            user: Optional[str] = None,
+                            hedge_endpoint: Optional[str] = None) -> \
+            Iterator[str]:
+        """
+        Get a response from an LLM endpoint, using cached or shared responses
+        where possible. Chat history is not updated.
+        :param endpoint: LLM endpoint to query
+        :param query: User utterance to generate a response to
+        :param history: Chat history to send with the query
+        :param user: Username making the request, if it may use a backend
+            session
+        :param hedge_endpoint: LLM endpoint to also query if `endpoint`
+            responds slowly
+        :returns: Iterator of partial response text
+        """
+        def _request(usr=None):
+            if hedge_endpoint:
+                return self._request_hedged(endpoint, hedge_endpoint, query,
+                                            history, usr)
+            return self._request_llm(endpoint, query, history, usr)
+
+        # Responses only depend on the query if no history is sent
+        request_key = (endpoint, normalize_utterance(query)) if \
+            not history else None
+        resp = self._response_cache.get(request_key) if \
+            request_key and self._response_cache else None
+        if resp:
+            LOG.debug(f"Using cached response for: {query}")
+            yield resp
+        elif request_key:
+            # Share one backend request between identical concurrent queries
+            resp = self._single_flight.do(request_key,
+                                          lambda: "".join(_request()))
+            if resp:
+                if self._response_cache:
+                    self._response_cache.put(request_key, resp)
+                yield resp
+        else:
+            yield from _request(user)
+
+    def _request_hedged(self, endpoint: str, hedge_endpoint: str, query: str,
+                        history: list, user: Optional[str] = None) -> \
+            Iterator[str]:
+        """
+        Request a response from an LLM endpoint. If it has not responded
+        within its usual latency, send the same request to another endpoint
+        and use whichever response is received first. If the hedge executor
+        has no idle thread, i.e. it is still running requests that lost
+        earlier races, the request is not hedged.
+        :param endpoint: preferred LLM endpoint to query
+        :param hedge_endpoint: LLM endpoint to query if `endpoint` is slow
+        :param query: User utterance to generate a response to
+        :param history: Chat history to send as context
+        :param user: Username making the request, used for backend sessions
+        :returns: Iterator of response text
+        """
+        delay = self._router.hedge_delay(endpoint)
+        primary = self._submit_hedged(
+            lambda: "".join(self._request_llm(endpoint, query, history,
+                                              user))) if \
+            delay is not None else None
+        if not primary:
+            if delay is not None:
+                self._router.record_hedge_skipped()
+            yield from self._request_llm(endpoint, query, history, user)
+            return
+        pending = {primary}
+        hedge = None
+        if not wait(pending, timeout=delay).done:
+            hedge = self._submit_hedged(
+                lambda: "".join(self._request_llm(hedge_endpoint, query,
+                                                  history)))
+            if hedge:
+                LOG.debug(f"No response from {endpoint} after {delay}s; "
+                          f"sent request to {hedge_endpoint}")
+                pending.add(hedge)
+            else:
+                self._router.record_hedge_skipped()
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                try:
+                    resp = future.result()
+                except Exception as e:
+                    error = e
+                    continue
+                if hedge:
+                    self._router.record_hedge(future is hedge)
+                if resp:
+                    yield resp
+                return
+        raise error
+
+    def _submit_hedged(self, func: Callable[[], str]) -> Optional[Future]:
+        """
+        Run a request on the hedge executor if it has an idle thread
+        :param func: callable returning an LLM response
+        :returns: Future for the response, None if the executor is busy
+        """
+        if not self._hedge_slots.acquire(blocking=False):
+            return None
+        try:
+            future = self._hedge_executor.submit(func)
+        except RuntimeError:
+            # Executor is shut down
+            self._hedge_slots.release()
+            return None
+        future.add_done_callback(lambda _: self._hedge_slots.release())
+        return future
+
+    def _request_llm(self, endpoint: str, query: str, history: list,
+                     user: Optional[str] = None) -> Iterator[str]:
+        """
+        Request a response from an LLM backend endpoint. Backends that do not
+        stream responses yield the complete response as a single chunk.
+        :param endpoint: LLM endpoint to query
+        :param query: User utterance to generate a response to
+        :param history: Chat history to send as context
+        :param user: Username making the request, used for backend sessions
+        :returns: Iterator of partial response text
+        """
+        breaker = self._circuit_breakers[endpoint]
+        if not breaker.allow_request():
+            raise CircuitOpenError(f"{endpoint} is unavailable")
+        deadline = monotonic() + self.request_timeout
+        history = to_payload(history)
+
+        def _send(data):
+            return call_with_retries(
+                lambda timeout: self._call_backend(endpoint, data, timeout),
+                deadline, self.request_retries)
+
+        session_key = (user, endpoint) if \
+            self._delta_sessions and user and history else None
+        if session_key:
+            request_data = self._delta_sessions.build_request(
+                session_key, query, history)
+        else:
+            request_data = {"query": query, "history": history}
+        try:
+            try:
+                resp = _send(request_data)
+            except Exception as e:
+                if not (session_key and is_session_mismatch(e)):
+                    raise
+                LOG.info(f"Backend session out of sync for {user}; "
+                         f"sending full history")
+                request_data = self._delta_sessions.build_request(
+                    session_key, query, history, resync=True)
+                resp = _send(request_data)
+        except Exception as e:
+            if session_key:
+                self._delta_sessions.invalidate(session_key)
+            if is_transient_error(e):
+                breaker.record_failure()
+            else:
+                breaker.record_success()
+            raise
+        breaker.record_success()
+        resp = resp.get("response") or ""
+        if session_key and resp:
+            self._delta_sessions.update(session_key, request_data, resp)
+        if resp:
+            yield resp
+
+    def _call_backend(self, endpoint: str, request_data: dict,
+                      timeout: float) -> dict:
+        """
+        Make a single request to an LLM backend endpoint
+        :param endpoint: LLM endpoint to query
+        :param request_data: dict data to send in the request body
+        :param timeout: seconds to wait for a response
+        :returns: dict response
+        """
+        started = monotonic()
+        try:
+            with self._metrics.span(f"backend.{endpoint}"):
+                if self._llm_client:
+                    resp = self._llm_client.request_sync(
+                        f"/llm/{endpoint}", request_data, timeout)
+                else:
+                    from .client import request_backend
+                    resp = request_backend(f"/llm/{endpoint}", request_data,
+                                           self.backend_url, timeout)
+        except Exception as e:
+            # A session mismatch says nothing about endpoint health
+            if self._router and not is_session_mismatch(e):
+                self._router.record(endpoint, monotonic() - started, False)
+            raise
+        if self._router:
+            self._router.record(endpoint, monotonic() - started, True)
         return resp
 
+    def _summarize_history(self, endpoint: str, summary: Optional[str],
+                           entries: list) -> str:
+        """
+        Get an updated conversation summary from an LLM
+        :param endpoint: LLM endpoint to query
+        :param summary: existing summary of earlier history, if any
+        :param entries: (speaker, text) history entries to add to the summary
+        :returns: updated summary
+        """
+        return "".join(self._request_llm(
+            endpoint, build_summary_prompt(summary, entries), []))
+
+    @staticmethod
+    def _get_endpoint(llm: LLM) -> str:
+        """
+        Get the backend endpoint for an LLM
+        :param llm: LLM to get an endpoint for
+        :returns: name of the `/llm` endpoint serving `llm`
+        """
+        if llm == LLM.GPT:
+            return "chatgpt"
+        elif llm == LLM.FASTCHAT:
+            return "fastchat"
+        raise ValueError(f"Expected LLM, got: {llm}")
+
     def _get_requested_llm(self, message: Message) -> LLM:
         request = message.data.get('llm') or message.data.get('utterance')
         if self.voc_match(request, "chat_gpt"):
             llm = LLM.GPT
         elif self.voc_match(request, "fastchat"):
             llm = LLM.FASTCHAT
+        elif self._router:
+            llm = (self._rank_llms() or [LLM.GPT])[0]
+            LOG.debug(f"No LLM in request; using {llm.value}")
         else:
             LOG.warning(f"No valid LLM in request: {request}")
             llm = LLM.GPT
         return llm
 
+    def _rank_llms(self) -> List[LLM]:
+        """
+        Get the LLMs available to handle a request that does not specify
+        one. Without adaptive routing, only the default LLM is used.
+        :returns: available LLMs, most preferred first
+        """
+        llms = [self._default_llm] if not self._router else \
+            [self._default_llm] + [llm for llm in LLM
+                                   if llm != self._default_llm]
+        available = {self._get_endpoint(llm): llm for llm in llms}
+        available = {endpoint: llm for endpoint, llm in available.items()
+                     if not self._circuit_breakers[endpoint].is_open}
+        if not self._router:
+            return list(available.values())
+        return [available[endpoint] for endpoint in
+                self._router.rank(list(available))]
+
     def converse(self, message=None):
+        started = monotonic()
         user = get_message_user(message) or self._default_user
         if user not in self.chatting:
             return False
-        last_message = self.chatting[user][0]
+        # Read the session now; it may end before the queued reply runs
+        last_message, llm = self.chatting[user]
         if time() - last_message > self.chat_timeout_seconds:
             LOG.info(f"Chat session timed out")
             self._stop_chatting(message)
@@ -216,26 +988,94 @@ class LLMSkill(FallbackSkill):
             # TODO: Imperfect check for "stop" or "exit"
             self._stop_chatting(message)
             return True
-        Thread(target=self._threaded_converse, args=(utterance, user),
-               daemon=True).start()
+        self._schedule(user, self._threaded_converse, utterance, user, llm,
+                       started, priority=Priority.INTERACTIVE)
         return True
 
-    def _threaded_converse(self, utterance, user):
+    def _threaded_converse(self, utterance, user, llm, started=None):
+        started = started or monotonic()
+        self._metrics.record("queue_wait", monotonic() - started)
         try:
-            llm = self.chatting[user][1]
-            resp = self._get_llm_response(utterance, user, llm)
-            self.speak(resp)
-            self._reset_expiration(user, llm)
+            self._speak_llm_response(utterance, user, llm)
+            # Don't restart a session that ended while this was handled
+            if user in self.chatting:
+                self._reset_expiration(user, llm)
         except Exception as e:
             LOG.exception(e)
             self.speak_dialog("no_chatgpt")
+        self._metrics.record("converse", monotonic() - started)
 
     def _reset_expiration(self, user, llm):
         self.chatting[user] = (time(), llm)
-        event_name = f"end_converse.{user}"
-        self.cancel_scheduled_event(event_name)
-        self.schedule_event(self._stop_chatting, self.chat_timeout_seconds,
-                            {'user': user}, event_name)
+
+    def handle_get_metrics(self, message):
+        """
+        Handle a request for performance metrics
+        :param message: Message requesting metrics
+        """
+        self.bus.emit(message.response(
+            self.get_metrics(message.data.get("user"))))
+
+    def get_metrics(self, user: Optional[str] = None) -> dict:
+        """
+        Get a snapshot of performance metrics
+        :param user: if specified, include queue and rate limit stats for
+            this user
+        :returns: dict latency percentiles and request handling stats
+        """
+        metrics = {"latency": self._metrics.snapshot(),
+                   "workers": self._workers.get_stats(),
+                   "rate_limiter": self._rate_limiter.get_stats() if
+                   self._rate_limiter else None,
+                   "response_cache": self._response_cache.get_stats() if
+                   self._response_cache else None,
+                   "single_flight": self._single_flight.get_stats(),
+                   "emails": self._email_queue.get_stats(),
+                   "circuit_breakers": {endpoint: breaker.state for
+                                        endpoint, breaker in
+                                        self._circuit_breakers.items()},
+                   "trimmed_history_entries": self.trimmed_history_entries,
+                   "chat_sessions": len(self.chatting),
+                   "prefilter": self._utterance_filter.get_stats(),
+                   "summarizer": self._summarizer.get_stats() if
+                   self._summarizer else None,
+                   "delta_sessions": self._delta_sessions.get_stats() if
+                   self._delta_sessions else None,
+                   "speculative": self._speculative.get_stats() if
+                   self._speculative else None,
+                   "router": self._router.get_stats() if
+                   self._router else None,
+                   "chat_history": {
+                       "cached_users": self.chat_history.cached_users,
+                       "loads": self.chat_history.loads,
+                       "evictions": self.chat_history.evictions,
+                       "invalidations": self.chat_history.invalidations,
+                       "dropped_entries": self.chat_history.dropped_entries,
+                       "bytes": self.chat_history.size}}
+        if user:
+            metrics["user"] = {
+                "username": user,
+                "queue": self._workers.get_user_stats(user),
+                "history_bytes": self.chat_history.user_size(user),
+                "rate_limit": self._rate_limiter.get_user_stats(user) if
+                self._rate_limiter else None}
+        return metrics
+
+    def shutdown(self):
+        self._sweeper_stopped.set()
+        self._workers.shutdown()
+        self._email_queue.shutdown()
+        if self._summarizer:
+            self._summarizer.shutdown()
+        if self._speculative:
+            self._speculative.shutdown()
+        if self._llm_client:
+            self._llm_client.shutdown()
+        if self._hedge_executor:
+            self._hedge_executor.shutdown(wait=False, cancel_futures=True)
+        self.chat_history.close()
+        self.chatting.close()
+        super().shutdown()
 
     # TODO: copied from NeonSkill. This method should be moved to a standalone
     #       utility
@@ -255,19 +1095,18 @@ class LLMSkill(FallbackSkill):
             attachments (dict): Optional dict of file names to Base64 encoded files
             message (Message): Optional message to get email from
         """
+        from neon_utils.user_utils import get_user_prefs
         message = message or dig_for_message()
         if not email_addr and message:
             email_addr = get_user_prefs(message)["user"].get("email")
 
-        if email_addr and send_mq_request:
+        if email_addr:
             LOG.info("Send email via Neon Server")
             request_data = {"recipient": email_addr,
                             "subject": title,
                             "body": body,
                             "attachments": attachments}
-            data = send_mq_request("/neon_emails", request_data,
-                                   "neon_emails_input")
-            return data.get("success")
+            return self._send_email_request(request_data)
         else:
             LOG.warning("Attempting to send email via Mycroft Backend")
             super().send_email(title, body)
@@ -0,0 +1,174 @@
+# NEON AI (TM) SOFTWARE, Software Development Kit & Application Framework
+# All trademark and other rights reserved by their respective owners
+# Copyright 2008-2025 Neongecko.com Inc.
+# Contributors: Daniel McKnight, Guy Daniels, Elon Gasper, Richard Leeds,
+# Regina Bloomstine, Casimiro Ferreira, Andrii Pernatii, Kirill Hrymailo
+# BSD-3 License
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+# 3. Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived from this
+#    software without specific prior written permission.
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO,
+# THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+# CONTRIBUTORS  BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA,
+# OR PROFITS;  OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+# LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+# NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE,  EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import re
+
+from collections import OrderedDict
+from threading import Event, Lock
+from time import monotonic
+from typing import Any, Callable, Dict, Hashable, Optional
+
+_PUNCTUATION = re.compile(r"[^\w\s]")
+
+
+def normalize_utterance(utterance: str) -> str:
+    """
+    Normalize an utterance for use as a cache key
+    :param utterance: string utterance to normalize
+    :returns: lowercase utterance without punctuation or extra whitespace
+    """
+    return " ".join(_PUNCTUATION.sub("", utterance.lower()).split())
+
+
+class ResponseCache:
+    """
+    Thread-safe LRU cache of LLM responses. Entries expire after `ttl` seconds.
+    """
+    def __init__(self, max_size: int = 256, ttl: float = 3600):
+        """
+        :param max_size: max number of responses to cache
+        :param ttl: seconds after which a cached response expires
+        """
+        self._max_size = max_size
+        self._ttl = ttl
+        self._lock = Lock()
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable) -> Optional[str]:
+        """
+        Get a cached response
+        :param key: cache key to look up
+        :returns: cached response if available and not expired, else None
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and monotonic() - entry[0] > self._ttl:
+                del self._entries[key]
+                self.evictions += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key: Hashable, response: str):
+        """
+        Add a response to the cache, evicting the least recently used entry if
+        the cache is full
+        :param key: cache key to store the response under
+        :param response: response to cache
+        """
+        with self._lock:
+            self._entries[key] = (monotonic(), response)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self._max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def get_stats(self) -> dict:
+        """
+        Get a snapshot of cache statistics
+        :returns: dict cache size and hit/miss counts
+        """
+        with self._lock:
+            return {"size": len(self._entries),
+                    "max_size": self._max_size,
+                    "hits": self.hits,
+                    "misses": self.misses,
+                    "evictions": self.evictions}
+
+
+class _Call:
+    """
+    An in-progress call shared by `SingleFlight` callers
+    """
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls with the same key. Only the first caller
+    executes the call; callers that arrive while it is in progress wait for
+    and share its result or exception.
+    """
+    def __init__(self):
+        self._lock = Lock()
+        self._calls: Dict[Hashable, _Call] = dict()
+        self.calls = 0
+        self.coalesced = 0
+
+    def do(self, key: Hashable, func: Callable[[], Any]) -> Any:
+        """
+        Call `func`, or wait for an in-progress call with the same key
+        :param key: key identifying identical calls
+        :param func: callable to execute
+        :returns: result of `func`
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.calls += 1
+            else:
+                self.coalesced += 1
+        if not leader:
+            call.done.wait()
+            if call.error:
+                raise call.error
+            return call.result
+        try:
+            call.result = func()
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key)
+            call.done.set()
+
+    def get_stats(self) -> dict:
+        """
+        Get a snapshot of call statistics
+        :returns: dict executed, coalesced, and in-progress call counts
+        """
+        with self._lock:
+            return {"calls": self.calls,
+                    "coalesced": self.coalesced,
+                    "in_flight": len(self._calls)}
@@ -0,0 +1,356 @@
+# NEON AI (TM) SOFTWARE, Software Development Kit & Application Framework
+# All trademark and other rights reserved by their respective owners
+# Copyright 2008-2025 Neongecko.com Inc.
+# Contributors: Daniel McKnight, Guy Daniels, Elon Gasper, Richard Leeds,
+# Regina Bloomstine, Casimiro Ferreira, Andrii Pernatii, Kirill Hrymailo
+# BSD-3 License
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+# 3. Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived from this
+#    software without specific prior written permission.
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO,
+# THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+# CONTRIBUTORS  BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA,
+# OR PROFITS;  OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+# LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+# NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE,  EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import asyncio
+import json
+import ssl
+
+from os import remove
+from os.path import isfile
+from threading import Thread
+from time import monotonic, time
+from typing import Callable, List, Optional, Tuple
+from urllib.parse import urlparse
+
+from ovos_utils.log import LOG
+
+_Connection = Tuple[asyncio.StreamReader, asyncio.StreamWriter]
+
+
+EXPIRED_TOKEN_STATUS = (401, 403)
+
+
+def get_hana_auth_headers(server_url: str, refresh: bool = False) -> dict:
+    """
+    Get auth headers for requests to a HANA server. Tokens are managed by
+    `neon_utils.hana_utils` so they are shared with its `request_backend`.
+    This may make blocking requests to the server.
+    :param server_url: base URL of the HANA server
+    :param refresh: if True, get a new token even if the current one has not
+        expired, i.e. after the server rejected it
+    :returns: dict request headers
+    """
+    # TODO: hana_utils does not expose auth headers publicly
+    from neon_utils import hana_utils
+    hana_utils._init_client(server_url)
+    if refresh or \
+            hana_utils._client_config.get("expiration", 0) - time() < 30:
+        try:
+            hana_utils._refresh_token(server_url)
+        except hana_utils.ServerException as e:
+            LOG.error(e)
+            hana_utils._get_token(server_url)
+            # `_get_token` does not update the headers
+            hana_utils._headers = {
+                "Authorization":
+                    f"Bearer {hana_utils._client_config['access_token']}"}
+    return dict(hana_utils._headers)
+
+
+def clear_hana_auth(server_url: str, status: int):
+    """
+    Discard cached auth after the server rejected a refreshed token, as
+    `neon_utils.hana_utils.request_backend` does, so the next request logs in
+    again rather than reusing it.
+    :param server_url: base URL of the HANA server
+    :param status: HTTP status of the rejected request
+    """
+    from neon_utils import hana_utils
+    hana_utils._client_config = {}
+    hana_utils._headers = {}
+    if status == 403:
+        # Invalid token supplied; remove it from the local cache
+        config_file = hana_utils._get_client_config_path(server_url)
+        if isfile(config_file):
+            LOG.warning(f"Removing invalid token cache: {config_file}")
+            remove(config_file)
+
+
+def request_backend(endpoint: str, request_data: dict, server_url: str,
+                    timeout: float) -> dict:
+    """
+    Make a request to a HANA server. Unlike
+    `neon_utils.hana_utils.request_backend`, this applies `timeout` to the
+    connection and to reading the response, so a stalled server does not
+    block the calling thread indefinitely. An expired token is refreshed and
+    the request retried once; if the retry is also rejected, cached auth is
+    cleared.
+    :param endpoint: server endpoint to query
+    :param request_data: dict data to send in the request body
+    :param server_url: base URL of the HANA server
+    :param timeout: seconds to wait for a response
+    :returns: dict response
+    """
+    import requests
+    from neon_utils.hana_utils import ServerException
+    deadline = monotonic() + timeout
+    url = f"{server_url.rstrip('/')}/{endpoint.lstrip('/')}"
+    resp = requests.post(url, json=request_data, timeout=timeout,
+                         headers=get_hana_auth_headers(server_url))
+    if resp.status_code in EXPIRED_TOKEN_STATUS:
+        LOG.warning(f"Token rejected ({resp.status_code}); refreshing")
+        headers = get_hana_auth_headers(server_url, refresh=True)
+        remaining = deadline - monotonic()
+        if remaining <= 0:
+            raise TimeoutError(f"No time left to retry {endpoint}")
+        resp = requests.post(url, json=request_data, headers=headers,
+                             timeout=remaining)
+        if resp.status_code in EXPIRED_TOKEN_STATUS:
+            clear_hana_auth(server_url, resp.status_code)
+    if not resp.ok:
+        raise ServerException(f"Error response {resp.status_code}: "
+                              f"{resp.text}")
+    return resp.json()
+
+
+class _ConnectionPool:
+    """
+    Bounded pool of keep-alive connections to a single host
+    """
+    def __init__(self, host: str, port: int, use_ssl: bool,
+                 max_connections: int):
+        self._host = host
+        self._port = port
+        self._ssl = ssl.create_default_context() if use_ssl else None
+        self._available = asyncio.Semaphore(max_connections)
+        self._idle: List[_Connection] = list()
+        self.opened = 0
+
+    async def acquire(self) -> Tuple[_Connection, bool]:
+        """
+        Get a connection, waiting if all connections are in use
+        :returns: connection, True if the connection was reused
+        """
+        await self._available.acquire()
+        while self._idle:
+            reader, writer = self._idle.pop()
+            if not writer.is_closing() and not reader.at_eof():
+                return (reader, writer), True
+            writer.close()
+        try:
+            connection = await asyncio.open_connection(self._host, self._port,
+                                                       ssl=self._ssl)
+        except BaseException:
+            # Includes cancellation when the request times out while connecting
+            self._available.release()
+            raise
+        self.opened += 1
+        return connection, False
+
+    def release(self, connection: _Connection, reuse: bool):
+        """
+        Return a connection to the pool
+        :param connection: connection returned by `acquire`
+        :param reuse: if False, the connection is closed
+        """
+        if reuse:
+            self._idle.append(connection)
+        else:
+            connection[1].close()
+        self._available.release()
+
+    def close(self):
+        """
+        Close all idle connections
+        """
+        while self._idle:
+            self._idle.pop()[1].close()
+
+
+class AsyncLLMClient:
+    """
+    HTTP client for the LLM backend endpoints. All requests run on a single
+    event loop owned by the client and share a bounded pool of keep-alive
+    connections, so concurrent requests do not each need a thread.
+    """
+    def __init__(self, server_url: str, max_connections: int = 8,
+                 timeout: float = 60,
+                 get_headers: Optional[Callable[..., dict]] = None):
+        """
+        :param server_url: base URL of the backend server
+        :param max_connections: max number of open connections to the server
+        :param timeout: default seconds to wait for a response
+        :param get_headers: callable returning extra request headers, i.e.
+            auth. It is called with `refresh=True` after the server rejects a
+            token and may block, so it is never called on the event loop.
+        """
+        url = urlparse(server_url)
+        self._use_ssl = url.scheme == "https"
+        self._host = url.hostname
+        self._port = url.port or (443 if self._use_ssl else 80)
+        self._base_path = url.path.rstrip('/')
+        self._max_connections = max_connections
+        self._timeout = timeout
+        self._get_headers = get_headers or (lambda refresh=False: {})
+        self._loop = asyncio.new_event_loop()
+        self._pool: Optional[_ConnectionPool] = None
+        self._thread = Thread(target=self._loop.run_forever, daemon=True,
+                              name="llm_client")
+        self._thread.start()
+
+    @property
+    def connections_opened(self) -> int:
+        """
+        Total number of connections opened to the server
+        """
+        return self._pool.opened if self._pool else 0
+
+    async def request(self, endpoint: str, data: dict,
+                      timeout: Optional[float] = None,
+                      headers: Optional[dict] = None) -> dict:
+        """
+        Make a JSON POST request to the backend. If the server rejects the
+        auth token, headers are refreshed and the request retried once.
+        :param endpoint: server endpoint to query
+        :param data: dict data to send in the request body
+        :param timeout: seconds to wait for a response, else default timeout
+        :param headers: extra request headers; if None, they are resolved in
+            the loop's default executor
+        :returns: dict response
+        """
+        if not self._pool:
+            self._pool = _ConnectionPool(self._host, self._port,
+                                         self._use_ssl, self._max_connections)
+        return await asyncio.wait_for(self._request(endpoint, data, headers),
+                                      timeout or self._timeout)
+
+    def request_sync(self, endpoint: str, data: dict,
+                     timeout: Optional[float] = None) -> dict:
+        """
+        Make a request from a thread outside the client's event loop. Headers
+        are resolved on the calling thread.
+        :param endpoint: server endpoint to query
+        :param data: dict data to send in the request body
+        :param timeout: seconds to wait for a response, else default timeout
+        :returns: dict response
+        """
+        future = asyncio.run_coroutine_threadsafe(
+            self.request(endpoint, data, timeout, self._get_headers()),
+            self._loop)
+        return future.result()
+
+    def shutdown(self):
+        """
+        Close pooled connections and stop the event loop
+        """
+        if self._pool:
+            self._loop.call_soon_threadsafe(self._pool.close)
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(5)
+
+    async def _request(self, endpoint: str, data: dict,
+                       headers: Optional[dict]) -> dict:
+        loop = asyncio.get_running_loop()
+        if headers is None:
+            headers = await loop.run_in_executor(None, self._get_headers)
+        status, resp_body = await self._post(endpoint, data, headers)
+        if status in EXPIRED_TOKEN_STATUS:
+            LOG.warning(f"Token rejected ({status}); refreshing")
+            headers = await loop.run_in_executor(
+                None, lambda: self._get_headers(refresh=True))
+            status, resp_body = await self._post(endpoint, data, headers)
+        if not 200 <= status < 300:
+            from neon_utils.hana_utils import ServerException
+            raise ServerException(f"Error response {status}: "
+                                  f"{resp_body.decode(errors='replace')}")
+        return json.loads(resp_body)
+
+    async def _post(self, endpoint: str, data: dict,
+                    extra_headers: dict) -> Tuple[int, bytes]:
+        body = json.dumps(data).encode()
+        path = f"{self._base_path}/{endpoint.lstrip('/')}"
+        headers = {"Host": self._host,
+                   "Content-Type": "application/json",
+                   "Content-Length": str(len(body)),
+                   "Connection": "keep-alive",
+                   **extra_headers}
+        request = f"POST {path} HTTP/1.1\r\n" + \
+            "".join(f"{k}: {v}\r\n" for k, v in headers.items()) + "\r\n"
+        request = request.encode() + body
+
+        connection, reused = await self._pool.acquire()
+        keep_alive = False
+        try:
+            try:
+                status, keep_alive, resp_body = \
+                    await self._send(connection, request)
+            except (ConnectionError, asyncio.IncompleteReadError):
+                if not reused:
+                    raise
+                # The server closed an idle connection; retry on a new one
+                LOG.debug("Pooled connection closed; reconnecting")
+                connection[1].close()
+                connection = await asyncio.open_connection(
+                    self._host, self._port,
+                    ssl=ssl.create_default_context() if self._use_ssl
+                    else None)
+                self._pool.opened += 1
+                status, keep_alive, resp_body = \
+                    await self._send(connection, request)
+        finally:
+            self._pool.release(connection, keep_alive)
+        return status, resp_body
+
+    @staticmethod
+    async def _send(connection: _Connection,
+                    request: bytes) -> Tuple[int, bool, bytes]:
+        """
+        Send an HTTP request and read the full response
+        :returns: status code, True if the connection may be reused, body
+        """
+        reader, writer = connection
+        writer.write(request)
+        await writer.drain()
+        status_line = await reader.readuntil(b"\r\n")
+        version, status = status_line.decode().split(' ', 2)[:2]
+        headers = dict()
+        while True:
+            line = await reader.readuntil(b"\r\n")
+            if line == b"\r\n":
+                break
+            key, value = line.decode().split(':', 1)
+            headers[key.strip().lower()] = value.strip()
+        if headers.get("transfer-encoding", "").lower() == "chunked":
+            body = b""
+            while True:
+                size = int((await reader.readuntil(b"\r\n")).split(b';')[0],
+                           16)
+                if not size:
+                    await reader.readuntil(b"\r\n")
+                    break
+                body += await reader.readexactly(size)
+                await reader.readexactly(2)
+        elif "content-length" in headers:
+            body = await reader.readexactly(int(headers["content-length"]))
+        else:
+            body = await reader.read()
+            return int(status), False, body
+        connection_header = headers.get("connection", "").lower()
+        keep_alive = connection_header != "close" and \
+            (version != "HTTP/1.0" or connection_header == "keep-alive")
+        return int(status), keep_alive, body
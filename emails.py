@@ -0,0 +1,197 @@
+# NEON AI (TM) SOFTWARE, Software Development Kit & Application Framework
+# All trademark and other rights reserved by their respective owners
+# Copyright 2008-2025 Neongecko.com Inc.
+# Contributors: Daniel McKnight, Guy Daniels, Elon Gasper, Richard Leeds,
+# Regina Bloomstine, Casimiro Ferreira, Andrii Pernatii, Kirill Hrymailo
+# BSD-3 License
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+# 3. Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived from this
+#    software without specific prior written permission.
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO,
+# THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+# CONTRIBUTORS  BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA,
+# OR PROFITS;  OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+# LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+# NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE,  EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+from collections import OrderedDict
+from threading import Condition, Thread
+from time import monotonic
+from typing import Callable, Hashable, List, Optional, Tuple
+
+from ovos_utils.log import LOG
+
+
+class _EmailJob:
+    """
+    A queued email and its delivery attempts
+    """
+    __slots__ = ("build", "request", "attempts", "not_before")
+
+    def __init__(self, build: Callable[[], dict]):
+        self.build = build
+        self.request: Optional[dict] = None
+        self.attempts = 0
+        self.not_before = 0.0
+
+
+class EmailQueue:
+    """
+    Sends emails from a background thread so callers never wait on the email
+    service. All emails that are ready when the sender wakes are sent as one
+    batch. Queuing an email with the same key as one still waiting replaces
+    it, so repeated requests for the same transcript send only the latest.
+    Failed sends are retried with exponential backoff.
+    """
+    def __init__(self, send: Callable[[dict], bool], max_retries: int = 3,
+                 retry_seconds: float = 10, max_queued: int = 100):
+        """
+        :param send: function to send an email request, returning True if it
+            was accepted
+        :param max_retries: max number of retries after a failed send
+        :param retry_seconds: seconds to wait before the first retry; this
+            doubles after each further failure
+        :param max_queued: max number of emails waiting to be sent
+        """
+        self._send = send
+        self._max_retries = max_retries
+        self._retry_seconds = retry_seconds
+        self._max_queued = max_queued
+        self._cond = Condition()
+        # Emails waiting to be sent or retried, in order queued
+        self._pending: "OrderedDict[Hashable, _EmailJob]" = OrderedDict()
+        self._in_flight = 0
+        self._stopped = False
+        self.batches = 0
+        self.sent = 0
+        self.failed = 0
+        self.retries = 0
+        self.replaced = 0
+        self.rejected = 0
+        self._thread = Thread(target=self._run, daemon=True,
+                              name="llm_email_sender")
+        self._thread.start()
+
+    def submit(self, key: Hashable, build: Callable[[], dict]) -> bool:
+        """
+        Queue an email to be sent
+        :param key: identifies emails that supersede each other
+        :param build: function returning the email request to send. This is
+            called from the sender thread before the first attempt.
+        :returns: True if the email was queued
+        """
+        with self._cond:
+            if self._stopped:
+                return False
+            if key in self._pending:
+                self.replaced += 1
+            elif len(self._pending) >= self._max_queued:
+                self.rejected += 1
+                return False
+            self._pending[key] = _EmailJob(build)
+            self._cond.notify()
+        return True
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """
+        Wait for all queued emails to be sent or to fail
+        :param timeout: max seconds to wait
+        :returns: True if the queue is empty
+        """
+        with self._cond:
+            return self._cond.wait_for(
+                lambda: not self._pending and not self._in_flight, timeout)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                batch = self._next_batch()
+                while not batch and not self._stopped:
+                    self._cond.wait(self._seconds_until_retry())
+                    batch = self._next_batch()
+                if self._stopped:
+                    return
+                self._in_flight = len(batch)
+                self.batches += 1
+            for key, job in batch:
+                self._attempt(key, job)
+            with self._cond:
+                self._in_flight = 0
+                self._cond.notify_all()
+
+    def _next_batch(self) -> List[Tuple[Hashable, _EmailJob]]:
+        now = monotonic()
+        batch = [(key, job) for key, job in self._pending.items()
+                 if job.not_before <= now]
+        for key, _ in batch:
+            del self._pending[key]
+        return batch
+
+    def _seconds_until_retry(self) -> Optional[float]:
+        if not self._pending:
+            return None
+        return max(min(job.not_before for job in self._pending.values()) -
+                   monotonic(), 0)
+
+    def _attempt(self, key: Hashable, job: _EmailJob):
+        try:
+            if job.request is None:
+                job.request = job.build()
+            if self._send(job.request):
+                self.sent += 1
+                return
+            error = "request was not accepted"
+        except Exception as e:
+            error = repr(e)
+        job.attempts += 1
+        if job.attempts > self._max_retries:
+            LOG.error(f"Failed to send email: {error}")
+            self.failed += 1
+            return
+        LOG.warning(f"Retrying email after error: {error}")
+        job.not_before = monotonic() + \
+            self._retry_seconds * 2 ** (job.attempts - 1)
+        with self._cond:
+            # An email queued with this key since is newer; drop this one
+            if key not in self._pending:
+                self._pending[key] = job
+                self.retries += 1
+
+    def get_stats(self) -> dict:
+        """
+        Get email delivery stats
+        :returns: dict of queue size and delivery counts
+        """
+        with self._cond:
+            return {"queued": len(self._pending),
+                    "batches": self.batches,
+                    "sent": self.sent,
+                    "failed": self.failed,
+                    "retries": self.retries,
+                    "replaced": self.replaced,
+                    "rejected": self.rejected}
+
+    def shutdown(self, timeout: Optional[float] = None):
+        """
+        Stop sending emails. Emails that have not been sent are dropped.
+        :param timeout: max seconds to wait for an in-progress batch
+        """
+        with self._cond:
+            self._stopped = True
+            if self._pending:
+                LOG.warning(f"Dropping {len(self._pending)} unsent emails")
+            self._pending.clear()
+            self._cond.notify_all()
+        self._thread.join(timeout)
@@ -0,0 +1,87 @@
+# NEON AI (TM) SOFTWARE, Software Development Kit & Application Framework
+# All trademark and other rights reserved by their respective owners
+# Copyright 2008-2025 Neongecko.com Inc.
+# Contributors: Daniel McKnight, Guy Daniels, Elon Gasper, Richard Leeds,
+# Regina Bloomstine, Casimiro Ferreira, Andrii Pernatii, Kirill Hrymailo
+# BSD-3 License
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+# 3. Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived from this
+#    software without specific prior written permission.
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO,
+# THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+# CONTRIBUTORS  BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA,
+# OR PROFITS;  OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+# LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+# NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE,  EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+from collections import OrderedDict
+from threading import Lock
+from time import time
+from typing import Hashable, List, Optional
+
+
+class SessionExpiry:
+    """
+    Tracks the last activity time of sessions that expire after a common
+    timeout. Sessions are kept in order of last activity, so refreshing a
+    session is O(1) and expired sessions are always at the front.
+    """
+    def __init__(self):
+        self._lock = Lock()
+        self._sessions = OrderedDict()
+
+    def touch(self, key: Hashable, timestamp: Optional[float] = None):
+        """
+        Add or refresh a session
+        :param key: session to refresh
+        :param timestamp: time of the latest activity, else now. This must
+            not be earlier than timestamps passed in previous calls
+        """
+        with self._lock:
+            self._sessions[key] = timestamp or time()
+            self._sessions.move_to_end(key)
+
+    def remove(self, key: Hashable):
+        """
+        Stop tracking a session
+        :param key: session to remove
+        """
+        with self._lock:
+            self._sessions.pop(key, None)
+
+    def pop_expired(self, timeout: float,
+                    now: Optional[float] = None) -> List[Hashable]:
+        """
+        Remove and return all sessions with no activity in `timeout` seconds
+        :param timeout: seconds of inactivity after which a session expires
+        :param now: current time, else `time.time()`
+        :returns: list of expired sessions, least recently active first
+        """
+        now = now or time()
+        expired = list()
+        with self._lock:
+            while self._sessions:
+                key, timestamp = next(iter(self._sessions.items()))
+                if now - timestamp <= timeout:
+                    break
+                self._sessions.popitem(last=False)
+                expired.append(key)
+        return expired
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._sessions
+
+    def __len__(self) -> int:
+        return len(self._sessions)
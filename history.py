@@ -0,0 +1,665 @@
+# NEON AI (TM) SOFTWARE, Software Development Kit & Application Framework
+# All trademark and other rights reserved by their respective owners
+# Copyright 2008-2025 Neongecko.com Inc.
+# Contributors: Daniel McKnight, Guy Daniels, Elon Gasper, Richard Leeds,
+# Regina Bloomstine, Casimiro Ferreira, Andrii Pernatii, Kirill Hrymailo
+# BSD-3 License
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+# 3. Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived from this
+#    software without specific prior written permission.
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO,
+# THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+# CONTRIBUTORS  BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA,
+# OR PROFITS;  OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+# LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+# NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE,  EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import sqlite3
+import sys
+
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from collections.abc import MutableMapping
+from threading import Lock, RLock
+from time import monotonic, time
+from typing import Callable, Iterable, Iterator, List, Optional, Tuple, \
+    Union
+
+
+class Turn:
+    """
+    A single chat history entry. Speaker and LLM names are interned so each
+    distinct name is stored once. For compatibility with (speaker, text)
+    tuples, a Turn may be indexed, unpacked, and compared to tuples.
+    """
+    __slots__ = ("speaker", "text", "llm", "timestamp")
+
+    def __init__(self, speaker: str, text: str, llm: Optional[str] = None,
+                 timestamp: Optional[float] = None):
+        """
+        :param speaker: username, or "llm" for an LLM response
+        :param text: text of the entry
+        :param llm: name of the LLM that generated a response
+        :param timestamp: epoch time of the entry, else now
+        """
+        self.speaker = sys.intern(speaker)
+        self.text = text
+        self.llm = sys.intern(llm) if llm else None
+        self.timestamp = timestamp or time()
+
+    @property
+    def size(self) -> int:
+        """
+        Approximate bytes of memory used by this entry, including its text and
+        timestamp but excluding interned names
+        """
+        return _TURN_SIZE + sys.getsizeof(self.text)
+
+    def __len__(self) -> int:
+        return 2
+
+    def __iter__(self) -> Iterator[str]:
+        yield self.speaker
+        yield self.text
+
+    def __getitem__(self, idx: int) -> str:
+        return (self.speaker, self.text)[idx]
+
+    def __eq__(self, other) -> bool:
+        if isinstance(other, Turn):
+            return self.speaker == other.speaker and \
+                self.text == other.text and self.llm == other.llm
+        if isinstance(other, tuple):
+            return (self.speaker, self.text) == other
+        return NotImplemented
+
+    def __hash__(self) -> int:
+        return hash((self.speaker, self.text))
+
+    def __repr__(self) -> str:
+        return f"Turn({self.speaker!r}, {self.text!r}, llm={self.llm!r})"
+
+
+# Each Turn holds its own timestamp float
+_TURN_SIZE = sys.getsizeof(Turn("", "")) + sys.getsizeof(0.0)
+
+HistoryEntry = Union[Turn, Tuple[str, str]]
+
+# Number of locks shared by users for history store I/O
+_USER_LOCKS = 64
+
+
+def to_turn(entry: HistoryEntry) -> Turn:
+    """
+    Get a history entry as a Turn
+    :param entry: Turn or (speaker, text) tuple
+    :returns: Turn for `entry`
+    """
+    return entry if isinstance(entry, Turn) else Turn(*entry)
+
+
+def to_payload(history: Iterable[HistoryEntry]) -> List[Tuple[str, str]]:
+    """
+    Get history in the format sent to the LLM backend. This builds a new list
+    of tuples for each request; it is not counted in `ChatHistory.size`.
+    :param history: history entries, oldest first
+    :returns: list of (speaker, text) tuples
+    """
+    return [(entry[0], entry[1]) for entry in history]
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Get an approximate token count for a string of text. This uses the common
+    estimate of ~4 characters per token and is intended for budgeting only.
+    :param text: string to estimate a token count for
+    :returns: approximate number of tokens in `text`
+    """
+    return len(text) // 4 + 1
+
+
+def get_context_window(history: List[HistoryEntry], max_turns: int = 0,
+                       max_tokens: int = 0) -> Tuple[List[HistoryEntry], int]:
+    """
+    Get the most recent portion of a chat history to send with an LLM request.
+    Oldest entries are dropped first; the returned window always starts on a
+    user query so query/response pairs are never split.
+    :param history: list of (speaker, text) history entries, oldest first
+    :param max_turns: max number of query/response exchanges (0 for no limit)
+    :param max_tokens: approximate max number of tokens (0 for no limit)
+    :returns: tuple history window, number of entries trimmed from history
+    """
+    start = 0
+    if max_turns and len(history) > 2 * max_turns:
+        start = len(history) - 2 * max_turns
+    if max_tokens:
+        budget = max_tokens
+        idx = len(history)
+        while idx > start:
+            budget -= estimate_tokens(history[idx - 1][1])
+            if budget < 0:
+                break
+            idx -= 1
+        start = idx
+    if (len(history) - start) % 2:
+        # Don't send an LLM response without the query it answered
+        start += 1
+    return history[start:], start
+
+
+class HistoryStore(ABC):
+    """
+    Persistent storage for chat history entries
+    """
+    @abstractmethod
+    def load(self, user: str, limit: Optional[int] = None) -> List[Turn]:
+        """
+        Load a user's history
+        :param user: user to load history for
+        :param limit: max number of most recent entries to load
+        :returns: list of entries, oldest first
+        """
+
+    @abstractmethod
+    def append(self, user: str,
+               entries: List[Turn]) -> Optional[Tuple[int, int]]:
+        """
+        Add entries to the end of a user's history. Entries are added
+        atomically; no other writer may add entries in between them.
+        :param user: user to add history for
+        :param entries: list of entries to add
+        :returns: `version` of the user's history before and after adding
+            entries, if supported by this store
+        """
+
+    @abstractmethod
+    def delete(self, user: str):
+        """
+        Remove all history for a user
+        :param user: user to remove history for
+        """
+
+    @abstractmethod
+    def users(self) -> List[str]:
+        """
+        Get all users with stored history
+        :returns: list of usernames
+        """
+
+    def count(self, user: str) -> int:
+        """
+        Get the number of entries in a user's history
+        :param user: user to count history entries for
+        :returns: number of stored entries
+        """
+        return len(self.load(user))
+
+    def version(self, user: str) -> int:
+        """
+        Get a value that changes whenever a user's history is modified. This
+        is required for stores shared by multiple processes.
+        :param user: user to get the history version for
+        :returns: history version, 0 if the user has no history
+        """
+        raise NotImplementedError(f"{type(self).__name__} does not support "
+                                  f"versioning")
+
+    def has_user(self, user: str) -> bool:
+        """
+        Check if a user has any stored history
+        :param user: user to check
+        :returns: True if `user` has history
+        """
+        return bool(self.load(user, 1))
+
+    def close(self):
+        """
+        Release any resources held by the store
+        """
+
+
+class SQLiteHistoryStore(HistoryStore):
+    """
+    Append-only history store backed by an SQLite database. The database may
+    be shared by multiple processes on the same host.
+    """
+    def __init__(self, path: str):
+        """
+        :param path: path to the database file
+        """
+        self._lock = Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._db:
+            self._db.execute("PRAGMA journal_mode=WAL")
+            # With WAL, commits are still atomic and durable across a process
+            # crash; only a power loss may lose the latest commits
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.execute("CREATE TABLE IF NOT EXISTS history ("
+                             "id INTEGER PRIMARY KEY AUTOINCREMENT, "
+                             "user TEXT NOT NULL, speaker TEXT NOT NULL, "
+                             "text TEXT NOT NULL, llm TEXT, timestamp REAL)")
+            self._db.execute("CREATE INDEX IF NOT EXISTS history_user "
+                             "ON history (user, id)")
+            # Databases created by older versions lack these columns
+            columns = {row[1] for row in
+                       self._db.execute("PRAGMA table_info(history)")}
+            for column, column_type in (("llm", "TEXT"),
+                                        ("timestamp", "REAL")):
+                if column not in columns:
+                    self._db.execute(f"ALTER TABLE history ADD COLUMN "
+                                     f"{column} {column_type}")
+
+    def load(self, user: str, limit: Optional[int] = None) -> List[Turn]:
+        with self._lock:
+            if limit is None:
+                rows = self._db.execute(
+                    "SELECT speaker, text, llm, timestamp FROM history "
+                    "WHERE user = ? ORDER BY id", (user,)).fetchall()
+            else:
+                rows = self._db.execute(
+                    "SELECT speaker, text, llm, timestamp FROM history "
+                    "WHERE user = ? ORDER BY id DESC LIMIT ?",
+                    (user, limit)).fetchall()
+                rows.reverse()
+        return [Turn(*row) for row in rows]
+
+    def append(self, user: str, entries: List[Turn]) -> Tuple[int, int]:
+        with self._lock, self._db:
+            # Take the write lock before reading so no other process can add
+            # entries between the two versions
+            self._db.execute("BEGIN IMMEDIATE")
+            previous = self._version(user)
+            self._db.executemany(
+                "INSERT INTO history (user, speaker, text, llm, timestamp) "
+                "VALUES (?, ?, ?, ?, ?)",
+                [(user, turn.speaker, turn.text, turn.llm, turn.timestamp)
+                 for turn in entries])
+            return previous, self._version(user)
+
+    def version(self, user: str) -> int:
+        with self._lock:
+            return self._version(user)
+
+    def _version(self, user: str) -> int:
+        # Row IDs are never reused, so the latest ID changes with every write
+        return self._db.execute("SELECT MAX(id) FROM history WHERE user = ?",
+                                (user,)).fetchone()[0] or 0
+
+    def delete(self, user: str):
+        with self._lock, self._db:
+            self._db.execute("DELETE FROM history WHERE user = ?", (user,))
+
+    def count(self, user: str) -> int:
+        with self._lock:
+            return self._db.execute(
+                "SELECT COUNT(*) FROM history WHERE user = ?",
+                (user,)).fetchone()[0]
+
+    def users(self) -> List[str]:
+        with self._lock:
+            return [row[0] for row in self._db.execute(
+                "SELECT DISTINCT user FROM history")]
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+class _UserHistory:
+    """
+    Recent history entries of a user held in memory
+    """
+    __slots__ = ("last_access", "entries", "total", "size", "version")
+
+    def __init__(self, entries: List[Turn], total: int, version: int = 0):
+        self.last_access = monotonic()
+        self.entries = entries
+        self.total = total
+        self.size = sum(turn.size for turn in entries)
+        self.version = version
+
+    def extend(self, turns: List[Turn]) -> int:
+        """
+        Add entries to the end of this history
+        :param turns: entries to add
+        :returns: bytes added
+        """
+        added = sum(turn.size for turn in turns)
+        self.entries.extend(turns)
+        self.total += len(turns)
+        self.size += added
+        return added
+
+    def trim(self, count: int) -> int:
+        """
+        Remove the oldest entries from memory
+        :param count: number of entries to remove
+        :returns: bytes removed
+        """
+        removed = sum(turn.size for turn in self.entries[:count])
+        del self.entries[:count]
+        self.size -= removed
+        return removed
+
+
+class ChatHistory(MutableMapping):
+    """
+    Mapping of usernames to lists of history entries.
+
+    Without a `store`, all history is kept in memory. With a `store`, history
+    is written through to it and only the most recent `max_entries` of
+    recently active users are kept in memory; other users are loaded from the
+    store on first access.
+
+    If `max_bytes` is set, history held in memory for all users is limited to
+    about that size. Least recently active users are removed from memory
+    first; without a `store`, their history is discarded.
+
+    If `shared` is set, the `store` may also be written by other processes.
+    History held in memory is checked against the store's version before it
+    is used and reloaded if another process modified it.
+
+    Store reads and writes for a user are made under a lock shared by only a
+    fraction of users, so requests for other users are not blocked by them.
+    Users found to have no stored history are remembered so repeated lookups
+    do not query the store.
+    """
+    def __init__(self, store: Optional[HistoryStore] = None,
+                 max_users: int = 1000, max_entries: int = 100,
+                 idle_seconds: float = 3600, max_bytes: int = 0,
+                 shared: bool = False,
+                 on_drop: Optional[Callable[[str], None]] = None):
+        """
+        :param store: persistent history store, else keep history in memory
+        :param max_users: max number of users to keep history in memory for
+        :param max_entries: max number of entries to keep in memory per user
+        :param idle_seconds: seconds after which an inactive user's history is
+            removed from memory
+        :param max_bytes: approximate max bytes of history to keep in memory
+            (0 for no limit)
+        :param shared: if True, `store` may be modified by other processes;
+            `store` must implement `version`
+        :param on_drop: called with a username when that user's history is
+            deleted, replaced, or discarded to limit memory use
+        """
+        if shared and not store:
+            raise ValueError("A shared history requires a store")
+        if shared and type(store).version is HistoryStore.version:
+            raise ValueError(f"A shared history requires a versioned store; "
+                             f"{type(store).__name__} is not versioned")
+        self._store = store
+        self._shared = shared
+        self._on_drop = on_drop
+        self._max_users = max_users
+        self._max_entries = max_entries
+        self._idle_seconds = idle_seconds
+        self._max_bytes = max_bytes
+        # Guards in-memory state only; never held during store I/O
+        self._lock = RLock()
+        self._user_locks = [Lock() for _ in range(_USER_LOCKS)]
+        # Users in order of last access
+        self._cache: "OrderedDict[str, _UserHistory]" = OrderedDict()
+        # Users without stored history, in order of last lookup
+        self._missing: "OrderedDict[str, None]" = OrderedDict()
+        self._size = 0
+        self.loads = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.dropped_entries = 0
+
+    def __getitem__(self, user: str) -> List[Turn]:
+        with self._user_lock(user):
+            cached = self._get_cached(user)
+        if cached is None:
+            raise KeyError(user)
+        return cached.entries
+
+    def __setitem__(self, user: str, history: List[HistoryEntry]):
+        turns = [to_turn(entry) for entry in history]
+        total = len(turns)
+        version = 0
+        self._dropped(user)
+        with self._user_lock(user):
+            if self._store:
+                self._store.delete(user)
+                if turns:
+                    versions = self._store.append(user, turns)
+                    version = versions[1] if versions else 0
+                turns = turns[-self._max_entries:]
+            with self._lock:
+                self._missing.pop(user, None)
+                self._cache_history(user, _UserHistory(turns, total, version))
+
+    def __delitem__(self, user: str):
+        with self._user_lock(user):
+            if user not in self:
+                raise KeyError(user)
+            with self._lock:
+                self._uncache(user)
+            if self._store:
+                self._store.delete(user)
+                with self._lock:
+                    self._add_missing(user)
+        self._dropped(user)
+
+    def __contains__(self, user) -> bool:
+        with self._lock:
+            if not self._shared:
+                if user in self._cache:
+                    return True
+                if not self._store or user in self._missing:
+                    return False
+        return self._store.has_user(user)
+
+    def __iter__(self) -> Iterator[str]:
+        with self._lock:
+            users = self._store.users() if self._store else \
+                list(self._cache.keys())
+        return iter(users)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._store.users()) if self._store else \
+                len(self._cache)
+
+    @property
+    def cached_users(self) -> int:
+        """
+        Number of users with history held in memory
+        """
+        return len(self._cache)
+
+    @property
+    def size(self) -> int:
+        """
+        Approximate bytes of history held in memory
+        """
+        return self._size
+
+    def user_size(self, user: str) -> int:
+        """
+        Get the approximate memory used by a user's history
+        :param user: user to get history size for
+        :returns: approximate bytes of the user's history held in memory
+        """
+        with self._lock:
+            cached = self._cache.get(user)
+            return cached.size if cached else 0
+
+    def append(self, user: str, *entries: HistoryEntry):
+        """
+        Add entries to the end of a user's history
+        :param user: user to add history for
+        :param entries: Turns or (speaker, text) entries to add
+        """
+        turns = [to_turn(entry) for entry in entries]
+        with self._user_lock(user):
+            versions = None
+            if self._store:
+                cached = self._get_cached(user)
+                versions = self._store.append(user, turns)
+            with self._lock:
+                if not self._store:
+                    cached = self._cache.get(user)
+                self._missing.pop(user, None)
+                # Another thread may have removed this history from memory
+                # while the store was written; it is cached again below
+                self._uncache(user)
+                if cached is None:
+                    cached = _UserHistory(list(), 0)
+                if self._shared:
+                    if not versions or versions[0] != cached.version:
+                        # Another process added history since it was cached
+                        return
+                    cached.version = versions[1]
+                cached.extend(turns)
+                if self._store and len(cached.entries) > self._max_entries:
+                    cached.trim(len(cached.entries) - self._max_entries)
+                cached.last_access = monotonic()
+                self._cache_history(user, cached)
+
+    def count(self, user: str) -> int:
+        """
+        Get the total number of entries in a user's history, including
+        entries not held in memory
+        :param user: user to count history entries for
+        :returns: number of history entries
+        """
+        with self._user_lock(user):
+            cached = self._get_cached(user)
+        return cached.total if cached else 0
+
+    def get_full(self, user: str) -> List[Turn]:
+        """
+        Get a user's complete history, including entries not held in memory
+        :param user: user to get history for
+        :returns: list of entries, oldest first
+        """
+        if self._store:
+            return self._store.load(user)
+        with self._lock:
+            cached = self._cache.get(user)
+            return list(cached.entries) if cached else []
+
+    def evict_idle(self):
+        """
+        Remove history from memory for users that have been inactive for
+        longer than `idle_seconds` or are in excess of `max_users`. This has
+        no effect if history is not persisted to a store.
+        """
+        if not self._store:
+            return
+        with self._lock:
+            now = monotonic()
+            while self._cache:
+                user, cached = next(iter(self._cache.items()))
+                if len(self._cache) <= self._max_users and \
+                        now - cached.last_access < self._idle_seconds:
+                    break
+                self._uncache(user)
+                self.evictions += 1
+
+    def close(self):
+        """
+        Close the underlying history store
+        """
+        if self._store:
+            self._store.close()
+
+    def _enforce_max_bytes(self):
+        """
+        Remove history from memory, least recently active users first, until
+        memory use is within `max_bytes`. The most recent exchange of the
+        most recently active user is always kept.
+        """
+        if not self._max_bytes:
+            return
+        while self._size > self._max_bytes and self._cache:
+            user, cached = next(iter(self._cache.items()))
+            if len(self._cache) > 1:
+                self._uncache(user)
+                if not self._store:
+                    self.dropped_entries += len(cached.entries)
+                    self._dropped(user)
+                self.evictions += 1
+                continue
+            if len(cached.entries) <= 2:
+                break
+            if not self._store:
+                self.dropped_entries += 2
+            self._size -= cached.trim(2)
+
+    def _user_lock(self, user: str) -> Lock:
+        return self._user_locks[hash(user) % _USER_LOCKS]
+
+    def _get_cached(self, user: str) -> Optional[_UserHistory]:
+        # Must be called with the user's lock held
+        with self._lock:
+            cached = self._cache.get(user)
+            if cached is None and not self._shared and \
+                    (not self._store or user in self._missing):
+                return None
+        version = 0
+        if cached is not None and self._shared:
+            version = self._store.version(user)
+            if version != cached.version:
+                with self._lock:
+                    self._uncache(user)
+                    self.invalidations += 1
+                cached = None
+        if cached is None:
+            if self._shared and not version:
+                # Get the version first so a concurrent write is detected on
+                # next access rather than missed
+                version = self._store.version(user)
+            entries = self._store.load(user, self._max_entries)
+            if not entries:
+                if not self._shared:
+                    with self._lock:
+                        self._add_missing(user)
+                return None
+            cached = _UserHistory(entries, self._store.count(user), version)
+            with self._lock:
+                self.loads += 1
+        with self._lock:
+            cached.last_access = monotonic()
+            self._cache_history(user, cached)
+        return cached
+
+    def _add_missing(self, user: str):
+        self._missing[user] = None
+        self._missing.move_to_end(user)
+        while len(self._missing) > self._max_users:
+            self._missing.popitem(last=False)
+
+    def _cache_history(self, user: str, cached: _UserHistory):
+        previous = self._cache.get(user)
+        if previous is not cached:
+            if previous:
+                self._size -= previous.size
+            self._size += cached.size
+        self._cache[user] = cached
+        self._cache.move_to_end(user)
+        self.evict_idle()
+        self._enforce_max_bytes()
+
+    def _dropped(self, user: str):
+        if self._on_drop:
+            self._on_drop(user)
+
+    def _uncache(self, user: str):
+        cached = self._cache.pop(user, None)
+        if cached:
+            self._size -= cached.size
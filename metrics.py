@@ -0,0 +1,150 @@
+# NEON AI (TM) SOFTWARE, Software Development Kit & Application Framework
+# All trademark and other rights reserved by their respective owners
+# Copyright 2008-2025 Neongecko.com Inc.
+# Contributors: Daniel McKnight, Guy Daniels, Elon Gasper, Richard Leeds,
+# Regina Bloomstine, Casimiro Ferreira, Andrii Pernatii, Kirill Hrymailo
+# BSD-3 License
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+# 3. Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived from this
+#    software without specific prior written permission.
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO,
+# THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+# CONTRIBUTORS  BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA,
+# OR PROFITS;  OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+# LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+# NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE,  EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+from bisect import bisect_left
+from contextlib import contextmanager
+from threading import Lock
+from time import monotonic
+from typing import Dict, List
+
+
+def _get_bucket_bounds(minimum: float = 0.001, maximum: float = 300,
+                       factor: float = 1.2) -> List[float]:
+    bounds = [minimum]
+    while bounds[-1] < maximum:
+        bounds.append(bounds[-1] * factor)
+    return bounds
+
+
+_BUCKET_BOUNDS = _get_bucket_bounds()
+
+
+class LatencyHistogram:
+    """
+    Histogram of durations in log-scaled buckets. Recording is O(log n) in
+    the number of buckets and memory use is constant; percentiles are
+    accurate to within one bucket (~20%).
+    """
+    def __init__(self):
+        self._lock = Lock()
+        self._counts = [0] * (len(_BUCKET_BOUNDS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, seconds: float):
+        """
+        Add a duration to the histogram
+        :param seconds: duration to record
+        """
+        idx = bisect_left(_BUCKET_BOUNDS, seconds)
+        with self._lock:
+            self._counts[idx] += 1
+            self.count += 1
+            self.total += seconds
+            if seconds > self.max:
+                self.max = seconds
+
+    def percentile(self, percent: float) -> float:
+        """
+        Get an approximate percentile of recorded durations
+        :param percent: percentile to get (0-100)
+        :returns: upper bound of the bucket containing the percentile
+        """
+        with self._lock:
+            return self._percentile(percent)
+
+    def snapshot(self) -> dict:
+        """
+        Get summary statistics of recorded durations
+        :returns: dict count, mean, max, and p50/p95/p99 durations in seconds
+        """
+        with self._lock:
+            return {"count": self.count,
+                    "mean": self.total / self.count if self.count else 0.0,
+                    "max": self.max,
+                    "p50": self._percentile(50),
+                    "p95": self._percentile(95),
+                    "p99": self._percentile(99)}
+
+    def _percentile(self, percent: float) -> float:
+        if not self.count:
+            return 0.0
+        target = self.count * percent / 100
+        seen = 0
+        for idx, count in enumerate(self._counts):
+            seen += count
+            if seen >= target and count:
+                if idx == len(_BUCKET_BOUNDS):
+                    return self.max
+                return min(_BUCKET_BOUNDS[idx], self.max)
+        return self.max
+
+
+class LatencyMetrics:
+    """
+    Collection of named latency histograms
+    """
+    def __init__(self):
+        self._lock = Lock()
+        self._histograms: Dict[str, LatencyHistogram] = dict()
+
+    def record(self, name: str, seconds: float):
+        """
+        Record a duration
+        :param name: name of the measured operation
+        :param seconds: duration of the operation
+        """
+        histogram = self._histograms.get(name)
+        if not histogram:
+            with self._lock:
+                histogram = self._histograms.setdefault(name,
+                                                        LatencyHistogram())
+        histogram.record(seconds)
+
+    @contextmanager
+    def span(self, name: str):
+        """
+        Context manager that records the duration of the enclosed block
+        :param name: name of the measured operation
+        """
+        start = monotonic()
+        try:
+            yield
+        finally:
+            self.record(name, monotonic() - start)
+
+    def snapshot(self) -> Dict[str, dict]:
+        """
+        Get summary statistics for all recorded operations
+        :returns: dict of operation name to histogram snapshot
+        """
+        with self._lock:
+            histograms = dict(self._histograms)
+        return {name: histogram.snapshot()
+                for name, histogram in sorted(histograms.items())}
@@ -0,0 +1,125 @@
+# NEON AI (TM) SOFTWARE, Software Development Kit & Application Framework
+# All trademark and other rights reserved by their respective owners
+# Copyright 2008-2025 Neongecko.com Inc.
+# Contributors: Daniel McKnight, Guy Daniels, Elon Gasper, Richard Leeds,
+# Regina Bloomstine, Casimiro Ferreira, Andrii Pernatii, Kirill Hrymailo
+# BSD-3 License
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+# 3. Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived from this
+#    software without specific prior written permission.
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO,
+# THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+# CONTRIBUTORS  BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA,
+# OR PROFITS;  OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+# LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+# NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE,  EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import unicodedata
+
+from threading import Lock
+from typing import Collection, Dict, Optional
+
+from .cache import normalize_utterance
+
+# Symbols that carry meaning in spoken queries, i.e. arithmetic
+_MEANINGFUL_SYMBOLS = frozenset("+-*/=^%.,?!'")
+# Scripts normally written without spaces between words
+_UNSPACED_SCRIPTS = ("CJK", "HIRAGANA", "KATAKANA", "THAI", "LAO", "KHMER",
+                     "MYANMAR", "TIBETAN")
+
+
+def _is_unspaced(char: str) -> bool:
+    return unicodedata.name(char, "").startswith(_UNSPACED_SCRIPTS)
+
+
+class UtteranceFilter:
+    """
+    Cheap local checks for utterances that are not worth an LLM request,
+    such as empty transcriptions, STT noise, and partial wake words. Counts
+    of utterances rejected by each rule are kept for tuning.
+    """
+    EMPTY = "empty"
+    TOO_SHORT = "too_short"
+    NOISE = "noise"
+    GARBLED = "garbled"
+    REPETITIVE = "repetitive"
+
+    def __init__(self, min_words: int = 1, min_chars: int = 3,
+                 min_alpha_ratio: float = 0.6,
+                 min_unique_ratio: float = 0.4):
+        """
+        :param min_words: min number of words in an utterance. This is not
+            applied to languages written without spaces between words.
+        :param min_chars: min number of letters and numbers in an utterance
+        :param min_alpha_ratio: min fraction of non-space characters that
+            are letters, numbers, or arithmetic and sentence punctuation
+        :param min_unique_ratio: min fraction of distinct words in an
+            utterance of 4 or more words
+        """
+        self._min_words = min_words
+        self._min_chars = min_chars
+        self._min_alpha_ratio = min_alpha_ratio
+        self._min_unique_ratio = min_unique_ratio
+        self._lock = Lock()
+        self.counts: Dict[str, int] = {"passed": 0}
+
+    def check(self, utterance: str, noise: Collection[str] = (),
+              count: bool = True) -> Optional[str]:
+        """
+        Check if an utterance should be sent to an LLM
+        :param utterance: utterance to check
+        :param noise: normalized phrases that are never worth a response
+        :param count: if False, don't include the result in `counts`
+        :returns: name of the rule that rejected the utterance, else None
+        """
+        rule = self._get_rejecting_rule(utterance, noise)
+        if not count:
+            return rule
+        with self._lock:
+            key = rule or "passed"
+            self.counts[key] = self.counts.get(key, 0) + 1
+        return rule
+
+    def _get_rejecting_rule(self, utterance: str,
+                            noise: Collection[str]) -> Optional[str]:
+        characters = "".join(utterance.split())
+        if not characters:
+            return self.EMPTY
+        normalized = normalize_utterance(utterance)
+        if normalized in noise:
+            return self.NOISE
+        if sum(c.isalnum() for c in characters) < self._min_chars:
+            return self.TOO_SHORT
+        words = normalized.split()
+        if len(words) < self._min_words and \
+                not any(_is_unspaced(c) for c in characters):
+            return self.TOO_SHORT
+        if sum(c.isalnum() or c in _MEANINGFUL_SYMBOLS
+               for c in characters) / len(characters) < \
+                self._min_alpha_ratio:
+            return self.GARBLED
+        if len(words) >= 4 and len(set(words)) / len(words) < \
+                self._min_unique_ratio:
+            return self.REPETITIVE
+        return None
+
+    def get_stats(self) -> Dict[str, int]:
+        """
+        Get counts of checked utterances
+        :returns: dict of rule name to number of utterances it rejected, and
+            `passed` to the number of utterances that passed all rules
+        """
+        with self._lock:
+            return dict(self.counts)
@@ -0,0 +1,156 @@
+# NEON AI (TM) SOFTWARE, Software Development Kit & Application Framework
+# All trademark and other rights reserved by their respective owners
+# Copyright 2008-2025 Neongecko.com Inc.
+# Contributors: Daniel McKnight, Guy Daniels, Elon Gasper, Richard Leeds,
+# Regina Bloomstine, Casimiro Ferreira, Andrii Pernatii, Kirill Hrymailo
+# BSD-3 License
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+# 3. Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived from this
+#    software without specific prior written permission.
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO,
+# THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+# CONTRIBUTORS  BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA,
+# OR PROFITS;  OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+# LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+# NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE,  EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+from threading import Lock
+from time import monotonic
+from typing import Dict
+
+
+class TokenBucket:
+    """
+    Allows bursts of up to `capacity` requests, refilled at `rate` requests
+    per second.
+    """
+    __slots__ = ("rate", "capacity", "tokens", "updated", "allowed", "limited")
+
+    def __init__(self, rate: float, capacity: float, now: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = now
+        self.allowed = 0
+        self.limited = 0
+
+    def refill(self, now: float):
+        self.tokens = min(self.capacity,
+                          self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def take(self, now: float) -> bool:
+        self.refill(now)
+        if self.tokens < 1:
+            self.limited += 1
+            return False
+        self.tokens -= 1
+        self.allowed += 1
+        return True
+
+
+class UserRateLimiter:
+    """
+    Limits the rate of requests from each user with a token bucket. Buckets
+    that have refilled completely carry no state and are dropped.
+    """
+    def __init__(self, requests_per_minute: float, burst: int = 5):
+        """
+        :param requests_per_minute: sustained number of requests allowed per
+            user per minute
+        :param burst: max number of requests a user may make at once
+        """
+        self._rate = requests_per_minute / 60
+        self._burst = max(burst, 1)
+        self._lock = Lock()
+        self._buckets: Dict[str, TokenBucket] = dict()
+        self.allowed = 0
+        self.limited = 0
+
+    def allow(self, user: str) -> bool:
+        """
+        Take a token for a request from a user
+        :param user: user making a request
+        :returns: True if the request is allowed, False if it should be shed
+        """
+        now = monotonic()
+        with self._lock:
+            bucket = self._buckets.get(user)
+            if not bucket:
+                bucket = self._buckets[user] = TokenBucket(
+                    self._rate, self._burst, now)
+            if bucket.take(now):
+                self.allowed += 1
+                return True
+            self.limited += 1
+            return False
+
+    def has_capacity(self, user: str) -> bool:
+        """
+        Check if a user could make a request without taking a token
+        :param user: user to check
+        :returns: True if a request from `user` would be allowed
+        """
+        with self._lock:
+            bucket = self._buckets.get(user)
+            if not bucket:
+                return True
+            bucket.refill(monotonic())
+            return bucket.tokens >= 1
+
+    def prune(self) -> int:
+        """
+        Drop buckets that have refilled completely
+        :returns: number of buckets dropped
+        """
+        now = monotonic()
+        with self._lock:
+            full = list()
+            for user, bucket in self._buckets.items():
+                bucket.refill(now)
+                if bucket.tokens >= bucket.capacity:
+                    full.append(user)
+            for user in full:
+                del self._buckets[user]
+        return len(full)
+
+    def get_user_stats(self, user: str) -> dict:
+        """
+        Get a snapshot of a user's rate limit state
+        :param user: user to get stats for
+        :returns: dict available tokens and request counts since the user's
+            bucket was last full
+        """
+        with self._lock:
+            bucket = self._buckets.get(user)
+            if not bucket:
+                return {"tokens": float(self._burst), "allowed": 0,
+                        "limited": 0}
+            bucket.refill(monotonic())
+            return {"tokens": bucket.tokens, "allowed": bucket.allowed,
+                    "limited": bucket.limited}
+
+    def get_stats(self) -> dict:
+        """
+        Get a snapshot of rate limiter statistics
+        :returns: dict request counts and users currently being limited
+        """
+        with self._lock:
+            return {"tracked_users": len(self._buckets),
+                    "allowed": self.allowed,
+                    "limited": self.limited,
+                    "limited_users": sorted(
+                        user for user, bucket in self._buckets.items()
+                        if bucket.tokens < 1)}
@@ -0,0 +1,180 @@
+# NEON AI (TM) SOFTWARE, Software Development Kit & Application Framework
+# All trademark and other rights reserved by their respective owners
+# Copyright 2008-2025 Neongecko.com Inc.
+# Contributors: Daniel McKnight, Guy Daniels, Elon Gasper, Richard Leeds,
+# Regina Bloomstine, Casimiro Ferreira, Andrii Pernatii, Kirill Hrymailo
+# BSD-3 License
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+# 3. Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived from this
+#    software without specific prior written permission.
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO,
+# THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+# CONTRIBUTORS  BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA,
+# OR PROFITS;  OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+# LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+# NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE,  EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import asyncio
+import concurrent.futures
+
+from random import uniform
+from threading import Lock
+from time import monotonic, sleep
+from typing import Callable, TypeVar
+
+from ovos_utils.log import LOG
+
+T = TypeVar("T")
+
+
+class CircuitOpenError(Exception):
+    """Exception raised when a request is rejected by an open circuit"""
+
+
+def is_transient_error(error: Exception) -> bool:
+    """
+    Check if an exception represents a failure that may succeed on retry
+    :param error: exception raised by a backend request
+    :returns: True if the request should be retried
+    """
+    from neon_utils.hana_utils import ServerException
+    if isinstance(error, (TimeoutError, asyncio.TimeoutError,
+                          concurrent.futures.TimeoutError, OSError)):
+        # requests exceptions and ConnectionError are OSError subclasses
+        return True
+    if isinstance(error, ServerException):
+        # Server errors (5xx) are transient; client errors (4xx) are not
+        return str(error).startswith("Error response 5")
+    return False
+
+
+def call_with_retries(func: Callable[[float], T], deadline: float,
+                      retries: int = 2, base_delay: float = 0.5) -> T:
+    """
+    Call a function, retrying transient errors with jittered exponential
+    backoff until `deadline`.
+    :param func: callable accepting the number of seconds left before deadline
+    :param deadline: `time.monotonic` time after which no more attempts start
+    :param retries: max number of retries after the first attempt
+    :param base_delay: max seconds to wait before the first retry
+    :returns: result of `func`
+    """
+    attempt = 0
+    while True:
+        remaining = deadline - monotonic()
+        if remaining <= 0:
+            raise TimeoutError("Request deadline exceeded")
+        try:
+            return func(remaining)
+        except Exception as e:
+            if attempt >= retries or not is_transient_error(e):
+                raise
+            delay = min(uniform(0, base_delay * 2 ** attempt),
+                        deadline - monotonic())
+            if delay <= 0:
+                raise
+            attempt += 1
+            LOG.warning(f"Retrying after {e!r} (attempt {attempt}, "
+                        f"delay={delay:.2f}s)")
+            sleep(delay)
+
+
+class CircuitBreaker:
+    """
+    Tracks consecutive failures of a backend. After `failure_threshold`
+    failures, the circuit opens and requests are rejected for
+    `reset_timeout` seconds; one trial request is then allowed, which closes
+    the circuit on success or re-opens it on failure.
+    """
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half-open"
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30):
+        """
+        :param failure_threshold: consecutive failures that open the circuit
+        :param reset_timeout: seconds to wait before allowing a trial request
+        """
+        self._failure_threshold = failure_threshold
+        self._reset_timeout = reset_timeout
+        self._lock = Lock()
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial_in_progress = False
+        self.rejected = 0
+
+    @property
+    def state(self) -> str:
+        """
+        Current circuit state
+        """
+        with self._lock:
+            return self._get_state()
+
+    @property
+    def is_open(self) -> bool:
+        """
+        True if requests are currently being rejected
+        """
+        with self._lock:
+            state = self._get_state()
+            return state == self.OPEN or \
+                (state == self.HALF_OPEN and self._trial_in_progress)
+
+    def allow_request(self) -> bool:
+        """
+        Check if a request may be made. If the circuit is half-open, the
+        caller is responsible for the trial request and must report its
+        outcome with `record_success` or `record_failure`.
+        :returns: True if the request may proceed
+        """
+        with self._lock:
+            state = self._get_state()
+            if state == self.CLOSED:
+                return True
+            if state == self.HALF_OPEN and not self._trial_in_progress:
+                self._trial_in_progress = True
+                return True
+            self.rejected += 1
+            return False
+
+    def record_success(self):
+        """
+        Report a successful request
+        """
+        with self._lock:
+            self._failures = 0
+            self._trial_in_progress = False
+
+    def record_failure(self):
+        """
+        Report a failed request
+        """
+        with self._lock:
+            self._failures += 1
+            if self._trial_in_progress or \
+                    self._failures >= self._failure_threshold:
+                if self._get_state() != self.OPEN:
+                    LOG.warning(f"Opening circuit after {self._failures} "
+                                f"failures")
+                self._opened_at = monotonic()
+            self._trial_in_progress = False
+
+    def _get_state(self) -> str:
+        if self._failures < self._failure_threshold:
+            return self.CLOSED
+        if monotonic() - self._opened_at < self._reset_timeout:
+            return self.OPEN
+        return self.HALF_OPEN
@@ -0,0 +1,176 @@
+# NEON AI (TM) SOFTWARE, Software Development Kit & Application Framework
+# All trademark and other rights reserved by their respective owners
+# Copyright 2008-2025 Neongecko.com Inc.
+# Contributors: Daniel McKnight, Guy Daniels, Elon Gasper, Richard Leeds,
+# Regina Bloomstine, Casimiro Ferreira, Andrii Pernatii, Kirill Hrymailo
+# BSD-3 License
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+# 3. Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived from this
+#    software without specific prior written permission.
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO,
+# THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+# CONTRIBUTORS  BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA,
+# OR PROFITS;  OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+# LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+# NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE,  EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+from threading import Lock
+from typing import Dict, List, Optional
+
+from .metrics import LatencyHistogram
+
+
+class _EndpointStats:
+    __slots__ = ("latency", "error_rate", "samples", "current", "previous")
+
+    def __init__(self):
+        self.latency = 0.0
+        self.error_rate = 0.0
+        self.samples = 0
+        # Latency percentiles are taken from a recent window of requests
+        self.current = LatencyHistogram()
+        self.previous: Optional[LatencyHistogram] = None
+
+
+class LLMRouter:
+    """
+    Ranks LLM endpoints by their recent latency and error rate. Latency and
+    error rate are exponentially weighted moving averages, so the ranking
+    follows changes in endpoint performance.
+    """
+    def __init__(self, alpha: float = 0.2, max_error_rate: float = 0.5,
+                 explore_every: int = 20, hedge_percentile: float = 95,
+                 min_samples: int = 10, window: int = 200):
+        """
+        :param alpha: weight of each new sample in moving averages (0-1)
+        :param max_error_rate: error rate above which an endpoint is only
+            used if no healthy endpoint is available
+        :param explore_every: reverse the ranking every `explore_every`
+            requests so slower endpoints' stats stay current (0 to disable)
+        :param hedge_percentile: latency percentile after which a request is
+            hedged
+        :param min_samples: min number of successful requests to an endpoint
+            before requests to it are hedged
+        :param window: number of requests in each latency percentile window
+        """
+        self._alpha = alpha
+        self._max_error_rate = max_error_rate
+        self._explore_every = explore_every
+        self._hedge_percentile = hedge_percentile
+        self._min_samples = min_samples
+        self._window = window
+        self._lock = Lock()
+        self._stats: Dict[str, _EndpointStats] = dict()
+        self._routed = 0
+        self.explored = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+        self.hedges_skipped = 0
+
+    def record(self, endpoint: str, latency: float, success: bool):
+        """
+        Record the result of a request to an endpoint
+        :param endpoint: endpoint the request was sent to
+        :param latency: seconds the request took
+        :param success: True if the request succeeded
+        """
+        with self._lock:
+            stats = self._stats.setdefault(endpoint, _EndpointStats())
+            error = 0.0 if success else 1.0
+            stats.error_rate += self._alpha * (error - stats.error_rate)
+            if not success:
+                return
+            stats.latency = latency if not stats.samples else \
+                stats.latency + self._alpha * (latency - stats.latency)
+            stats.samples += 1
+            if stats.current.count >= self._window:
+                stats.previous = stats.current
+                stats.current = LatencyHistogram()
+            stats.current.record(latency)
+
+    def rank(self, endpoints: List[str]) -> List[str]:
+        """
+        Order endpoints from most to least preferred. Endpoints without any
+        successful requests are tried first so every endpoint is measured.
+        :param endpoints: available endpoints, in default order of preference
+        :returns: `endpoints` sorted by preference
+        """
+        with self._lock:
+            self._routed += 1
+            ranked = sorted(endpoints, key=self._score)
+            if self._explore_every and len(ranked) > 1 and \
+                    self._routed % self._explore_every == 0:
+                self.explored += 1
+                ranked.reverse()
+        return ranked
+
+    def _score(self, endpoint: str) -> tuple:
+        stats = self._stats.get(endpoint)
+        if not stats or not stats.samples:
+            return False, 0.0
+        return stats.error_rate > self._max_error_rate, \
+            stats.latency / max(1 - stats.error_rate, 0.05)
+
+    def hedge_delay(self, endpoint: str) -> Optional[float]:
+        """
+        Get the time after which a request to an endpoint should be hedged
+        :param endpoint: endpoint a request is being sent to
+        :returns: seconds to wait before hedging, or None if there is not
+            enough data to hedge
+        """
+        with self._lock:
+            stats = self._stats.get(endpoint)
+            if not stats:
+                return None
+            histogram = stats.current
+            if histogram.count < self._min_samples:
+                histogram = stats.previous
+            if not histogram:
+                return None
+        return histogram.percentile(self._hedge_percentile)
+
+    def record_hedge(self, won: bool):
+        """
+        Record a hedged request
+        :param won: True if the hedge request responded first
+        """
+        with self._lock:
+            self.hedged += 1
+            self.hedge_wins += won
+
+    def record_hedge_skipped(self):
+        """
+        Record a request that was not hedged for lack of capacity
+        """
+        with self._lock:
+            self.hedges_skipped += 1
+
+    def get_stats(self) -> dict:
+        """
+        Get a snapshot of routing statistics
+        :returns: dict per-endpoint moving latency and error rate, and
+            routing counts
+        """
+        with self._lock:
+            return {"endpoints": {
+                endpoint: {"latency": stats.latency,
+                           "error_rate": stats.error_rate,
+                           "samples": stats.samples}
+                for endpoint, stats in self._stats.items()},
+                "routed": self._routed,
+                "explored": self.explored,
+                "hedged": self.hedged,
+                "hedge_wins": self.hedge_wins,
+                "hedges_skipped": self.hedges_skipped}
@@ -0,0 +1,187 @@
+# NEON AI (TM) SOFTWARE, Software Development Kit & Application Framework
+# All trademark and other rights reserved by their respective owners
+# Copyright 2008-2025 Neongecko.com Inc.
+# Contributors: Daniel McKnight, Guy Daniels, Elon Gasper, Richard Leeds,
+# Regina Bloomstine, Casimiro Ferreira, Andrii Pernatii, Kirill Hrymailo
+# BSD-3 License
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+# 3. Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived from this
+#    software without specific prior written permission.
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO,
+# THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+# CONTRIBUTORS  BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA,
+# OR PROFITS;  OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+# LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+# NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE,  EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import sqlite3
+
+from abc import ABC, abstractmethod
+from collections.abc import MutableMapping
+from threading import Lock
+from time import time
+from typing import Any, Callable, Iterator, List, Optional, Tuple
+
+from .expiry import SessionExpiry
+
+# Time of last activity and the LLM being chatted with
+Session = Tuple[float, Any]
+
+
+class SessionStore(MutableMapping, ABC):
+    """
+    Mapping of usernames to active chat sessions. Setting a session records
+    activity; sessions with no activity for a timeout are removed by
+    `pop_expired`.
+    """
+    @abstractmethod
+    def pop_expired(self, timeout: float,
+                    now: Optional[float] = None) -> List[str]:
+        """
+        Remove and return all sessions with no activity in `timeout` seconds.
+        Each expired session is returned by exactly one call, including
+        calls from other processes sharing this store, so the caller owns
+        ending the returned sessions.
+        :param timeout: seconds of inactivity after which a session expires
+        :param now: current time, else `time.time()`
+        :returns: list of expired users, least recently active first
+        """
+
+    def close(self):
+        """
+        Release any resources held by the store
+        """
+
+
+class MemorySessionStore(SessionStore):
+    """
+    Session store held in memory by a single process
+    """
+    def __init__(self):
+        self._lock = Lock()
+        self._sessions = dict()
+        self._expiry = SessionExpiry()
+
+    def __getitem__(self, user: str) -> Session:
+        return self._sessions[user]
+
+    def __setitem__(self, user: str, session: Session):
+        with self._lock:
+            self._sessions[user] = session
+            self._expiry.touch(user, session[0])
+
+    def __delitem__(self, user: str):
+        with self._lock:
+            del self._sessions[user]
+            self._expiry.remove(user)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(list(self._sessions))
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def pop_expired(self, timeout: float,
+                    now: Optional[float] = None) -> List[str]:
+        with self._lock:
+            expired = self._expiry.pop_expired(timeout, now)
+            for user in expired:
+                self._sessions.pop(user, None)
+        return expired
+
+
+class SQLiteSessionStore(SessionStore):
+    """
+    Session store backed by an SQLite database that may be shared by multiple
+    processes on the same host
+    """
+    def __init__(self, path: str, encode: Callable[[Any], str] = str,
+                 decode: Callable[[str], Any] = str):
+        """
+        :param path: path to the database file
+        :param encode: function to convert a session's LLM to a string
+        :param decode: function to convert a stored string to an LLM
+        """
+        self._encode = encode
+        self._decode = decode
+        self._lock = Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._db:
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.execute("CREATE TABLE IF NOT EXISTS sessions ("
+                             "user TEXT PRIMARY KEY, "
+                             "last_activity REAL NOT NULL, llm TEXT)")
+            self._db.execute("CREATE INDEX IF NOT EXISTS sessions_activity "
+                             "ON sessions (last_activity)")
+
+    def __getitem__(self, user: str) -> Session:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT last_activity, llm FROM sessions WHERE user = ?",
+                (user,)).fetchone()
+        if row is None:
+            raise KeyError(user)
+        return row[0], self._decode(row[1])
+
+    def __setitem__(self, user: str, session: Session):
+        timestamp, llm = session
+        with self._lock, self._db:
+            self._db.execute(
+                "INSERT INTO sessions (user, last_activity, llm) "
+                "VALUES (?, ?, ?) ON CONFLICT (user) DO UPDATE SET "
+                "last_activity = excluded.last_activity, llm = excluded.llm",
+                (user, timestamp, self._encode(llm)))
+
+    def __delitem__(self, user: str):
+        with self._lock, self._db:
+            if not self._db.execute("DELETE FROM sessions WHERE user = ?",
+                                    (user,)).rowcount:
+                raise KeyError(user)
+
+    def __contains__(self, user) -> bool:
+        with self._lock:
+            return self._db.execute("SELECT 1 FROM sessions WHERE user = ?",
+                                    (user,)).fetchone() is not None
+
+    def __iter__(self) -> Iterator[str]:
+        with self._lock:
+            users = [row[0] for row in
+                     self._db.execute("SELECT user FROM sessions")]
+        return iter(users)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._db.execute(
+                "SELECT COUNT(*) FROM sessions").fetchone()[0]
+
+    def pop_expired(self, timeout: float,
+                    now: Optional[float] = None) -> List[str]:
+        cutoff = (now or time()) - timeout
+        with self._lock, self._db:
+            # Select and delete under one write lock so that no other process
+            # also claims the same sessions
+            self._db.execute("BEGIN IMMEDIATE")
+            expired = [row[0] for row in self._db.execute(
+                "SELECT user FROM sessions WHERE last_activity < ? "
+                "ORDER BY last_activity", (cutoff,))]
+            if expired:
+                self._db.execute("DELETE FROM sessions WHERE "
+                                 "last_activity < ?", (cutoff,))
+        return expired
+
+    def close(self):
+        with self._lock:
+            self._db.close()
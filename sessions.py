@@ -0,0 +1,147 @@
+# NEON AI (TM) SOFTWARE, Software Development Kit & Application Framework
+# All trademark and other rights reserved by their respective owners
+# Copyright 2008-2025 Neongecko.com Inc.
+# Contributors: Daniel McKnight, Guy Daniels, Elon Gasper, Richard Leeds,
+# Regina Bloomstine, Casimiro Ferreira, Andrii Pernatii, Kirill Hrymailo
+# BSD-3 License
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+# 3. Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived from this
+#    software without specific prior written permission.
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO,
+# THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+# CONTRIBUTORS  BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA,
+# OR PROFITS;  OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+# LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+# NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE,  EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""
+Backend sessions let a request send only the new query when the backend
+already holds the rest of the conversation.
+
+A full request includes `history`, which (re)initializes the backend's copy of
+session `session_id`:
+    {"query": str, "history": [[speaker, text], ...], "session_id": str,
+     "turn": int}
+A delta request omits `history`; `turn` is the number of history entries the
+backend is expected to hold for the session:
+    {"query": str, "session_id": str, "turn": int}
+After responding, the backend appends the query and response to the session.
+If the backend's copy does not have `turn` entries, it responds with HTTP 409
+and the client re-sends the full history.
+"""
+
+from collections import OrderedDict
+from threading import Lock
+from typing import Hashable, List, Optional
+from uuid import uuid4
+
+from .history import HistoryEntry
+
+
+def is_session_mismatch(error: Exception) -> bool:
+    """
+    Check if an exception indicates the backend session is out of sync
+    :param error: exception raised by a backend request
+    :returns: True if the full history should be re-sent
+    """
+    from neon_utils.hana_utils import ServerException
+    return isinstance(error, ServerException) and \
+        str(error).startswith("Error response 409")
+
+
+class _BackendSession:
+    __slots__ = ("session_id", "turn", "last")
+
+    def __init__(self, session_id: str, turn: int,
+                 last: Optional[HistoryEntry]):
+        self.session_id = session_id
+        self.turn = turn
+        self.last = last
+
+
+class DeltaSessions:
+    """
+    Tracks what history the backend holds for each session so requests can
+    omit history the backend already has
+    """
+    def __init__(self, max_sessions: int = 10000):
+        """
+        :param max_sessions: max number of sessions to track
+        """
+        self._max_sessions = max_sessions
+        self._lock = Lock()
+        self._sessions: "OrderedDict[Hashable, _BackendSession]" = \
+            OrderedDict()
+        self.full_requests = 0
+        self.delta_requests = 0
+        self.resyncs = 0
+
+    def build_request(self, key: Hashable, query: str,
+                      history: List[HistoryEntry],
+                      resync: bool = False) -> dict:
+        """
+        Build request data for a query
+        :param key: session key, i.e. (user, endpoint)
+        :param query: query to send
+        :param history: full context history for the query
+        :param resync: if True, send the full history
+        :returns: dict request data
+        """
+        with self._lock:
+            session = self._sessions.get(key)
+            if resync:
+                self.resyncs += 1
+            elif session and session.turn == len(history) and \
+                    (not history or tuple(history[-1]) == session.last):
+                self.delta_requests += 1
+                return {"query": query, "session_id": session.session_id,
+                        "turn": session.turn}
+            self.full_requests += 1
+            session_id = session.session_id if session else uuid4().hex
+        return {"query": query, "history": history, "session_id": session_id,
+                "turn": len(history)}
+
+    def update(self, key: Hashable, request: dict, response: str):
+        """
+        Record the backend's session state after a successful request
+        :param key: session key the request was built for
+        :param request: request data returned by `build_request`
+        :param response: response text returned by the backend
+        """
+        with self._lock:
+            self._sessions[key] = _BackendSession(
+                request["session_id"], request["turn"] + 2, ("llm", response))
+            self._sessions.move_to_end(key)
+            while len(self._sessions) > self._max_sessions:
+                self._sessions.popitem(last=False)
+
+    def invalidate(self, key: Hashable):
+        """
+        Forget a session so the next request sends full history
+        :param key: session key to remove
+        """
+        with self._lock:
+            self._sessions.pop(key, None)
+
+    def get_stats(self) -> dict:
+        """
+        Get a snapshot of session statistics
+        :returns: dict session and request counts
+        """
+        with self._lock:
+            return {"sessions": len(self._sessions),
+                    "full_requests": self.full_requests,
+                    "delta_requests": self.delta_requests,
+                    "resyncs": self.resyncs}
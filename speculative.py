@@ -0,0 +1,210 @@
+# NEON AI (TM) SOFTWARE, Software Development Kit & Application Framework
+# All trademark and other rights reserved by their respective owners
+# Copyright 2008-2025 Neongecko.com Inc.
+# Contributors: Daniel McKnight, Guy Daniels, Elon Gasper, Richard Leeds,
+# Regina Bloomstine, Casimiro Ferreira, Andrii Pernatii, Kirill Hrymailo
+# BSD-3 License
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+# 3. Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived from this
+#    software without specific prior written permission.
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO,
+# THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+# CONTRIBUTORS  BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA,
+# OR PROFITS;  OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+# LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+# NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE,  EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+from concurrent.futures import Future, ThreadPoolExecutor
+from threading import Lock
+from time import monotonic
+from typing import Callable, Dict, Hashable, List, Optional, Tuple
+
+from ovos_utils.log import LOG
+
+
+class Speculation:
+    """
+    An LLM request started before the skill was asked to handle an utterance
+    """
+    __slots__ = ("user", "key", "future", "started")
+
+    def __init__(self, user: str, key: Hashable, future: Future):
+        self.user = user
+        self.key = key
+        self.future = future
+        self.started = monotonic()
+
+
+class SpeculativeRequests:
+    """
+    Runs LLM requests for utterances that may later reach the LLM fallback.
+    Each user has at most one speculation; it is either claimed by the
+    fallback or discarded when another skill handles the utterance, a newer
+    utterance arrives, or it expires. Speculations never block regular
+    requests: if all speculative workers are busy, new ones are skipped.
+    """
+    def __init__(self, max_in_flight: int = 2, ttl: float = 30):
+        """
+        :param max_in_flight: max number of concurrent speculative requests
+        :param ttl: seconds an unclaimed speculation is kept
+        """
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_in_flight, thread_name_prefix="llm_speculative")
+        self._max_in_flight = max_in_flight
+        self._ttl = ttl
+        self._lock = Lock()
+        self._speculations: Dict[str, Speculation] = dict()
+        self._in_flight = 0
+        self.started = 0
+        self.skipped = 0
+        self.hits = 0
+        self.stale = 0
+        self.cancelled = 0
+        self.wasted = 0
+
+    def start(self, user: str, key: Hashable,
+              func: Callable[[], Tuple[int, str]]) -> bool:
+        """
+        Start a speculative request, replacing any unclaimed speculation for
+        the same user
+        :param user: user the request is for
+        :param key: identifies the utterance and LLM the request is for
+        :param func: callable returning the number of entries in the user's
+            history when the request was built and the LLM response
+        :returns: True if the request was started
+        """
+        self.expire()
+        with self._lock:
+            previous = self._speculations.pop(user, None)
+            if self._in_flight >= self._max_in_flight:
+                self.skipped += 1
+                future = None
+            else:
+                self._in_flight += 1
+                self.started += 1
+                future = self._executor.submit(func)
+                self._speculations[user] = Speculation(user, key, future)
+        if previous:
+            self.release(previous)
+        if future:
+            future.add_done_callback(self._on_done)
+        return future is not None
+
+    def take(self, user: str, key: Hashable) -> Optional[Speculation]:
+        """
+        Claim a user's speculation if it matches the utterance being handled
+        :param user: user to get a speculation for
+        :param key: identifies the utterance and LLM being handled
+        :returns: matching Speculation, else None
+        """
+        with self._lock:
+            speculation = self._speculations.get(user)
+            if not speculation or speculation.key != key:
+                return None
+            del self._speculations[user]
+        return speculation
+
+    def get_result(self, speculation: Speculation, history_count: int,
+                   timeout: Optional[float] = None) -> Optional[str]:
+        """
+        Wait for a claimed speculation to complete
+        :param speculation: Speculation returned by `take`
+        :param history_count: current number of entries in the user's history
+        :param timeout: max seconds to wait for the response
+        :returns: LLM response, or None if the speculation is stale or failed
+        """
+        try:
+            built_with, resp = speculation.future.result(timeout)
+        except Exception as e:
+            LOG.warning(f"Speculative request failed: {e}")
+            self.release(speculation)
+            return None
+        if built_with != history_count:
+            # History changed after the request was built
+            with self._lock:
+                self.stale += 1
+            self.release(speculation)
+            return None
+        with self._lock:
+            self.hits += 1
+        return resp
+
+    def discard(self, user: str):
+        """
+        Discard a user's unclaimed speculation
+        :param user: user whose utterance was handled elsewhere
+        """
+        with self._lock:
+            speculation = self._speculations.pop(user, None)
+        if speculation:
+            self.release(speculation)
+
+    def expire(self) -> List[str]:
+        """
+        Discard speculations that have not been claimed within the TTL
+        :returns: list of users whose speculations were discarded
+        """
+        cutoff = monotonic() - self._ttl
+        with self._lock:
+            expired = [s for s in self._speculations.values()
+                       if s.started < cutoff]
+            for speculation in expired:
+                del self._speculations[speculation.user]
+        for speculation in expired:
+            self.release(speculation)
+        return [s.user for s in expired]
+
+    def release(self, speculation: Speculation):
+        """
+        Discard a speculation that will not be used
+        :param speculation: Speculation to discard
+        """
+        # A request that has not started yet costs nothing; anything else
+        # used a backend request that will never be spoken
+        cancelled = speculation.future.cancel()
+        with self._lock:
+            if cancelled:
+                self.cancelled += 1
+            else:
+                self.wasted += 1
+        LOG.debug(f"Discarded speculation for {speculation.user} "
+                  f"(cancelled={cancelled})")
+
+    def _on_done(self, _: Future):
+        with self._lock:
+            self._in_flight -= 1
+
+    def get_stats(self) -> dict:
+        """
+        Get a snapshot of speculative request statistics
+        :returns: dict request counts and hit rate
+        """
+        with self._lock:
+            return {"pending": len(self._speculations),
+                    "in_flight": self._in_flight,
+                    "started": self.started,
+                    "skipped": self.skipped,
+                    "hits": self.hits,
+                    "stale": self.stale,
+                    "cancelled": self.cancelled,
+                    "wasted": self.wasted,
+                    "hit_rate": self.hits / self.started if
+                    self.started else 0.0}
+
+    def shutdown(self):
+        """
+        Stop running speculative requests
+        """
+        self._executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,194 @@
+# NEON AI (TM) SOFTWARE, Software Development Kit & Application Framework
+# All trademark and other rights reserved by their respective owners
+# Copyright 2008-2025 Neongecko.com Inc.
+# Contributors: Daniel McKnight, Guy Daniels, Elon Gasper, Richard Leeds,
+# Regina Bloomstine, Casimiro Ferreira, Andrii Pernatii, Kirill Hrymailo
+# BSD-3 License
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+# 3. Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived from this
+#    software without specific prior written permission.
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO,
+# THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+# CONTRIBUTORS  BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA,
+# OR PROFITS;  OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+# LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+# NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE,  EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+from typing import Callable, List, Optional, Set, Tuple
+
+from ovos_utils.log import LOG
+
+from .history import HistoryEntry
+
+SUMMARY_QUERY = "Summarize our conversation so far."
+
+
+def build_summary_prompt(summary: Optional[str],
+                         entries: List[HistoryEntry]) -> str:
+    """
+    Build a request to fold history entries into a conversation summary
+    :param summary: existing summary of earlier entries, if any
+    :param entries: (speaker, text) entries to add to the summary
+    :returns: query to send to an LLM
+    """
+    transcript = "\n".join(f"[{speaker}] {text}" for speaker, text in entries)
+    if summary:
+        return ("Update this summary of a conversation with the new messages "
+                "below. Reply with only the updated summary.\n\n"
+                f"Summary:\n{summary}\n\nNew messages:\n{transcript}")
+    return ("Summarize the following conversation. Reply with only the "
+            f"summary.\n\n{transcript}")
+
+
+class RollingSummarizer:
+    """
+    Maintains a running summary of each user's older chat history. When a
+    user has more than `threshold` unsummarized entries, all but the most
+    recent `keep` are folded into the summary in the background. Summaries
+    of the `max_users` most recently active users are kept.
+    """
+    def __init__(self, summarize: Callable[[str, Optional[str],
+                                            List[HistoryEntry]], str],
+                 threshold: int = 20, keep: int = 8, max_users: int = 1000):
+        """
+        :param summarize: callable accepting an LLM endpoint, the existing
+            summary, and entries to add, that returns an updated summary
+        :param threshold: number of unsummarized entries that triggers
+            compaction
+        :param keep: number of recent entries to leave unsummarized
+        :param max_users: max number of users to keep summaries for
+        """
+        self._summarize = summarize
+        self._threshold = threshold
+        self._keep = keep
+        self._max_users = max_users
+        self._executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="llm_summarizer")
+        self._lock = Lock()
+        # user -> (summary, number of history entries it covers), in order
+        # of last access
+        self._summaries: "OrderedDict[str, Tuple[str, int]]" = OrderedDict()
+        self._pending: Set[str] = set()
+        # Users reset while compacting, whose pending summary is stale
+        self._stale: Set[str] = set()
+        self.compactions = 0
+        self.failures = 0
+
+    def get_context(self, user: str, entries: List[HistoryEntry],
+                    total: int) -> Tuple[List[HistoryEntry],
+                                         List[HistoryEntry]]:
+        """
+        Get the summary and unsummarized recent entries for a user
+        :param user: user to get context for
+        :param entries: most recent (speaker, text) history entries
+        :param total: total number of entries in the user's history
+        :returns: summary as a query/response pair (empty if there is no
+            summary), unsummarized entries
+        """
+        with self._lock:
+            summary, covered = self._get_summary(user, total)
+        if not summary:
+            return [], entries
+        offset = total - len(entries)
+        return [("user", SUMMARY_QUERY), ("llm", summary)], \
+            entries[max(covered - offset, 0):]
+
+    def maybe_compact(self, endpoint: str, user: str,
+                      entries: List[HistoryEntry], total: int) -> bool:
+        """
+        Start compacting a user's history in the background if it has grown
+        past the threshold
+        :param endpoint: LLM endpoint to request a summary from
+        :param user: user to compact history for
+        :param entries: most recent (speaker, text) history entries
+        :param total: total number of entries in the user's history
+        :returns: True if compaction was started
+        """
+        with self._lock:
+            summary, covered = self._get_summary(user, total)
+            if user in self._pending or total - covered <= self._threshold:
+                return False
+            self._pending.add(user)
+        offset = total - len(entries)
+        # Keep an even number of recent entries so query/response pairs
+        # are not split
+        keep = self._keep + self._keep % 2
+        to_fold = entries[max(covered - offset, 0):len(entries) - keep]
+        self._executor.submit(self._compact, endpoint, user, summary,
+                              to_fold, total - keep)
+        return True
+
+    def _compact(self, endpoint: str, user: str, summary: Optional[str],
+                 entries: List[HistoryEntry], covered: int):
+        try:
+            summary = self._summarize(endpoint, summary, entries)
+            if summary:
+                with self._lock:
+                    if user in self._stale:
+                        return
+                    self._summaries[user] = (summary, covered)
+                    self._summaries.move_to_end(user)
+                    while len(self._summaries) > self._max_users:
+                        self._summaries.popitem(last=False)
+                    self.compactions += 1
+                LOG.debug(f"Summarized {len(entries)} entries for {user}")
+        except Exception as e:
+            self.failures += 1
+            LOG.error(f"Failed to summarize history for {user}: {e}")
+        finally:
+            with self._lock:
+                self._pending.discard(user)
+                self._stale.discard(user)
+
+    def _get_summary(self, user: str,
+                     total: int) -> Tuple[Optional[str], int]:
+        summary, covered = self._summaries.get(user, (None, 0))
+        if covered > total:
+            # History was replaced or dropped since it was summarized
+            self._summaries.pop(user)
+            return None, 0
+        if summary:
+            self._summaries.move_to_end(user)
+        return summary, covered
+
+    def reset(self, user: str):
+        """
+        Remove a user's summary, i.e. when their history is removed
+        :param user: user to remove the summary for
+        """
+        with self._lock:
+            self._summaries.pop(user, None)
+            if user in self._pending:
+                self._stale.add(user)
+
+    def get_stats(self) -> dict:
+        """
+        Get a snapshot of summarizer statistics
+        :returns: dict summary, compaction, and failure counts
+        """
+        with self._lock:
+            return {"summaries": len(self._summaries),
+                    "pending": len(self._pending),
+                    "compactions": self.compactions,
+                    "failures": self.failures}
+
+    def shutdown(self):
+        """
+        Stop background compaction
+        """
+        self._executor.shutdown(wait=False, cancel_futures=True)
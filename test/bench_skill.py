@@ -0,0 +1,285 @@
+# NEON AI (TM) SOFTWARE, Software Development Kit & Application Framework
+# All trademark and other rights reserved by their respective owners
+# Copyright 2008-2025 Neongecko.com Inc.
+# Contributors: Daniel McKnight, Guy Daniels, Elon Gasper, Richard Leeds,
+# Regina Bloomstine, Casimiro Ferreira, Andrii Pernatii, Kirill Hrymailo
+# BSD-3 License
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+# 3. Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived from this
+#    software without specific prior written permission.
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO,
+# THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+# CONTRIBUTORS  BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA,
+# OR PROFITS;  OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+# LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+# NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE,  EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""
+Benchmark LLM request handling against a local stand-in backend.
+
+Simulated users each send requests one at a time, waiting for a response
+before sending the next. Example:
+    python test/bench_skill.py --users 50 --requests 5 --latency 0.2
+"""
+
+import json
+import sys
+import threading
+import tracemalloc
+
+from argparse import ArgumentParser
+from os import environ, makedirs
+from os.path import dirname, join
+from tempfile import mkdtemp
+from time import monotonic, sleep
+from typing import Callable, Optional
+
+from mock import Mock, patch
+from ovos_bus_client import Message
+
+sys.path.append(dirname(__file__))
+from fake_backend import FakeLLMBackend
+
+MODES = ("fallback", "ask", "converse")
+
+
+def get_bench_skill(settings: Optional[dict] = None):
+    """
+    Load the skill with a fake messagebus and the specified settings
+    :param settings: skill settings to apply before the skill is initialized
+    :returns: initialized LLMSkill
+    """
+    test_fs = mkdtemp()
+    environ["XDG_DATA_HOME"] = join(test_fs, "data")
+    environ["XDG_CONFIG_HOME"] = join(test_fs, "config")
+    from ovos_config.locations import get_xdg_config_save_path
+    from ovos_utils.fakebus import FakeBus
+    from neon_minerva.skill import get_skill_object
+    skill_id = "skill-fallback_llm.bench"
+    settings_path = join(get_xdg_config_save_path(), "skills", skill_id,
+                         "settings.json")
+    makedirs(dirname(settings_path), exist_ok=True)
+    with open(settings_path, "w") as f:
+        json.dump(settings or dict(), f)
+
+    bus = FakeBus()
+    bus.run_forever()
+    skill = get_skill_object("skill-fallback_llm.neongeckocom", bus=bus,
+                             skill_id=skill_id)
+    skill.speak = Mock()
+    skill.speak_dialog = Mock()
+    return skill
+
+
+class _ThreadMonitor:
+    """
+    Samples the number of running threads in the background
+    """
+    def __init__(self, interval: float = 0.01):
+        self._interval = interval
+        self._stop = threading.Event()
+        self.baseline = threading.active_count()
+        self.peak = self.baseline
+        self.peak_skill = 0
+
+    def start(self):
+        threading.Thread(target=self._run, daemon=True).start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.wait(self._interval):
+            threads = threading.enumerate()
+            self.peak = max(self.peak, len(threads))
+            self.peak_skill = max(self.peak_skill, len(
+                [t for t in threads if t.name.startswith("llm_")]))
+
+
+def run_users(users: int, requests: int,
+              send: Callable[[str, str], None], think_time: float = 0.0):
+    """
+    Run simulated users in parallel
+    :param users: number of simulated users
+    :param requests: number of requests each user makes
+    :param send: callable taking a username and utterance that returns once
+        a response has been handled
+    :param think_time: seconds each user waits between requests
+    """
+    def _user(username):
+        for i in range(requests):
+            send(username, f"{username} question {i}")
+            if think_time:
+                sleep(think_time)
+
+    threads = [threading.Thread(target=_user, args=(f"user_{u}",),
+                                daemon=True) for u in range(users)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+def bench_mode(skill, backend: FakeLLMBackend, mode: str, users: int,
+               requests: int, think_time: float = 0.0,
+               trace_memory: bool = True) -> dict:
+    """
+    Benchmark one entry point
+    :param skill: skill to benchmark
+    :param backend: fake backend the skill is using
+    :param mode: one of `MODES`
+    :param users: number of simulated users
+    :param requests: number of requests each user makes
+    :param think_time: seconds each user waits between requests
+    :param trace_memory: if True, measure memory allocated during the run
+    :returns: dict benchmark results
+    """
+    from skill_fallback_llm import LLM
+    from skill_fallback_llm.metrics import LatencyMetrics
+    skill._metrics = LatencyMetrics()
+    skill.chat_history.clear()
+    skill.settings['fallback_enabled'] = True
+    done = dict()
+    real_speak_response = skill._speak_llm_response
+
+    def _speak_llm_response(query, user, *args):
+        try:
+            return real_speak_response(query, user, *args)
+        finally:
+            done[user].set()
+
+    def _send(username, utterance):
+        done[username] = threading.Event()
+        message = Message("recognizer_loop:utterance",
+                          {"utterance": utterance,
+                           "utterances": [utterance]},
+                          {"username": username})
+        if mode == "ask":
+            skill.handle_ask_chatgpt(message)
+            return
+        if mode == "fallback":
+            if skill._speculative:
+                skill.handle_speculate(message)
+            handled = skill.fallback_llm(message)
+        else:
+            handled = skill.converse(message)
+        if handled and skill.speak_dialog.call_args != (("llm_busy",),):
+            done[username].wait()
+
+    if mode == "converse":
+        for u in range(users):
+            skill._reset_expiration(f"user_{u}", LLM.FASTCHAT)
+    skill._speak_llm_response = _speak_llm_response
+    backend_requests = backend.requests
+    backend_bytes = backend.request_bytes
+    monitor = _ThreadMonitor().start()
+    if trace_memory:
+        tracemalloc.start()
+    started = monotonic()
+    try:
+        run_users(users, requests, _send, think_time)
+        elapsed = monotonic() - started
+    finally:
+        monitor.stop()
+        skill._speak_llm_response = real_speak_response
+        if trace_memory:
+            memory, memory_peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+        else:
+            memory = memory_peak = 0
+    total = users * requests
+    entry_point = {"fallback": "fallback_llm", "ask": "ask_llm",
+                   "converse": "converse"}[mode]
+    latency = skill._metrics.snapshot().get(entry_point, {})
+    sent = backend.requests - backend_requests
+    return {"mode": mode,
+            "requests": total,
+            "backend_requests": sent,
+            "avg_request_bytes": (backend.request_bytes - backend_bytes) /
+            sent if sent else 0,
+            "requests_per_second": total / elapsed,
+            "p50": latency.get("p50", 0.0),
+            "p95": latency.get("p95", 0.0),
+            "p99": latency.get("p99", 0.0),
+            "peak_threads": monitor.peak - monitor.baseline,
+            "peak_skill_threads": monitor.peak_skill,
+            "memory_kib": memory / 1024,
+            "peak_memory_kib": memory_peak / 1024}
+
+
+def print_results(results: list, file=sys.stdout):
+    """
+    Print benchmark results as a table
+    :param results: list of dict results returned by `bench_mode`
+    :param file: file to write results to
+    """
+    columns = ("mode", "requests", "requests_per_second", "p50", "p95",
+               "p99", "avg_request_bytes", "peak_threads",
+               "peak_skill_threads", "memory_kib", "peak_memory_kib")
+    print(" | ".join(columns), file=file)
+    for result in results:
+        print(" | ".join(f"{result[c]:.3f}" if isinstance(result[c], float)
+                         else str(result[c]) for c in columns), file=file)
+
+
+def main(args=None):
+    parser = ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument("--users", type=int, default=20,
+                        help="Number of simulated users")
+    parser.add_argument("--requests", type=int, default=5,
+                        help="Requests per user")
+    parser.add_argument("--latency", type=float, default=0.2,
+                        help="Backend latency in seconds")
+    parser.add_argument("--jitter", type=float, default=0.05,
+                        help="Max random variation in backend latency")
+    parser.add_argument("--response-words", type=int, default=50,
+                        help="Words per backend response")
+    parser.add_argument("--think-time", type=float, default=0.0,
+                        help="Seconds users wait between requests")
+    parser.add_argument("--mode", choices=MODES, action="append",
+                        help="Entry point(s) to benchmark (default all)")
+    parser.add_argument("--setting", action="append", default=[],
+                        metavar="KEY=JSON_VALUE",
+                        help="Skill setting to apply, i.e. worker_threads=8")
+    parser.add_argument("--no-memory", action="store_true",
+                        help="Disable memory tracing")
+    parser.add_argument("--output", help="Also write results to this file")
+    args = parser.parse_args(args)
+
+    settings = dict()
+    for setting in args.setting:
+        key, value = setting.split('=', 1)
+        settings[key] = json.loads(value)
+    backend = FakeLLMBackend(args.latency, args.jitter, args.response_words)
+    results = list()
+    with patch("skill_fallback_llm.client.request_backend", backend):
+        skill = get_bench_skill(settings)
+        try:
+            for mode in args.mode or MODES:
+                results.append(bench_mode(skill, backend, mode, args.users,
+                                          args.requests, args.think_time,
+                                          not args.no_memory))
+        finally:
+            skill.shutdown()
+    print_results(results)
+    if args.output:
+        with open(args.output, "w") as f:
+            print_results(results, f)
+    return results
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+# NEON AI (TM) SOFTWARE, Software Development Kit & Application Framework
+# All trademark and other rights reserved by their respective owners
+# Copyright 2008-2025 Neongecko.com Inc.
+# Contributors: Daniel McKnight, Guy Daniels, Elon Gasper, Richard Leeds,
+# Regina Bloomstine, Casimiro Ferreira, Andrii Pernatii, Kirill Hrymailo
+# BSD-3 License
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+# 3. Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived from this
+#    software without specific prior written permission.
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO,
+# THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+# CONTRIBUTORS  BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA,
+# OR PROFITS;  OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+# LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+# NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE,  EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""
+Benchmark skill load time.
+
+Module import time is measured in fresh interpreters with `-X importtime`;
+`LLMSkill.__init__` (including `register_entity_file`) is timed in-process.
+Example:
+    python test/bench_startup.py --repeat 5
+"""
+
+import re
+import subprocess
+import sys
+
+from argparse import ArgumentParser
+from functools import wraps
+from os.path import dirname
+from statistics import median
+from time import perf_counter
+from typing import Dict, List, Tuple
+
+from mock import patch
+
+sys.path.append(dirname(__file__))
+from bench_skill import get_bench_skill
+
+SKILL_MODULE = "skill_fallback_llm"
+# Modules only needed on rare paths that should not be loaded with the skill
+DEFERRED_MODULES = ("neon_utils.hana_utils", "neon_utils.user_utils",
+                    "neon_mq_connector.utils.client_utils")
+_IMPORT_TIME = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \| (\s*)(\S+)")
+
+
+def measure_import() -> Tuple[float, List[Tuple[str, float]], List[str]]:
+    """
+    Import the skill module in a fresh interpreter
+    :returns: seconds to import the skill module, (module, seconds) for each
+        module imported directly by the skill module, and deferred modules
+        that were loaded anyway
+    """
+    script = (f"import sys, {SKILL_MODULE}\n"
+              f"print(' '.join(m for m in {DEFERRED_MODULES!r} "
+              f"if m in sys.modules))")
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", script],
+                          capture_output=True, text=True, check=True)
+    total = 0.0
+    children = list()
+    # Each import is logged after its own imports, indented by depth
+    for line in proc.stderr.splitlines():
+        match = _IMPORT_TIME.match(line)
+        if not match:
+            continue
+        cumulative = int(match.group(2)) / 1000000
+        depth = len(match.group(3)) // 2
+        if match.group(4) == SKILL_MODULE:
+            total = cumulative
+            break
+        if depth == 0:
+            # Imported before the skill module, i.e. at interpreter startup
+            children = list()
+        elif depth == 1:
+            children.append((match.group(4), cumulative))
+    return total, children, proc.stdout.split()
+
+
+def measure_init() -> Dict[str, float]:
+    """
+    Load the skill once, timing its initialization
+    :returns: dict seconds spent in `__init__`, the base class `__init__`
+        (loading resources and settings), and `register_entity_file`
+    """
+    from ovos_workshop.skills.fallback import FallbackSkill
+    from skill_fallback_llm import LLMSkill
+    timings = {"init": 0.0, "base_init": 0.0, "register_entity_file": 0.0}
+
+    def _timed(name, func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            started = perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                timings[name] += perf_counter() - started
+        return wrapper
+
+    with patch.object(LLMSkill, "__init__",
+                      _timed("init", LLMSkill.__init__)), \
+            patch.object(FallbackSkill, "__init__",
+                         _timed("base_init", FallbackSkill.__init__)), \
+            patch.object(LLMSkill, "register_entity_file",
+                         _timed("register_entity_file",
+                                LLMSkill.register_entity_file)):
+        skill = get_bench_skill()
+    skill.shutdown()
+    return timings
+
+
+def main(args=None):
+    parser = ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument("--repeat", type=int, default=5,
+                        help="Number of times to measure each step")
+    parser.add_argument("--top", type=int, default=10,
+                        help="Number of slowest direct imports to list")
+    args = parser.parse_args(args)
+
+    imports = [measure_import() for _ in range(args.repeat)]
+    inits = [measure_init() for _ in range(args.repeat)]
+    results = {
+        "import": [i[0] for i in imports],
+        "init": [i["init"] for i in inits],
+        "base_init": [i["base_init"] for i in inits],
+        "skill_init": [i["init"] - i["base_init"] for i in inits],
+        "register_entity_file": [i["register_entity_file"] for i in inits]}
+
+    print("step | median_ms | max_ms")
+    for step, times in results.items():
+        print(f"{step} | {median(times) * 1000:.1f} | {max(times) * 1000:.1f}")
+    print(f"\nslowest imports by {SKILL_MODULE} (last run)")
+    print("module | ms")
+    for module, seconds in sorted(imports[-1][1], key=lambda i: i[1],
+                                  reverse=True)[:args.top]:
+        print(f"{module} | {seconds * 1000:.1f}")
+    loaded = imports[-1][2]
+    if loaded:
+        print(f"\nWARNING: deferred modules loaded on import: {loaded}")
+    return results
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+# NEON AI (TM) SOFTWARE, Software Development Kit & Application Framework
+# All trademark and other rights reserved by their respective owners
+# Copyright 2008-2025 Neongecko.com Inc.
+# Contributors: Daniel McKnight, Guy Daniels, Elon Gasper, Richard Leeds,
+# Regina Bloomstine, Casimiro Ferreira, Andrii Pernatii, Kirill Hrymailo
+# BSD-3 License
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+# 3. Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived from this
+#    software without specific prior written permission.
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO,
+# THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+# CONTRIBUTORS  BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA,
+# OR PROFITS;  OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+# LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+# NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE,  EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import json
+
+from random import uniform
+from threading import Lock
+from time import sleep
+
+from neon_utils.hana_utils import ServerException
+
+
+class FakeLLMBackend:
+    """
+    Local stand-in for `skill_fallback_llm.client.request_backend` that answers
+    `/llm/*` requests after a configurable delay. Requests with a
+    `session_id` follow the backend session protocol described in
+    `skill_fallback_llm.sessions`.
+    """
+    def __init__(self, latency: float = 0.2, jitter: float = 0.0,
+                 response_words: int = 50):
+        """
+        :param latency: mean seconds to wait before responding
+        :param jitter: max seconds to randomly add to or subtract from latency
+        :param response_words: number of words in each response
+        """
+        self.latency = latency
+        self.jitter = jitter
+        self.response_words = response_words
+        self._lock = Lock()
+        self.requests = 0
+        self.request_bytes = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.sessions = dict()
+
+    def get_response(self, query: str) -> str:
+        """
+        Build a response of `response_words` words in sentences of 10 words
+        :param query: query to respond to
+        :returns: response text
+        """
+        words = [f"word{i}" for i in range(self.response_words)]
+        sentences = [" ".join(words[i:i + 10]).capitalize() + "."
+                     for i in range(0, len(words), 10)]
+        return f"You said {query}. " + " ".join(sentences)
+
+    def __call__(self, endpoint: str, request_data: dict, *_, **__) -> dict:
+        with self._lock:
+            self.requests += 1
+            self.request_bytes += len(json.dumps(request_data))
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            session_id = request_data.get("session_id")
+            if session_id:
+                self._check_session(request_data)
+            sleep(max(0.0, self.latency + uniform(-self.jitter,
+                                                  self.jitter)))
+            response = self.get_response(request_data["query"])
+            if session_id:
+                with self._lock:
+                    self.sessions[session_id].extend(
+                        [["user", request_data["query"]], ["llm", response]])
+            return {"response": response}
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+
+    def _check_session(self, request_data: dict):
+        session_id = request_data["session_id"]
+        with self._lock:
+            if "history" in request_data:
+                self.sessions[session_id] = \
+                    [list(entry) for entry in request_data["history"]]
+            elif len(self.sessions.get(session_id, [])) != \
+                    request_data["turn"]:
+                raise ServerException("Error response 409: "
+                                      "Session out of sync")
@@ -0,0 +1,442 @@
+# NEON AI (TM) SOFTWARE, Software Development Kit & Application Framework
+# All trademark and other rights reserved by their respective owners
+# Copyright 2008-2025 Neongecko.com Inc.
+# Contributors: Daniel McKnight, Guy Daniels, Elon Gasper, Richard Leeds,
+# Regina Bloomstine, Casimiro Ferreira, Andrii Pernatii, Kirill Hrymailo
+# BSD-3 License
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+# 3. Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived from this
+#    software without specific prior written permission.
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO,
+# THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+# CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA,
+# OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+# LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+# NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE,
+# EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""
+Replay recorded messagebus traffic against the skill with a local stand-in
+backend.
+
+The input is a JSONL file of serialized Messages, each with an optional
+top-level `time` (epoch seconds when it was recorded) and a `username` in
+its context. `recognizer_loop:utterance` messages are passed to `converse`
+and then `fallback_llm`; intent messages (`<skill_id>:<intent file>`) are
+passed to the matching intent handler. Each user's messages are handled in
+order, as the intent service would. Example:
+    python test/replay_bus.py bus_log.jsonl --speed 10
+    python test/replay_bus.py --generate 50 --speed 20
+"""
+
+import json
+import sys
+import threading
+
+from argparse import ArgumentParser
+from collections import defaultdict
+from os.path import dirname
+from queue import Queue
+from random import Random
+from time import monotonic, sleep, time
+from typing import Dict, List, Optional, Tuple
+
+from mock import patch
+from ovos_bus_client import Message
+
+sys.path.append(dirname(__file__))
+from bench_skill import get_bench_skill
+from fake_backend import FakeLLMBackend
+
+UTTERANCE_TYPES = ("recognizer_loop:utterance",)
+INTENT_HANDLERS = {"ask_llm.intent": "handle_ask_chatgpt",
+                   "chat_with_llm.intent": "handle_chat_with_llm",
+                   "email_chat_history.intent": "handle_email_chat_history",
+                   "enable_fallback.intent": "handle_enable_fallback",
+                   "disable_fallback.intent": "handle_disable_fallback"}
+
+
+def get_user(message: Message) -> str:
+    """
+    Get the user a recorded message is from
+    :param message: recorded message
+    :returns: username, or "local" if none is specified
+    """
+    from neon_utils.message_utils import get_message_user
+    return get_message_user(message) or "local"
+
+
+def load_messages(path: str) -> List[Tuple[float, Message]]:
+    """
+    Load recorded messages from a JSONL file
+    :param path: path to the file to load
+    :returns: list of (recorded time, Message), in order of recorded time.
+        Messages without a time are given the time of the previous message.
+    """
+    messages = list()
+    last_time = 0.0
+    with open(path) as f:
+        for line in f:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            last_time = float(record.get("time") or last_time)
+            messages.append((last_time, Message(record["type"],
+                                                record.get("data") or {},
+                                                record.get("context") or {})))
+    messages.sort(key=lambda m: m[0])
+    return messages
+
+
+def generate_messages(users: int, turns: int = 5, gap: float = 20,
+                      chat_timeout: float = 300,
+                      seed: int = 0) -> List[Tuple[float, Message]]:
+    """
+    Generate traffic for users who each start a chat session, talk for
+    `turns` utterances, and ask a question. Every other user goes idle long
+    enough for their session to expire and then speaks again, which reaches
+    the fallback.
+    :param users: number of users
+    :param turns: number of utterances in each chat session
+    :param gap: mean seconds between a user's utterances
+    :param chat_timeout: chat session timeout being simulated
+    :param seed: random seed
+    :returns: list of (time, Message), in order of time
+    """
+    rand = Random(seed)
+    messages = list()
+
+    def _message(msg_type, user, utterance, **data):
+        data.update({"utterance": utterance, "utterances": [utterance]})
+        return Message(msg_type, data, {"username": user})
+
+    for u in range(users):
+        user = f"user_{u}"
+        t = rand.uniform(0, gap * turns)
+        messages.append((t, _message("skill-fallback_llm:chat_with_llm.intent",
+                                     user, "chat with fastchat",
+                                     llm="fastchat")))
+        for i in range(turns):
+            t += gap * rand.uniform(0.5, 1.5)
+            messages.append((t, _message(UTTERANCE_TYPES[0], user,
+                                         f"{user} tell me about topic {i}")))
+        if u % 2:
+            t += chat_timeout * 1.5
+            messages.append((t, _message(UTTERANCE_TYPES[0], user,
+                                         f"{user} are you still there")))
+        else:
+            t += gap
+            messages.append((t, _message(UTTERANCE_TYPES[0], user,
+                                         "goodbye")))
+        t += gap * rand.uniform(0.5, 1.5)
+        messages.append((t, _message("skill-fallback_llm:ask_llm.intent",
+                                     user, f"ask fastchat what {user} likes",
+                                     llm="fastchat")))
+    messages.sort(key=lambda m: m[0])
+    return messages
+
+
+def count_ordering_violations(sent: List[str],
+                              history: List[Tuple[str, str]]) -> dict:
+    """
+    Compare a user's chat history to the order their utterances were sent
+    :param sent: utterances that may reach an LLM, in the order sent
+    :param history: (speaker, text) history entries, oldest first
+    :returns: dict counts of queries recorded out of order and of entries
+        that are not part of a query/response pair
+    """
+    positions = defaultdict(list)
+    for idx, utterance in enumerate(sent):
+        positions[utterance].append(idx)
+    out_of_order = 0
+    unpaired = 0
+    last_position = -1
+    previous_speaker = "llm"
+    for speaker, text in history:
+        if (speaker == "llm") == (previous_speaker == "llm"):
+            unpaired += 1
+        previous_speaker = speaker
+        if speaker == "llm" or not positions[text]:
+            continue
+        position = positions[text].pop(0)
+        if position < last_position:
+            out_of_order += 1
+        last_position = position
+    if previous_speaker != "llm":
+        unpaired += 1
+    return {"out_of_order": out_of_order, "unpaired": unpaired}
+
+
+def _percentiles(values: List[float]) -> dict:
+    values = sorted(values)
+    if not values:
+        return {"count": 0}
+    return {"count": len(values),
+            "p50": values[len(values) // 2],
+            "p95": values[min(int(len(values) * 0.95), len(values) - 1)],
+            "max": values[-1]}
+
+
+class BusReplay:
+    """
+    Replays recorded messages against a skill and tracks chat session and
+    chat history behavior
+    """
+    def __init__(self, skill, speed: float = 1.0,
+                 chat_timeout: float = 300, sweep_seconds: float = 5):
+        """
+        :param skill: skill to replay messages against
+        :param speed: factor by which to compress recorded time
+        :param chat_timeout: chat session timeout when the messages were
+            recorded; this is compressed along with the replay
+        :param sweep_seconds: seconds between checks for expired sessions
+            when the messages were recorded
+        """
+        from lingua_franca import load_language
+        # Needed by `handle_chat_with_llm`; normally loaded by the skill loader
+        load_language(skill.lang)
+        self.skill = skill
+        self.speed = speed
+        self.chat_timeout = chat_timeout / speed
+        skill.settings["chat_timeout_seconds"] = self.chat_timeout
+        skill.settings["session_sweep_seconds"] = sweep_seconds / speed
+        self._lock = threading.Lock()
+        self._queues: Dict[str, Queue] = dict()
+        self._threads: List[threading.Thread] = list()
+        self.sent: Dict[str, List[str]] = defaultdict(list)
+        self.dispatch_lag: List[float] = list()
+        self.expiry_lag: List[float] = list()
+        self.counts = defaultdict(int)
+        self._real_pop_expired = skill.chatting.pop_expired
+        skill.chatting.pop_expired = self._pop_expired
+
+    def run(self, messages: List[Tuple[float, Message]],
+            timeout: float = 60) -> dict:
+        """
+        Replay messages and wait for all resulting requests to be handled
+        :param messages: list of (recorded time, Message) in order of time
+        :param timeout: max seconds to wait for requests after the last
+            message is dispatched
+        :returns: dict replay report
+        """
+        self.skill.chat_history.clear()
+        self.skill.chatting.clear()
+        started = monotonic()
+        first = messages[0][0] if messages else 0
+        for recorded, message in messages:
+            scheduled = started + (recorded - first) / self.speed
+            delay = scheduled - monotonic()
+            if delay > 0:
+                sleep(delay)
+            self._enqueue(get_user(message), message, scheduled)
+        for queue in self._queues.values():
+            queue.put(None)
+        for thread in self._threads:
+            thread.join(timeout)
+        drained = self._wait_for_workers(timeout)
+        # Give remaining sessions time to expire
+        sleep(self.chat_timeout + 2 * self.skill.session_sweep_seconds)
+        elapsed = monotonic() - started
+        self.skill.chatting.pop_expired = self._real_pop_expired
+        return self._report(elapsed, drained)
+
+    def _enqueue(self, user: str, message: Message, scheduled: float):
+        if user not in self._queues:
+            self._queues[user] = Queue()
+            thread = threading.Thread(target=self._run_user,
+                                      args=(self._queues[user],),
+                                      daemon=True)
+            self._threads.append(thread)
+            thread.start()
+        self._queues[user].put((message, scheduled))
+
+    def _run_user(self, queue: Queue):
+        while True:
+            item = queue.get()
+            if item is None:
+                return
+            message, scheduled = item
+            with self._lock:
+                self.dispatch_lag.append(monotonic() - scheduled)
+            try:
+                self._dispatch(message)
+            except Exception as e:
+                print(f"Error handling {message.msg_type}: {e}",
+                      file=sys.stderr)
+                self._count("errors")
+
+    def _dispatch(self, message: Message):
+        skill = self.skill
+        user = get_user(message)
+        utterance = message.data.get("utterances", [""])[-1] or \
+            message.data.get("utterance", "")
+        if message.msg_type in UTTERANCE_TYPES:
+            self._count("utterances")
+            # Converse and fallback handlers each expect one of these
+            message = Message(message.msg_type,
+                              {**message.data, "utterance": utterance,
+                               "utterances": [utterance]}, message.context)
+            chatting = user in skill.chatting
+            if chatting:
+                with self._lock:
+                    self.sent[user].append(utterance)
+                handled = skill.converse(message)
+                if handled:
+                    self._count("converse")
+                    if user not in skill.chatting:
+                        self._count("sessions_ended_by_user")
+                    return
+                if user not in skill.chatting:
+                    self._count("sessions_timed_out_in_converse")
+            if skill._speculative:
+                skill.handle_speculate(message)
+            if skill.fallback_llm(message):
+                self._count("fallback")
+                if not chatting:
+                    with self._lock:
+                        self.sent[user].append(utterance)
+            else:
+                self._count("unhandled")
+            return
+        intent = message.msg_type.rsplit(":", 1)[-1]
+        if intent not in INTENT_HANDLERS:
+            self._count("skipped")
+            return
+        self._count(intent)
+        if intent == "ask_llm.intent":
+            with self._lock:
+                self.sent[user].append(message.data.get("utterance", ""))
+        elif intent == "chat_with_llm.intent":
+            self._count("sessions_started")
+        getattr(skill, INTENT_HANDLERS[intent])(message)
+
+    def _pop_expired(self, timeout: float,
+                     now: Optional[float] = None) -> List[str]:
+        now = now or time()
+        last_activity = {user: session[0] for user, session in
+                         self.skill.chatting.items()}
+        expired = self._real_pop_expired(timeout, now)
+        with self._lock:
+            for user in expired:
+                self.counts["sessions_expired"] += 1
+                self.expiry_lag.append(now - last_activity.get(user, now) -
+                                       timeout)
+        return expired
+
+    def _count(self, key: str):
+        with self._lock:
+            self.counts[key] += 1
+
+    def _wait_for_workers(self, timeout: float) -> bool:
+        deadline = monotonic() + timeout
+        while monotonic() < deadline:
+            stats = self.skill._workers.get_stats()
+            if not stats["queued"] and not stats["active_users"]:
+                return True
+            sleep(0.05)
+        return False
+
+    def _report(self, elapsed: float, drained: bool) -> dict:
+        violations = {"out_of_order": 0, "unpaired": 0, "users": 0}
+        for user, sent in self.sent.items():
+            result = count_ordering_violations(
+                sent, [(turn.speaker, turn.text) for turn in
+                       self.skill.chat_history.get_full(user)])
+            violations["out_of_order"] += result["out_of_order"]
+            violations["unpaired"] += result["unpaired"]
+            if result["out_of_order"] or result["unpaired"]:
+                violations["users"] += 1
+        metrics = self.skill.get_metrics()
+        latency = metrics["latency"]
+        return {"elapsed_seconds": elapsed,
+                "completed": drained,
+                "users": len(self._queues),
+                "messages": dict(self.counts),
+                "sessions": {
+                    "started": self.counts["sessions_started"],
+                    "ended_by_user": self.counts["sessions_ended_by_user"],
+                    "expired": self.counts["sessions_expired"],
+                    "timed_out_in_converse":
+                        self.counts["sessions_timed_out_in_converse"],
+                    "still_active": len(self.skill.chatting),
+                    "restarted_without_intent": max(
+                        self.counts["sessions_ended_by_user"] +
+                        self.counts["sessions_expired"] +
+                        self.counts["sessions_timed_out_in_converse"] +
+                        len(self.skill.chatting) -
+                        self.counts["sessions_started"], 0),
+                    "expiry_lag_seconds": _percentiles(self.expiry_lag)},
+                "ordering_violations": violations,
+                "dispatch_lag_seconds": _percentiles(self.dispatch_lag),
+                "latency": {key: latency[key] for key in
+                            ("fallback_llm", "converse", "ask_llm",
+                             "queue_wait") if key in latency},
+                "workers": {key: metrics["workers"][key] for key in
+                            ("submitted", "rejected", "completed",
+                             "max_wait_seconds")}}
+
+
+def main(args=None):
+    parser = ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument("log", nargs="?",
+                        help="JSONL file of recorded messages")
+    parser.add_argument("--generate", type=int, metavar="USERS",
+                        help="Replay generated traffic for this many users "
+                             "instead of a recording")
+    parser.add_argument("--speed", type=float, default=1.0,
+                        help="Factor by which to compress recorded time")
+    parser.add_argument("--chat-timeout", type=float, default=300,
+                        help="Chat session timeout when messages were "
+                             "recorded")
+    parser.add_argument("--latency", type=float, default=0.5,
+                        help="Backend latency in seconds")
+    parser.add_argument("--jitter", type=float, default=0.2,
+                        help="Max random variation in backend latency")
+    parser.add_argument("--response-words", type=int, default=50,
+                        help="Words per backend response")
+    parser.add_argument("--setting", action="append", default=[],
+                        metavar="KEY=JSON_VALUE",
+                        help="Skill setting to apply, i.e. worker_threads=8")
+    parser.add_argument("--output", help="Also write the report to this file")
+    args = parser.parse_args(args)
+    if not args.log and not args.generate:
+        parser.error("Specify a log file or --generate")
+
+    messages = load_messages(args.log) if args.log else \
+        generate_messages(args.generate, chat_timeout=args.chat_timeout)
+    settings = {"fallback_enabled": True}
+    for setting in args.setting:
+        key, value = setting.split('=', 1)
+        settings[key] = json.loads(value)
+    backend = FakeLLMBackend(args.latency, args.jitter, args.response_words)
+    with patch("skill_fallback_llm.client.request_backend", backend), \
+            patch("neon_mq_connector.utils.client_utils.send_mq_request",
+                  return_value={"success": True}):
+        skill = get_bench_skill(settings)
+        try:
+            report = BusReplay(skill, args.speed,
+                               args.chat_timeout).run(messages)
+        finally:
+            skill.shutdown()
+    report["backend_requests"] = backend.requests
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output)
+    return report
+
+
+if __name__ == "__main__":
+    main()
@@ -28,7 +28,9 @@
 
 import unittest
 
-from mock import Mock
+from threading import Event
+from time import monotonic, sleep
+from mock import Mock, patch
 from ovos_bus_client import Message
 from lingua_franca import load_language
 from neon_minerva.tests.skill_unit_test_base import SkillTestCase
@@ -36,6 +38,19 @@ from neon_minerva.tests.skill_unit_test_base import SkillTestCase
 from skill_fallback_llm import LLM
 
 
+def wait_for(condition, timeout: float = 5) -> bool:
+    """
+    Poll until `condition` returns True or `timeout` seconds pass
+    :returns: True if the condition was met
+    """
+    deadline = monotonic() + timeout
+    while not condition():
+        if monotonic() > deadline:
+            return False
+        sleep(0.01)
+    return True
+
+
 class TestSkill(SkillTestCase):
     def test_handle_enable_fallback(self):
         self.skill.handle_enable_fallback(None)
@@ -85,7 +100,7 @@ class TestSkill(SkillTestCase):
         load_language(self.skill.lang)
         fake_msg = Message("test", {},
                            {"username": "test_user"})
-        self.skill.chatting = dict()
+        self.skill.chatting.clear()
         self.skill.handle_chat_with_llm(fake_msg)
         self.assertIsInstance(self.skill.chatting["test_user"][0], float)
         # TODO: Diagnose equality failure
@@ -124,26 +139,1657 @@ class TestSkill(SkillTestCase):
 
         self.skill._send_email = real_send_email
 
+    @patch("skill_fallback_llm.client.request_backend")
+    def test_get_llm_response_context_window(self, request_backend):
+        request_backend.return_value = {"response": "answer"}
+        self.skill.chat_history['window_user'] = \
+            [("window_user", f"q{i}") if i % 2 == 0 else ("llm", f"a{i}")
+             for i in range(10)]
+        self.skill.settings['context_max_turns'] = 2
+        trimmed = self.skill.trimmed_history_entries
+        resp = self.skill._get_llm_response("query", "window_user",
+                                            LLM.FASTCHAT)
+        self.assertEqual(resp, "answer")
+        request_backend.assert_called_once()
+        self.assertEqual(request_backend.call_args.args[:3], (
+            "/llm/fastchat", {"query": "query", "history": [
+                ("window_user", "q6"), ("llm", "a7"),
+                ("window_user", "q8"), ("llm", "a9")]},
+            self.skill.backend_url))
+        self.assertEqual(self.skill.trimmed_history_entries, trimmed + 6)
+        # Full history is retained
+        self.assertEqual(len(self.skill.chat_history['window_user']), 12)
+        self.skill.settings['context_max_turns'] = 0
+
+    def test_speak_llm_response_streaming(self):
+        real_request = self.skill._request_llm
+        self.skill._request_llm = Mock(
+            return_value=iter(["First sentence. Sec", "ond sentence! Th",
+                               "ird"]))
+        self.skill.settings['stream_responses'] = True
+        self.skill.chat_history.pop('stream_user', None)
+        resp = self.skill._speak_llm_response("query", "stream_user",
+                                              LLM.FASTCHAT)
+        self.assertEqual(resp, "First sentence. Second sentence! Third")
+        self.assertEqual([c.args[0] for c in self.skill.speak.call_args_list],
+                         ["First sentence.", "Second sentence!", "Third"])
+        self.assertEqual(self.skill.chat_history['stream_user'],
+                         [("stream_user", "query"), ("llm", resp)])
+
+        # Non-streaming speaks the full response once
+        self.skill.speak.reset_mock()
+        self.skill._request_llm.return_value = iter(["One. Two."])
+        self.skill.settings['stream_responses'] = False
+        self.skill._speak_llm_response("query", "stream_user", LLM.FASTCHAT)
+        self.skill.speak.assert_called_once_with("One. Two.")
+        self.assertEqual(len(self.skill.chat_history['stream_user']), 4)
+
+        self.skill._request_llm = real_request
+
+    def test_get_llm_response_cached(self):
+        from skill_fallback_llm.cache import ResponseCache
+        real_request = self.skill._request_llm
+        self.skill._request_llm = Mock(side_effect=lambda *_: iter(["Paris"]))
+        self.skill._response_cache = ResponseCache()
+        for user in ("cache_user_1", "cache_user_2"):
+            self.skill.chat_history.pop(user, None)
+
+        self.assertEqual(self.skill._get_llm_response(
+            "What is the capital of France?", "cache_user_1", LLM.GPT),
+            "Paris")
+        self.assertEqual(self.skill._get_llm_response(
+            "what is the capital of france", "cache_user_2", LLM.GPT),
+            "Paris")
+        self.skill._request_llm.assert_called_once()
+        self.assertEqual(self.skill._response_cache.hits, 1)
+        self.assertEqual(self.skill.chat_history['cache_user_2'],
+                         [("cache_user_2", "what is the capital of france"),
+                          ("llm", "Paris")])
+
+        # Different LLM is not cached
+        self.skill._get_llm_response("what is the capital of france",
+                                     "cache_user_3", LLM.FASTCHAT)
+        self.assertEqual(self.skill._request_llm.call_count, 2)
+
+        # Requests with history are not cached
+        self.skill._get_llm_response("what is the capital of france",
+                                     "cache_user_1", LLM.GPT)
+        self.assertEqual(self.skill._request_llm.call_count, 3)
+
+        self.skill._response_cache = None
+        self.skill._request_llm = real_request
+
+    @patch("skill_fallback_llm.client.request_backend")
+    def test_request_llm(self, request_backend):
+        request_backend.return_value = {"response": "backend"}
+        self.assertEqual(list(self.skill._request_llm("chatgpt", "hi", [])),
+                         ["backend"])
+        request_backend.assert_called_once()
+        args = request_backend.call_args.args
+        self.assertEqual(args[:3], ("/llm/chatgpt",
+                                    {"query": "hi", "history": []},
+                                    self.skill.backend_url))
+        self.assertLessEqual(args[3], self.skill.request_timeout)
+
+        # Async client is used when configured
+        self.skill._llm_client = Mock()
+        self.skill._llm_client.request_sync.return_value = {"response": ""}
+        self.assertEqual(list(self.skill._request_llm("fastchat", "hi", [])),
+                         [])
+        self.skill._llm_client.request_sync.assert_called_once()
+        args = self.skill._llm_client.request_sync.call_args[0]
+        self.assertEqual(args[:2], ("/llm/fastchat",
+                                    {"query": "hi", "history": []}))
+        self.assertLessEqual(args[2], self.skill.request_timeout)
+        request_backend.assert_called_once()
+        self.skill._llm_client = None
+
+    @patch("skill_fallback_llm.resilience.sleep")
+    @patch("skill_fallback_llm.client.request_backend")
+    def test_request_llm_circuit_breaker(self, request_backend, _):
+        from neon_utils.hana_utils import ServerException
+        from skill_fallback_llm.resilience import CircuitOpenError
+        self.skill.settings['request_retries'] = 1
+        self.skill.settings['fallback_enabled'] = True
+        request_backend.side_effect = ServerException("Error response 503")
+        breaker = self.skill._circuit_breakers["fastchat"]
+        for _ in range(self.skill.circuit_breaker_threshold):
+            with self.assertRaises(ServerException):
+                list(self.skill._request_llm("fastchat", "hi", []))
+        # Each request is retried once
+        self.assertEqual(request_backend.call_count,
+                         2 * self.skill.circuit_breaker_threshold)
+        self.assertTrue(breaker.is_open)
+
+        # Requests fail fast while the circuit is open
+        with self.assertRaises(CircuitOpenError):
+            list(self.skill._request_llm("fastchat", "hi", []))
+        message = Message("test", {"utterance": "what is the meaning of life"},
+                          {"username": "test_user"})
+        self.assertFalse(self.skill.fallback_llm(message))
+        self.assertEqual(request_backend.call_count,
+                         2 * self.skill.circuit_breaker_threshold)
+
+        # Other endpoints are unaffected
+        request_backend.side_effect = None
+        request_backend.return_value = {"response": "ok"}
+        self.assertEqual(list(self.skill._request_llm("chatgpt", "hi", [])),
+                         ["ok"])
+        breaker.record_success()
+        self.assertFalse(breaker.is_open)
+        self.skill.settings['fallback_enabled'] = False
+        self.skill.settings.pop('request_retries')
+
+    def test_handle_get_metrics(self):
+        self.skill._metrics.record("backend.fastchat", 0.5)
+        resp = self.bus.wait_for_response(
+            Message("skill.fallback_llm.metrics"), timeout=5)
+        self.assertIsNotNone(resp)
+        self.assertEqual(resp.msg_type, "skill.fallback_llm.metrics.response")
+        self.assertGreaterEqual(
+            resp.data["latency"]["backend.fastchat"]["count"], 1)
+        self.assertEqual(set(resp.data["circuit_breakers"].keys()),
+                         {"chatgpt", "fastchat"})
+        self.assertIsInstance(resp.data["workers"]["queued"], int)
+
+    def test_fallback_llm_prefilter(self):
+        self.skill.settings['fallback_enabled'] = True
+        self.skill.settings['prefilter_enabled'] = True
+        real_workers = self.skill._workers
+        self.skill._workers = Mock()
+        for utterance in ("", "um", "Hey Neon.", "ok", "a b",
+                          "%$#@ 1234 &*() ab", "the the the the the"):
+            message = Message("test", {"utterance": utterance},
+                              {"username": "filter_user"})
+            self.assertFalse(self.skill.fallback_llm(message), utterance)
+        self.skill._workers.submit.assert_not_called()
+        stats = self.skill._utterance_filter.get_stats()
+        for rule in ("empty", "noise", "too_short", "garbled", "repetitive"):
+            self.assertGreaterEqual(stats[rule], 1, rule)
+
+        message = Message("test", {"utterance": "why is the sky blue"},
+                          {"username": "filter_user"})
+        self.assertTrue(self.skill.fallback_llm(message))
+        self.skill._workers.submit.assert_called_once()
+
+        # Filter may be disabled
+        self.skill.settings['prefilter_enabled'] = False
+        message = Message("test", {"utterance": "ok"},
+                          {"username": "filter_user"})
+        self.assertTrue(self.skill.fallback_llm(message))
+        self.assertEqual(self.skill._workers.submit.call_count, 2)
+
+        self.skill.settings.pop('prefilter_enabled')
+        self.skill._workers = real_workers
+        self.skill.settings['fallback_enabled'] = False
+
+    def test_fallback_llm_busy(self):
+        self.skill.settings['fallback_enabled'] = True
+        real_workers = self.skill._workers
+        self.skill._workers = Mock()
+        self.skill._workers.submit.return_value = False
+        message = Message("test", {"utterance": "what is the meaning of life"},
+                          {"username": "busy_user"})
+        self.assertTrue(self.skill.fallback_llm(message))
+        self.skill._workers.submit.assert_called_once()
+        self.assertEqual(self.skill._workers.submit.call_args[0][0],
+                         "busy_user")
+        self.skill.speak_dialog.assert_called_once_with("llm_busy")
+        self.skill._workers = real_workers
+        self.skill.settings['fallback_enabled'] = False
+
+    def test_rate_limit(self):
+        from skill_fallback_llm.ratelimit import UserRateLimiter
+        self.skill.settings['fallback_enabled'] = True
+        real_workers = self.skill._workers
+        self.skill._workers = Mock()
+        self.skill._workers.get_user_stats.return_value = {}
+        self.skill._rate_limiter = UserRateLimiter(1, burst=1)
+        message = Message("test", {"utterance": "what is the meaning of life"},
+                          {"username": "limited_user"})
+        self.assertTrue(self.skill.fallback_llm(message))
+        self.skill._workers.submit.assert_called_once()
+        self.skill.speak_dialog.assert_not_called()
+        # Requests over the limit are shed before being queued
+        self.assertTrue(self.skill.fallback_llm(message))
+        self.skill._workers.submit.assert_called_once()
+        self.skill.speak_dialog.assert_called_once_with("llm_rate_limited")
+        metrics = self.skill.get_metrics("limited_user")
+        self.assertEqual(metrics["rate_limiter"]["limited_users"],
+                         ["limited_user"])
+        self.assertEqual(metrics["user"]["rate_limit"]["limited"], 1)
+
+        self.skill._rate_limiter = None
+        self.skill._workers = real_workers
+        self.skill.settings['fallback_enabled'] = False
+
+    def test_get_llm_response_compacted(self):
+        from skill_fallback_llm.summarizer import RollingSummarizer, \
+            SUMMARY_QUERY
+        real_request = self.skill._request_llm
+        self.skill._request_llm = Mock(side_effect=lambda *_: iter(["resp"]))
+        summarized = Event()
+
+        def _summarize(endpoint, summary, entries):
+            self.assertEqual(endpoint, "chatgpt")
+            summarized.set()
+            return f"summary of {len(entries)}"
+
+        self.skill._summarizer = RollingSummarizer(_summarize, threshold=6,
+                                                   keep=2)
+        self.skill.chat_history.pop("compact_user", None)
+        for i in range(4):
+            self.skill._get_llm_response(f"q{i}", "compact_user", LLM.GPT)
+        self.assertTrue(summarized.wait(5))
+        self.assertTrue(wait_for(
+            lambda: not self.skill._summarizer.get_stats()["pending"]))
+        self.skill._get_llm_response("q4", "compact_user", LLM.GPT)
+        history = self.skill._request_llm.call_args[0][2]
+        self.assertEqual(history, [("user", SUMMARY_QUERY),
+                                   ("llm", "summary of 6"),
+                                   ("compact_user", "q3"), ("llm", "resp")])
+        # Full history is retained
+        self.assertEqual(len(self.skill.chat_history["compact_user"]), 10)
+
+        # Summary is discarded with the history it summarized
+        del self.skill.chat_history["compact_user"]
+        self.skill._get_llm_response("q5", "compact_user", LLM.GPT)
+        history = self.skill._request_llm.call_args[0][2]
+        self.assertEqual(history, [])
+        self.assertEqual(self.skill._summarizer.get_stats()["summaries"], 0)
+
+        self.skill._summarizer.shutdown()
+        self.skill._summarizer = None
+        self.skill._request_llm = real_request
+
+    @patch("skill_fallback_llm.client.request_backend")
+    def test_request_llm_delta_sessions(self, request_backend):
+        import sys
+        from os.path import dirname
+        from skill_fallback_llm.sessions import DeltaSessions
+        sys.path.append(dirname(__file__))
+        from fake_backend import FakeLLMBackend
+        backend = FakeLLMBackend(latency=0)
+        request_backend.side_effect = backend
+        self.skill._delta_sessions = DeltaSessions()
+        self.skill.chat_history.pop("delta_user", None)
+
+        for i in range(4):
+            self.skill._get_llm_response(f"q{i}", "delta_user", LLM.FASTCHAT)
+        requests = [c.args[1] for c in request_backend.call_args_list]
+        # Sessions start once there is history to send
+        self.assertNotIn("session_id", requests[0])
+        self.assertEqual(len(requests[1]["history"]), 2)
+        self.assertNotIn("history", requests[2])
+        self.assertEqual(requests[2]["turn"], 4)
+        self.assertEqual(requests[3]["turn"], 6)
+        session_id = requests[1]["session_id"]
+        self.assertEqual(len(backend.sessions[session_id]), 8)
+
+        # Full history is re-sent if the backend loses the session
+        backend.sessions.clear()
+        self.skill._get_llm_response("q4", "delta_user", LLM.FASTCHAT)
+        resync = request_backend.call_args_list[-1].args[1]
+        self.assertEqual(len(resync["history"]), 8)
+        self.assertEqual(len(backend.sessions[session_id]), 10)
+        self.assertEqual(self.skill._delta_sessions.get_stats(),
+                         {"sessions": 1, "full_requests": 2,
+                          "delta_requests": 3, "resyncs": 1})
+        self.assertEqual(len(self.skill.chat_history["delta_user"]), 10)
+        self.skill._delta_sessions = None
+
+    def test_speculative_dispatch(self):
+        from skill_fallback_llm.speculative import SpeculativeRequests
+        self.skill.settings['fallback_enabled'] = True
+        real_request = self.skill._request_llm
+        real_workers = self.skill._workers
+        self.skill._request_llm = Mock(side_effect=lambda *_: iter(["resp"]))
+        self.skill._workers = Mock()
+        self.skill._speculative = SpeculativeRequests()
+        self.skill.chat_history.pop("spec_user", None)
+        utterance = "why is the sky blue"
+        context = {"username": "spec_user"}
+
+        # Fallback uses the speculative response
+        self.skill.handle_speculate(Message("recognizer_loop:utterance",
+                                            {"utterances": [utterance]},
+                                            context))
+        self.assertTrue(self.skill.fallback_llm(
+            Message("test", {"utterance": utterance}, context)))
+        func, *args = self.skill._workers.submit.call_args[0][1:]
+        self.assertIsNotNone(args[-1])
+        func(*args)
+        self.skill._request_llm.assert_called_once()
+        self.skill.speak.assert_called_once_with("resp")
+        self.assertEqual(self.skill.chat_history["spec_user"],
+                         [("spec_user", utterance), ("llm", "resp")])
+
+        # Utterance handled by another skill is not added to history
+        self.skill.handle_speculate(Message("recognizer_loop:utterance",
+                                            {"utterances": ["play music"]},
+                                            context))
+        self.skill.handle_utterance_handled(Message("ovos.utterance.handled",
+                                                    {}, context))
+        self.assertEqual(len(self.skill.chat_history["spec_user"]), 2)
+        stats = self.skill.get_metrics()["speculative"]
+        self.assertEqual(stats["started"], 2)
+        self.assertEqual(stats["hits"], 1)
+        self.assertEqual(stats["hit_rate"], 0.5)
+        self.assertEqual(stats["wasted"] + stats["cancelled"], 1)
+
+        # Noise and utterances during a chat session are not speculated on
+        self.skill.settings['prefilter_enabled'] = True
+        filter_stats = self.skill._utterance_filter.get_stats()
+        self.skill.handle_speculate(Message("recognizer_loop:utterance",
+                                            {"utterances": ["um"]}, context))
+        # Speculative checks are not counted in filter stats
+        self.assertEqual(self.skill._utterance_filter.get_stats(),
+                         filter_stats)
+        self.skill.chatting["spec_user"] = (0, LLM.GPT)
+        self.skill.handle_speculate(Message("recognizer_loop:utterance",
+                                            {"utterances": [utterance]},
+                                            context))
+        self.assertEqual(self.skill._speculative.get_stats()["started"], 2)
+
+        self.skill.chatting.pop("spec_user")
+        self.skill.settings.pop('prefilter_enabled')
+        self.skill._speculative.shutdown()
+        self.skill._speculative = None
+        self.skill._workers = real_workers
+        self.skill._request_llm = real_request
+        self.skill.settings['fallback_enabled'] = False
+
+    def test_adaptive_routing(self):
+        from time import sleep
+        from concurrent.futures import ThreadPoolExecutor
+        from threading import Semaphore
+        from skill_fallback_llm.router import LLMRouter
+        # Without routing, only the default LLM handles fallback requests
+        self.assertEqual(self.skill._rank_llms(), [LLM.FASTCHAT])
+        self.skill._router = LLMRouter(explore_every=0, min_samples=1)
+        for _ in range(3):
+            self.skill._router.record("fastchat", 0.05, True)
+            self.skill._router.record("chatgpt", 0.01, True)
+        self.assertEqual(self.skill._rank_llms(), [LLM.GPT, LLM.FASTCHAT])
+        # Explicitly requested LLMs are not routed
+        message = Message("test", {"llm": "fastchat"})
+        self.assertEqual(self.skill._get_requested_llm(message), LLM.FASTCHAT)
+
+        # Slow requests are hedged with a request to the other LLM
+        def _request(endpoint, *_):
+            if endpoint == "fastchat":
+                sleep(1)
+            yield endpoint
+
+        self.skill._router = LLMRouter(min_samples=1)
+        self.skill._router.record("fastchat", 0.05, True)
+        self.skill._router.record("chatgpt", 0.5, True)
+        real_request = self.skill._request_llm
+        self.skill._request_llm = Mock(side_effect=_request)
+        real_slots = self.skill._hedge_slots
+        self.skill._hedge_executor = ThreadPoolExecutor(2)
+        self.skill._hedge_slots = Semaphore(2)
+        self.assertEqual("".join(self.skill._request_hedged(
+            "fastchat", "chatgpt", "q", [])), "chatgpt")
+        self.assertEqual("".join(self.skill._request_hedged(
+            "chatgpt", "fastchat", "q", [])), "chatgpt")
+        stats = self.skill.get_metrics()["router"]
+        self.assertEqual((stats["hedged"], stats["hedge_wins"]), (1, 1))
+
+        # While losing requests hold the executor, requests are not hedged
+        # and run on the calling thread
+        self.assertTrue(wait_for(lambda: self.skill._hedge_slots._value))
+        self.skill._hedge_slots.acquire()
+        self.assertEqual("".join(self.skill._request_hedged(
+            "fastchat", "chatgpt", "q", [])), "fastchat")
+        self.skill._hedge_slots.acquire()
+        started = monotonic()
+        self.assertEqual("".join(self.skill._request_hedged(
+            "fastchat", "chatgpt", "q", [])), "fastchat")
+        self.assertGreaterEqual(monotonic() - started, 1)
+        stats = self.skill.get_metrics()["router"]
+        self.assertEqual(stats["hedged"], 1)
+        self.assertEqual(stats["hedges_skipped"], 2)
+
+        self.skill._hedge_slots = real_slots
+        self.skill._hedge_executor.shutdown()
+        self.skill._hedge_executor = None
+        self.skill._request_llm = real_request
+        self.skill._router = None
+
     def test_converse(self):
-        # TODO
-        pass
+        real_stop_chatting = self.skill._stop_chatting
+        real_workers = self.skill._workers
+        self.skill._stop_chatting = Mock()
+        self.skill._workers = Mock()
+        self.skill._workers.submit.return_value = True
+        message = Message("test", {"utterances": ["tell me a joke"]},
+                          {"username": "converse_user"})
+
+        # Not chatting
+        self.skill.chatting.pop("converse_user", None)
+        self.assertFalse(self.skill.converse(message))
+        self.skill._workers.submit.assert_not_called()
+
+        # Chat expired
+        self.skill.chatting["converse_user"] = (0, LLM.GPT)
+        self.assertFalse(self.skill.converse(message))
+        self.skill._stop_chatting.assert_called_once_with(message)
+        self.skill._workers.submit.assert_not_called()
+
+        # Active chat
+        from time import time
+        self.skill.chatting["converse_user"] = (time(), LLM.GPT)
+        self.assertTrue(self.skill.converse(message))
+        self.skill._workers.submit.assert_called_once()
+        args = self.skill._workers.submit.call_args[0]
+        self.assertEqual(args[:5], ("converse_user",
+                                    self.skill._threaded_converse,
+                                    "tell me a joke", "converse_user",
+                                    LLM.GPT))
+
+        # Exit chat
+        message.data["utterances"] = ["goodbye"]
+        self.assertTrue(self.skill.converse(message))
+        self.assertEqual(self.skill._stop_chatting.call_count, 2)
+        self.skill._workers.submit.assert_called_once()
+
+        self.skill._stop_chatting = real_stop_chatting
+        self.skill._workers = real_workers
+        self.skill.chatting.pop("converse_user", None)
+
+    def test_converse_queued_after_exit(self):
+        from time import time
+        from skill_fallback_llm.workers import UserWorkQueue
+        real_speak_response = self.skill._speak_llm_response
+        real_workers = self.skill._workers
+        self.skill._speak_llm_response = Mock(return_value="response")
+        self.skill._workers = UserWorkQueue(max_workers=1)
+        release = Event()
+        self.skill._workers.submit("busy_user", release.wait, 5)
+        self.skill.chatting["converse_user"] = (time(), LLM.FASTCHAT)
+        context = {"username": "converse_user"}
+
+        # A turn waiting for a worker is handled after the chat ends
+        self.assertTrue(self.skill.converse(Message(
+            "test", {"utterances": ["tell me a joke"]}, context)))
+        self.assertTrue(self.skill.converse(Message(
+            "test", {"utterances": ["goodbye"]}, context)))
+        self.assertNotIn("converse_user", self.skill.chatting)
+        release.set()
+        self.assertTrue(wait_for(
+            lambda: self.skill._workers.get_stats()["completed"] == 2))
+        self.skill._workers.shutdown()
+        self.skill._speak_llm_response.assert_called_once_with(
+            "tell me a joke", "converse_user", LLM.FASTCHAT)
+        dialogs = [call.args[0] for call in
+                   self.skill.speak_dialog.call_args_list]
+        self.assertNotIn("no_chatgpt", dialogs)
+        self.assertNotIn("converse_user", self.skill.chatting)
+
+        self.skill._speak_llm_response = real_speak_response
+        self.skill._workers = real_workers
 
     def test_threaded_converse(self):
-        # TODO
-        pass
+        real_speak_response = self.skill._speak_llm_response
+        real_reset_expiration = self.skill._reset_expiration
+        self.skill._speak_llm_response = Mock(return_value="response")
+        self.skill._reset_expiration = Mock()
+        self.skill.chatting["converse_user"] = (0, LLM.FASTCHAT)
+
+        self.skill._threaded_converse("hello", "converse_user", LLM.FASTCHAT)
+        self.skill._speak_llm_response.assert_called_once_with(
+            "hello", "converse_user", LLM.FASTCHAT)
+        self.skill._reset_expiration.assert_called_once_with(
+            "converse_user", LLM.FASTCHAT)
+        self.skill.speak_dialog.assert_not_called()
+
+        # Error getting a response
+        self.skill._speak_llm_response.side_effect = Exception()
+        self.skill._threaded_converse("hello", "converse_user", LLM.FASTCHAT)
+        self.skill.speak_dialog.assert_called_once_with("no_chatgpt")
+        self.skill._reset_expiration.assert_called_once()
+
+        # Session ended while the response was spoken
+        self.skill._speak_llm_response.side_effect = \
+            lambda *_: self.skill.chatting.pop("converse_user")
+        self.skill._threaded_converse("goodbye", "converse_user",
+                                      LLM.FASTCHAT)
+        self.skill._reset_expiration.assert_called_once()
+        self.assertNotIn("converse_user", self.skill.chatting)
+
+        self.skill._speak_llm_response = real_speak_response
+        self.skill._reset_expiration = real_reset_expiration
+        self.skill.chatting.pop("converse_user", None)
 
     def test_reset_expiration(self):
-        # TODO
-        pass
+        self.skill._reset_expiration("expire_user", LLM.GPT)
+        timestamp, llm = self.skill.chatting["expire_user"]
+        self.assertIsInstance(timestamp, float)
+        self.assertEqual(llm, LLM.GPT)
+        self.skill._reset_expiration("expire_user", LLM.FASTCHAT)
+        self.assertEqual(self.skill.chatting["expire_user"][1], LLM.FASTCHAT)
+        self.assertGreaterEqual(self.skill.chatting["expire_user"][0],
+                                timestamp)
+        self.skill.chatting.pop("expire_user")
 
     def test_stop_chatting(self):
-        # TODO
-        pass
+        self.skill._reset_expiration("stop_user", LLM.GPT)
+        self.skill._stop_chatting(Message("test", {},
+                                          {"username": "stop_user"}))
+        self.assertNotIn("stop_user", self.skill.chatting)
+        self.skill.speak_dialog.assert_called_once_with("end_chat")
+
+    def test_end_expired_chats(self):
+        from time import time
+        self.skill.settings['chat_timeout_seconds'] = 300
+        self.skill.chatting["expired_user"] = (time() - 301, LLM.GPT)
+        self.skill._reset_expiration("active_user", LLM.GPT)
+        self.skill._end_expired_chats()
+        self.assertNotIn("expired_user", self.skill.chatting)
+        self.assertIn("active_user", self.skill.chatting)
+        self.skill.speak_dialog.assert_called_once_with("end_chat")
+        self.skill._stop_chatting(Message("test", {},
+                                          {"username": "active_user"}))
 
     def test_send_email(self):
         # TODO
         pass
 
+    def test_send_chat_history_email(self):
+        fake_mq = FakeEmailService(failures=1)
+        self.skill._email_queue._retry_seconds = 0.01
+        self.skill.chat_history["email_user"] = [
+            ("email_user", "hello"), ("llm", "line one\n\nline two")]
+        with patch("neon_mq_connector.utils.client_utils.send_mq_request",
+                   fake_mq):
+            self.skill._send_email("email_user", "user@example.com")
+            self.assertTrue(self.skill._email_queue.flush(5))
+        # First attempt fails and is retried
+        self.assertEqual(len(fake_mq.requests), 2)
+        self.assertEqual(fake_mq.requests[-1], {
+            "recipient": "user@example.com",
+            "subject": "LLM Conversation",
+            "body": "[email_user] hello\n[llm] line one\n\t...line two\n",
+            "attachments": None})
+        self.assertEqual(self.skill.get_metrics()["emails"]["retries"], 1)
+        self.skill._email_queue._retry_seconds = 10
+
+
+class FakeEmailService:
+    """
+    Stands in for `send_mq_request` to the email service
+    """
+    def __init__(self, failures: int = 0):
+        self.failures = failures
+        self.requests = list()
+
+    def __call__(self, vhost, request_data, target_queue, *args, **kwargs):
+        assert (vhost, target_queue) == ("/neon_emails", "neon_emails_input")
+        self.requests.append(request_data)
+        if self.failures:
+            self.failures -= 1
+            return {}
+        return {"success": True}
+
+
+class TestHistory(unittest.TestCase):
+    def test_get_context_window(self):
+        from skill_fallback_llm.history import get_context_window
+        history = [("user", "q1"), ("llm", "a1"), ("user", "q2"),
+                   ("llm", "a2"), ("user", "q3"), ("llm", "a3")]
+
+        # No limits
+        self.assertEqual(get_context_window(history), (history, 0))
+
+        # Turn limit
+        window, trimmed = get_context_window(history, max_turns=2)
+        self.assertEqual(window, history[2:])
+        self.assertEqual(trimmed, 2)
+
+        # Token limit does not split a query from its response
+        window, trimmed = get_context_window(history, max_tokens=3)
+        self.assertEqual(window, history[-2:])
+        self.assertEqual(trimmed, 4)
+
+        # Budget smaller than any entry
+        self.assertEqual(get_context_window(history, max_tokens=1), ([], 6))
+
+    def test_turn(self):
+        from sys import getsizeof
+        from skill_fallback_llm.history import Turn, to_payload
+        turn = Turn("".join(["us", "er"]), "hello", "GPT", timestamp=10)
+        # Speaker and LLM names are shared between turns
+        self.assertIs(turn.speaker, Turn("user", "hi").speaker)
+        self.assertIs(turn.llm, Turn("llm", "hi", "".join(["G", "PT"])).llm)
+        # Turns behave like (speaker, text) tuples
+        speaker, text = turn
+        self.assertEqual((speaker, text), ("user", "hello"))
+        self.assertEqual(turn[1], "hello")
+        self.assertEqual(turn, ("user", "hello"))
+        self.assertEqual(tuple(turn), ("user", "hello"))
+        self.assertEqual(turn.timestamp, 10)
+        self.assertGreater(Turn("user", "x" * 100).size, turn.size)
+        # The timestamp object is counted
+        turn = Turn("user", "hello")
+        self.assertEqual(turn.size, getsizeof(turn) + getsizeof(turn.text) +
+                         getsizeof(turn.timestamp))
+        self.assertEqual(to_payload([turn, ("llm", "hi")]),
+                         [("user", "hello"), ("llm", "hi")])
+
+    def test_chat_history_max_bytes(self):
+        from skill_fallback_llm.history import ChatHistory, Turn
+        turn_size = Turn("user", "x" * 100).size
+        dropped = list()
+        history = ChatHistory(max_bytes=turn_size * 5, on_drop=dropped.append)
+        history.append("user_1", ("user_1", "x" * 100), ("llm", "x" * 100))
+        history.append("user_2", ("user_2", "x" * 100), ("llm", "x" * 100))
+        self.assertEqual(history.size, turn_size * 4)
+        self.assertEqual(history.user_size("user_1"), turn_size * 2)
+        # Least recently active users are removed first
+        history.append("user_2", ("user_2", "x" * 100), ("llm", "x" * 100))
+        self.assertNotIn("user_1", history)
+        self.assertEqual(history.dropped_entries, 2)
+        self.assertEqual(dropped, ["user_1"])
+        # The active user's oldest exchanges are dropped last
+        history.append("user_2", ("user_2", "x" * 100), ("llm", "x" * 100))
+        self.assertEqual(len(history["user_2"]), 4)
+        self.assertEqual(history.count("user_2"), 6)
+        self.assertLessEqual(history.size, turn_size * 5)
+        del history["user_2"]
+        self.assertEqual(history.size, 0)
+        self.assertEqual(dropped, ["user_1", "user_2"])
+
+    def test_chat_history_memory(self):
+        from skill_fallback_llm.history import ChatHistory
+        history = ChatHistory()
+        self.assertNotIn("user", history)
+        history.append("user", ("user", "q1"), ("llm", "a1"))
+        self.assertEqual(history["user"], [("user", "q1"), ("llm", "a1")])
+        self.assertEqual(history.get_full("user"), history["user"])
+        history["other"] = [("other", "q")]
+        self.assertEqual(set(history), {"user", "other"})
+        del history["other"]
+        self.assertEqual(len(history), 1)
+        # In-memory history is never evicted
+        history.evict_idle()
+        self.assertIn("user", history)
+
+    @patch("skill_fallback_llm.history.monotonic")
+    def test_chat_history_sqlite(self, monotonic):
+        from os.path import join
+        from tempfile import mkdtemp
+        from skill_fallback_llm.history import ChatHistory, \
+            SQLiteHistoryStore
+        monotonic.return_value = 0
+        path = join(mkdtemp(), "history.sqlite")
+        history = ChatHistory(SQLiteHistoryStore(path), max_users=2,
+                              max_entries=4, idle_seconds=60)
+        for i in range(3):
+            history.append("user_1", ("user_1", f"q{i}"), ("llm", f"a{i}"))
+        # Only recent entries are kept in memory
+        self.assertEqual(history["user_1"], [("user_1", "q1"), ("llm", "a1"),
+                                             ("user_1", "q2"), ("llm", "a2")])
+        self.assertEqual(len(history.get_full("user_1")), 6)
+
+        # Least recently used users are evicted
+        history.append("user_2", ("user_2", "q"), ("llm", "a"))
+        history.append("user_3", ("user_3", "q"), ("llm", "a"))
+        self.assertEqual(history.cached_users, 2)
+        self.assertEqual(history.evictions, 1)
+        # Evicted users are loaded from the store on access
+        self.assertIn("user_1", history)
+        self.assertEqual(len(history["user_1"]), 4)
+        self.assertEqual(history.loads, 1)
+
+        # Idle users are evicted
+        monotonic.return_value = 61
+        history.evict_idle()
+        self.assertEqual(history.cached_users, 0)
+        history.close()
+
+        # History persists across instances
+        history = ChatHistory(SQLiteHistoryStore(path))
+        self.assertEqual(set(history), {"user_1", "user_2", "user_3"})
+        self.assertEqual(history.get_full("user_2"),
+                         [("user_2", "q"), ("llm", "a")])
+        history["user_2"] = [("user_2", "new")]
+        self.assertEqual(history.get_full("user_2"), [("user_2", "new")])
+        del history["user_3"]
+        self.assertNotIn("user_3", history)
+        with self.assertRaises(KeyError):
+            history["user_3"]
+        history.close()
+
+    def test_chat_history_store_locking(self):
+        from os.path import join
+        from tempfile import mkdtemp
+        from threading import Event, Thread
+        from skill_fallback_llm.history import ChatHistory, SQLiteHistoryStore
+        loading = Event()
+        release = Event()
+        loads = list()
+
+        class _SlowStore(SQLiteHistoryStore):
+            def load(self, user, limit=None):
+                loads.append(user)
+                if user == "slow":
+                    loading.set()
+                    release.wait(5)
+                return super().load(user, limit)
+
+        history = ChatHistory(_SlowStore(join(mkdtemp(), "history.sqlite")))
+        # Users without history are only looked up in the store once
+        self.assertEqual(history.count("nobody"), 0)
+        self.assertNotIn("nobody", history)
+        with self.assertRaises(KeyError):
+            history["nobody"]
+        self.assertEqual(loads, ["nobody"])
+        history.append("nobody", ("nobody", "q"), ("llm", "a"))
+        self.assertEqual(history.count("nobody"), 2)
+
+        # Store I/O for one user does not block cached history of others
+        fast = next(f"user_{i}" for i in range(100)
+                    if history._user_lock(f"user_{i}") is not
+                    history._user_lock("slow"))
+        history.append(fast, (fast, "q"), ("llm", "a"))
+        thread = Thread(target=history.count, args=("slow",))
+        thread.start()
+        self.assertTrue(loading.wait(5))
+        started = monotonic()
+        self.assertEqual(len(history[fast]), 2)
+        history.append(fast, (fast, "q2"), ("llm", "a2"))
+        self.assertEqual(history.count(fast), 4)
+        self.assertLess(monotonic() - started, 1)
+        release.set()
+        thread.join(5)
+        self.assertNotIn("slow", history)
+        history.close()
+
+    def test_sqlite_history_store_migration(self):
+        import sqlite3
+        from os.path import join
+        from tempfile import mkdtemp
+        from skill_fallback_llm.history import SQLiteHistoryStore, Turn
+        path = join(mkdtemp(), "history.sqlite")
+        db = sqlite3.connect(path)
+        db.execute("CREATE TABLE history (id INTEGER PRIMARY KEY "
+                   "AUTOINCREMENT, user TEXT NOT NULL, speaker TEXT NOT NULL, "
+                   "text TEXT NOT NULL)")
+        db.execute("INSERT INTO history (user, speaker, text) "
+                   "VALUES ('user', 'user', 'old')")
+        db.commit()
+        db.close()
+        store = SQLiteHistoryStore(path)
+        store.append("user", [Turn("llm", "new", "GPT", timestamp=10)])
+        old, new = store.load("user")
+        self.assertEqual(old, ("user", "old"))
+        self.assertIsNone(old.llm)
+        self.assertEqual((new.llm, new.timestamp), ("GPT", 10))
+        store.close()
+
+    def test_shared_chat_history(self):
+        from os.path import join
+        from tempfile import mkdtemp
+        from skill_fallback_llm.history import ChatHistory, HistoryStore, \
+            SQLiteHistoryStore
+        path = join(mkdtemp(), "history.sqlite")
+        first = ChatHistory(SQLiteHistoryStore(path), shared=True)
+        second = ChatHistory(SQLiteHistoryStore(path), shared=True)
+        first.append("user", ("user", "q1"), ("llm", "a1"))
+        self.assertEqual(second["user"], [("user", "q1"), ("llm", "a1")])
+        # Own writes are applied to the cache without reloading
+        loads = second.loads
+        second.append("user", ("user", "q2"), ("llm", "a2"))
+        self.assertEqual(second.count("user"), 4)
+        self.assertEqual(second.loads, loads)
+        # Writes by another instance invalidate the cached history
+        self.assertEqual(first.count("user"), 4)
+        self.assertEqual(first["user"][-1], ("llm", "a2"))
+        self.assertEqual(first.invalidations, 1)
+        # An append on top of a stale cache is stored and reloaded
+        second.append("user", ("user", "q3"), ("llm", "a3"))
+        first.append("user", ("user", "q4"), ("llm", "a4"))
+        self.assertEqual(first.count("user"), 8)
+        self.assertEqual(first["user"], second["user"])
+        self.assertEqual(len(first.get_full("user")), 8)
+        del second["user"]
+        self.assertNotIn("user", first)
+        with self.assertRaises(KeyError):
+            first["user"]
+        with self.assertRaises(ValueError):
+            ChatHistory(shared=True)
+
+        class _UnversionedStore(SQLiteHistoryStore):
+            version = HistoryStore.version
+
+        # Stores without versioning are rejected up front
+        with self.assertRaises(ValueError):
+            ChatHistory(_UnversionedStore(join(mkdtemp(), "h.sqlite")),
+                        shared=True)
+        first.close()
+        second.close()
+
+
+class TestExpiry(unittest.TestCase):
+    def test_session_expiry(self):
+        from skill_fallback_llm.expiry import SessionExpiry
+        sessions = SessionExpiry()
+        sessions.touch("a", 100)
+        sessions.touch("b", 110)
+        sessions.touch("c", 120)
+        # Refreshing moves a session to the back
+        sessions.touch("a", 130)
+        self.assertEqual(len(sessions), 3)
+        self.assertEqual(sessions.pop_expired(10, now=125), ["b"])
+        self.assertEqual(sessions.pop_expired(10, now=125), [])
+        sessions.remove("c")
+        self.assertNotIn("c", sessions)
+        self.assertEqual(sessions.pop_expired(10, now=200), ["a"])
+        self.assertEqual(len(sessions), 0)
+
+    def test_memory_session_store(self):
+        from skill_fallback_llm.session_store import MemorySessionStore
+        sessions = MemorySessionStore()
+        sessions["a"] = (100, "GPT")
+        sessions["b"] = (110, "FastChat")
+        sessions["a"] = (120, "FastChat")
+        self.assertEqual(sessions["a"], (120, "FastChat"))
+        self.assertEqual(sessions.pop_expired(5, now=120), ["b"])
+        self.assertEqual(dict(sessions), {"a": (120, "FastChat")})
+        sessions.pop("a")
+        self.assertEqual(sessions.pop_expired(5, now=200), [])
+
+    def test_sqlite_session_store(self):
+        from os.path import join
+        from tempfile import mkdtemp
+        from skill_fallback_llm.session_store import SQLiteSessionStore
+        path = join(mkdtemp(), "sessions.sqlite")
+        first = SQLiteSessionStore(path, decode=str.upper)
+        second = SQLiteSessionStore(path, decode=str.upper)
+        first["a"] = (100, "gpt")
+        second["b"] = (110, "fastchat")
+        self.assertEqual(second["a"], (100, "GPT"))
+        self.assertIn("b", first)
+        self.assertEqual(sorted(first), ["a", "b"])
+        second["a"] = (120, "gpt")
+        self.assertEqual(first["a"][0], 120)
+        # Each expired session is claimed by exactly one instance
+        self.assertEqual(first.pop_expired(5, now=120), ["b"])
+        self.assertEqual(second.pop_expired(5, now=120), [])
+        self.assertEqual(second.pop_expired(5, now=200), ["a"])
+        self.assertEqual(len(first), 0)
+        with self.assertRaises(KeyError):
+            del first["a"]
+        first.close()
+        second.close()
+
+
+class TestTranscript(unittest.TestCase):
+    def test_render_transcript(self):
+        from skill_fallback_llm.transcript import render_transcript
+        entries = [("user", "a < b?"), ("llm", "yes\n\nit is")]
+        self.assertEqual(render_transcript(entries),
+                         "[user] a < b?\n[llm] yes\n\t...it is\n")
+        self.assertEqual(render_transcript(entries, "html"),
+                         "<p><b>[user]</b> a &lt; b?</p>\n"
+                         "<p><b>[llm]</b> yes<br>it is</p>\n")
+        with self.assertRaises(ValueError):
+            render_transcript(entries, "pdf")
+
+    def test_split_transcript(self):
+        from base64 import b64decode
+        from skill_fallback_llm.transcript import split_transcript
+        entries = [("user", f"query {i}") for i in range(10)]
+        # Each line is 15 bytes
+        body, attachments = split_transcript(entries)
+        self.assertEqual(len(body), 150)
+        self.assertEqual(attachments, {})
+        body, attachments = split_transcript(entries, max_part_bytes=50)
+        self.assertEqual(body, "[user] query 0\n[user] query 1\n"
+                               "[user] query 2\n")
+        self.assertEqual(list(attachments), ["chat_history_2.txt",
+                                             "chat_history_3.txt",
+                                             "chat_history_4.txt"])
+        self.assertEqual(b64decode(attachments["chat_history_4.txt"]),
+                         b"[user] query 9\n")
+        _, attachments = split_transcript(entries, "html", 100)
+        html = b64decode(attachments["chat_history_2.html"])
+        self.assertTrue(html.startswith(b"<html><body>"))
+        self.assertIn(b"query 3", html)
+
+
+class TestEmails(unittest.TestCase):
+    def test_email_queue(self):
+        from skill_fallback_llm.emails import EmailQueue
+        sent = list()
+        release = Event()
+
+        def _send(request):
+            release.wait(5)
+            sent.append(request)
+            return request.get("ok", True)
+
+        queue = EmailQueue(_send, max_retries=1, retry_seconds=0.01,
+                           max_queued=2)
+        self.assertTrue(queue.submit("a", lambda: {"id": 1}))
+        # Wait for the first email to be taken by the sender
+        self.assertTrue(wait_for(
+            lambda: not queue.get_stats()["queued"]))
+        # Emails queued while sending are batched; same key replaces
+        self.assertTrue(queue.submit("b", lambda: {"id": 2}))
+        self.assertTrue(queue.submit("b", lambda: {"id": 3}))
+        self.assertTrue(queue.submit("c", lambda: {"id": 4, "ok": False}))
+        self.assertFalse(queue.submit("d", lambda: {"id": 5}))
+        release.set()
+        self.assertTrue(queue.flush(5))
+        self.assertEqual([request["id"] for request in sent], [1, 3, 4, 4])
+        stats = queue.get_stats()
+        self.assertEqual(stats["batches"], 3)
+        self.assertEqual(stats["sent"], 2)
+        self.assertEqual(stats["failed"], 1)
+        self.assertEqual(stats["retries"], 1)
+        self.assertEqual(stats["replaced"], 1)
+        self.assertEqual(stats["rejected"], 1)
+        queue.shutdown(1)
+        self.assertFalse(queue.submit("e", lambda: {"id": 6}))
+
+
+class TestPrefilter(unittest.TestCase):
+    def test_utterance_filter(self):
+        from skill_fallback_llm.prefilter import UtteranceFilter
+        utterance_filter = UtteranceFilter()
+        noise = {"hey neon", "um"}
+        self.assertEqual(utterance_filter.check("  "), "empty")
+        self.assertEqual(utterance_filter.check("a b"), "too_short")
+        self.assertEqual(utterance_filter.check("Um?", noise), "noise")
+        self.assertEqual(utterance_filter.check("hey, neon", noise), "noise")
+        self.assertEqual(utterance_filter.check("%$#@ 1234 &*() ab"),
+                         "garbled")
+        self.assertEqual(utterance_filter.check("go go go go go"),
+                         "repetitive")
+        self.assertIsNone(utterance_filter.check("what is 2 plus 2", noise))
+        self.assertEqual(utterance_filter.get_stats(),
+                         {"passed": 1, "empty": 1, "too_short": 1,
+                          "noise": 2, "garbled": 1, "repetitive": 1})
+        # Uncounted checks don't change stats
+        self.assertEqual(utterance_filter.check("  ", count=False), "empty")
+        self.assertEqual(utterance_filter.get_stats()["empty"], 1)
+        # Short questions, arithmetic, and unspaced languages are valid
+        for utterance in ("Photosynthesis", "Why?", "what is 1234 + 5678",
+                          "what's 12*34", "what is 20% of 50",
+                          "what is pi to 10 digits 3.1415926535",
+                          "天空为什么是蓝色的"):
+            self.assertIsNone(utterance_filter.check(utterance), utterance)
+        self.assertEqual(UtteranceFilter(min_words=2).check("photosynthesis"),
+                         "too_short")
+        self.assertIsNone(UtteranceFilter(min_words=2).check("为什么"))
+
+
+class TestSummarizer(unittest.TestCase):
+    def test_build_summary_prompt(self):
+        from skill_fallback_llm.summarizer import build_summary_prompt
+        entries = [("user", "hi"), ("llm", "hello")]
+        prompt = build_summary_prompt(None, entries)
+        self.assertIn("[user] hi\n[llm] hello", prompt)
+        prompt = build_summary_prompt("We said hi", entries)
+        self.assertIn("We said hi", prompt)
+        self.assertIn("[user] hi\n[llm] hello", prompt)
+
+    def test_rolling_summarizer(self):
+        from skill_fallback_llm.summarizer import RollingSummarizer
+        calls = list()
+        done = Event()
+
+        def _summarize(endpoint, summary, entries):
+            calls.append((summary, list(entries)))
+            done.set()
+            return f"{summary or ''}+{len(entries)}"
+
+        summarizer = RollingSummarizer(_summarize, threshold=4, keep=2)
+        entries = [("user", f"q{i // 2}") if i % 2 == 0 else
+                   ("llm", f"a{i // 2}") for i in range(6)]
+        self.assertEqual(summarizer.get_context("user", entries, 6),
+                         ([], entries))
+        self.assertFalse(summarizer.maybe_compact("ep", "user",
+                                                  entries[:4], 4))
+        self.assertTrue(summarizer.maybe_compact("ep", "user", entries, 6))
+        self.assertTrue(done.wait(5))
+        self.assertTrue(wait_for(
+            lambda: not summarizer.get_stats()["pending"]))
+        self.assertEqual(calls, [(None, entries[:4])])
+        summary, recent = summarizer.get_context("user", entries, 6)
+        self.assertEqual(summary[1], ("llm", "+4"))
+        self.assertEqual(recent, entries[4:])
+
+        # Only entries not yet summarized are folded in
+        done.clear()
+        entries += [("user", "q3"), ("llm", "a3"), ("user", "q4"),
+                    ("llm", "a4")]
+        # Older entries may not be held in memory
+        self.assertTrue(summarizer.maybe_compact("ep", "user",
+                                                 entries[2:], 10))
+        self.assertTrue(done.wait(5))
+        self.assertTrue(wait_for(
+            lambda: not summarizer.get_stats()["pending"]))
+        self.assertEqual(calls[1], ("+4", entries[4:8]))
+        summary, recent = summarizer.get_context("user", entries[6:], 10)
+        self.assertEqual(summary[1], ("llm", "+4+4"))
+        self.assertEqual(recent, entries[8:])
+        self.assertEqual(summarizer.get_stats()["compactions"], 2)
+
+        # A summary of more entries than the history now has is discarded
+        self.assertEqual(summarizer.get_context("user", entries[:2], 2),
+                         ([], entries[:2]))
+        self.assertEqual(summarizer.get_stats()["summaries"], 0)
+        summarizer.shutdown()
+
+    def test_rolling_summarizer_reset(self):
+        from skill_fallback_llm.summarizer import RollingSummarizer
+        release = Event()
+
+        def _summarize(endpoint, summary, entries):
+            release.wait(5)
+            return "summary"
+
+        summarizer = RollingSummarizer(_summarize, threshold=2, keep=2,
+                                       max_users=2)
+        entries = [("user", "q"), ("llm", "a")] * 2
+        for user in ("a", "b", "c"):
+            self.assertTrue(summarizer.maybe_compact("ep", user, entries, 4))
+        release.set()
+        self.assertTrue(wait_for(
+            lambda: not summarizer.get_stats()["pending"]))
+        # Least recently summarized users are removed first
+        self.assertEqual(summarizer.get_stats()["summaries"], 2)
+        self.assertEqual(summarizer.get_context("a", entries, 4)[0], [])
+        self.assertTrue(summarizer.get_context("c", entries, 4)[0])
+
+        # A compaction finishing after a reset does not restore the summary
+        release.clear()
+        self.assertTrue(summarizer.maybe_compact("ep", "d", entries, 4))
+        summarizer.reset("d")
+        release.set()
+        self.assertTrue(wait_for(
+            lambda: not summarizer.get_stats()["pending"]))
+        self.assertEqual(summarizer.get_context("d", entries, 4)[0], [])
+        summarizer.shutdown()
+
+
+class TestSpeculative(unittest.TestCase):
+    def test_speculative_requests(self):
+        from skill_fallback_llm.speculative import SpeculativeRequests
+        requests = SpeculativeRequests(max_in_flight=1, ttl=30)
+        release = Event()
+
+        def _blocking():
+            release.wait(5)
+            return 0, "blocked"
+
+        # Only `max_in_flight` requests run at once
+        self.assertTrue(requests.start("a", "k1", _blocking))
+        self.assertFalse(requests.start("b", "k2", lambda: (0, "b")))
+        self.assertEqual(requests.get_stats()["skipped"], 1)
+        release.set()
+
+        # Claimed speculations must match the utterance and history
+        self.assertIsNone(requests.take("a", "other"))
+        speculation = requests.take("a", "k1")
+        self.assertIsNone(requests.take("a", "k1"))
+        self.assertEqual(requests.get_result(speculation, 0, 5), "blocked")
+        self.assertTrue(wait_for(
+            lambda: not requests.get_stats()["in_flight"]))
+        self.assertTrue(requests.start("a", "k2", lambda: (0, "stale")))
+        self.assertIsNone(requests.get_result(requests.take("a", "k2"), 2, 5))
+
+        # Replaced and expired speculations are discarded
+        self.assertTrue(requests.start("a", "k3", lambda: (0, "c")))
+        self.assertTrue(wait_for(
+            lambda: not requests.get_stats()["in_flight"]))
+        self.assertTrue(requests.start("a", "k4", lambda: (0, "d")))
+        with patch("skill_fallback_llm.speculative.monotonic") as monotonic:
+            from time import monotonic as now
+            monotonic.return_value = now() + 60
+            self.assertIn("a", requests.expire())
+        stats = requests.get_stats()
+        self.assertEqual(stats["pending"], 0)
+        self.assertEqual(stats["hits"], 1)
+        self.assertEqual(stats["stale"], 1)
+        self.assertEqual(stats["wasted"] + stats["cancelled"], 3)
+        requests.shutdown()
+
+
+class TestStartup(unittest.TestCase):
+    def test_deferred_imports(self):
+        import subprocess
+        import sys
+        deferred = ("neon_utils.hana_utils", "neon_utils.user_utils",
+                    "neon_mq_connector.utils.client_utils")
+        script = (f"import sys, skill_fallback_llm\n"
+                  f"print([m for m in {deferred!r} if m in sys.modules])")
+        proc = subprocess.run([sys.executable, "-c", script],
+                              capture_output=True, text=True, check=True)
+        self.assertEqual(proc.stdout.strip(), "[]")
+
+
+class TestRouter(unittest.TestCase):
+    def test_llm_router(self):
+        from skill_fallback_llm.router import LLMRouter
+        router = LLMRouter(alpha=0.5, explore_every=0, min_samples=2)
+        # Unmeasured endpoints are tried first
+        router.record("a", 1.0, True)
+        self.assertEqual(router.rank(["a", "b"]), ["b", "a"])
+        router.record("b", 2.0, True)
+        self.assertEqual(router.rank(["a", "b"]), ["a", "b"])
+        # Moving averages follow changes in latency
+        router.record("a", 4.0, True)
+        self.assertEqual(router.get_stats()["endpoints"]["a"]["latency"], 2.5)
+        self.assertEqual(router.rank(["a", "b"]), ["b", "a"])
+        # Unhealthy endpoints are ranked last
+        router.record("b", 0.0, False)
+        router.record("b", 0.0, False)
+        self.assertEqual(router.rank(["a", "b"]), ["a", "b"])
+
+        # Hedging requires enough samples
+        self.assertIsNone(router.hedge_delay("c"))
+        router.record("c", 1.0, True)
+        self.assertIsNone(router.hedge_delay("c"))
+        router.record("c", 1.0, True)
+        self.assertAlmostEqual(router.hedge_delay("c"), 1.0, delta=0.2)
+
+        # Rankings are periodically reversed to measure other endpoints
+        router = LLMRouter(explore_every=2)
+        router.record("a", 1.0, True)
+        router.record("b", 2.0, True)
+        self.assertEqual(router.rank(["a", "b"]), ["a", "b"])
+        self.assertEqual(router.rank(["a", "b"]), ["b", "a"])
+        self.assertEqual(router.get_stats()["explored"], 1)
+
+
+class TestStreaming(unittest.TestCase):
+    def test_sentence_segmenter(self):
+        from skill_fallback_llm.streaming import SentenceSegmenter
+        segmenter = SentenceSegmenter()
+        self.assertEqual(segmenter.feed("Hello there"), [])
+        self.assertEqual(segmenter.feed(". It costs 3.5"), ["Hello there."])
+        self.assertEqual(segmenter.feed(" dollars? Yes\n\nNext"),
+                         ["It costs 3.5 dollars?", "Yes"])
+        self.assertEqual(segmenter.flush(), "Next")
+        self.assertIsNone(segmenter.flush())
+
+
+class TestCache(unittest.TestCase):
+    def test_normalize_utterance(self):
+        from skill_fallback_llm.cache import normalize_utterance
+        self.assertEqual(normalize_utterance("  What's an LLM?  "),
+                         "whats an llm")
+
+    @patch("skill_fallback_llm.cache.monotonic")
+    def test_response_cache(self, monotonic):
+        from skill_fallback_llm.cache import ResponseCache
+        monotonic.return_value = 0
+        cache = ResponseCache(max_size=2, ttl=10)
+        cache.put("a", "response a")
+        cache.put("b", "response b")
+        self.assertEqual(cache.get("a"), "response a")
+        # "b" is least recently used
+        cache.put("c", "response c")
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("c"), "response c")
+
+        # Entries expire
+        monotonic.return_value = 11
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual(cache.get_stats(),
+                         {"size": 1, "max_size": 2, "hits": 2, "misses": 2,
+                          "evictions": 2})
+
+    def test_single_flight(self):
+        from threading import Thread
+        from skill_fallback_llm.cache import SingleFlight
+        single_flight = SingleFlight()
+        started = Event()
+        release = Event()
+        results = list()
+
+        def _request():
+            started.set()
+            release.wait(5)
+            return "response"
+
+        def _call():
+            results.append(single_flight.do("key", _request))
+
+        threads = [Thread(target=_call) for _ in range(5)]
+        threads[0].start()
+        self.assertTrue(started.wait(5))
+        for thread in threads[1:]:
+            thread.start()
+        self.assertTrue(wait_for(
+            lambda: single_flight.coalesced >= 4))
+        release.set()
+        for thread in threads:
+            thread.join(5)
+        self.assertEqual(results, ["response"] * 5)
+        self.assertEqual(single_flight.get_stats(),
+                         {"calls": 1, "coalesced": 4, "in_flight": 0})
+
+        # Exceptions are raised to the caller
+        with self.assertRaises(ValueError):
+            single_flight.do("key", Mock(side_effect=ValueError))
+        self.assertEqual(single_flight.do("key", lambda: "new"), "new")
+
+
+class TestClient(unittest.TestCase):
+    server = None
+    connections = list()
+
+    @classmethod
+    def setUpClass(cls):
+        import json
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+        from threading import Thread
+        from time import sleep
+
+        class _Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def setup(self):
+                super().setup()
+                cls.connections.append(self.client_address)
+
+            def do_POST(self):
+                request = json.loads(self.rfile.read(
+                    int(self.headers['Content-Length'])))
+                if self.path == "/llm/error":
+                    status, body = 500, b"Server Error"
+                elif self.path == "/llm/stall":
+                    # The client has given up by now; don't respond
+                    sleep(1)
+                    self.close_connection = True
+                    return
+                elif self.path == "/llm/auth" and \
+                        self.headers.get("Authorization") != "Bearer new":
+                    status, body = 401, b"Invalid or expired token."
+                else:
+                    status = 200
+                    body = json.dumps({"response": request["query"].upper(),
+                                       "path": self.path}).encode()
+                self.send_response(status)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+        Thread(target=cls.server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+
+    def test_async_llm_client(self):
+        from concurrent.futures import ThreadPoolExecutor
+        from neon_utils.hana_utils import ServerException
+        from skill_fallback_llm.client import AsyncLLMClient
+        self.connections.clear()
+        url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        client = AsyncLLMClient(url, max_connections=2)
+        resp = client.request_sync("/llm/fastchat", {"query": "hello"})
+        self.assertEqual(resp, {"response": "HELLO", "path": "/llm/fastchat"})
+
+        # Concurrent requests share a bounded pool of connections
+        with ThreadPoolExecutor(8) as executor:
+            responses = list(executor.map(
+                lambda q: client.request_sync("/llm/chatgpt", {"query": q}),
+                [f"query {i}" for i in range(20)]))
+        self.assertEqual([r["response"] for r in responses],
+                         [f"QUERY {i}" for i in range(20)])
+        self.assertLessEqual(client.connections_opened, 2)
+        self.assertEqual(len(self.connections), client.connections_opened)
+
+        with self.assertRaises(ServerException):
+            client.request_sync("/llm/error", {"query": "hello"})
+        self.assertEqual(client.request_sync("/llm/fastchat",
+                                             {"query": "ok"})["response"],
+                         "OK")
+        client.shutdown()
+
+    def test_async_llm_client_connect_timeout(self):
+        import asyncio
+        from concurrent.futures import TimeoutError as FutureTimeout
+        from skill_fallback_llm.client import AsyncLLMClient
+        open_connection = asyncio.open_connection
+        stalled = list()
+
+        async def _open_connection(*args, **kwargs):
+            # Simulate a server that never completes the connection
+            if len(stalled) < 3:
+                stalled.append(args)
+                await asyncio.sleep(10)
+            return await open_connection(*args, **kwargs)
+
+        url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        client = AsyncLLMClient(url, max_connections=2)
+        with patch("asyncio.open_connection", _open_connection):
+            for _ in range(3):
+                with self.assertRaises((asyncio.TimeoutError,
+                                        FutureTimeout)):
+                    client.request_sync("/llm/fastchat", {"query": "hi"},
+                                        timeout=0.3)
+            # Connection slots are released after timing out
+            self.assertEqual(client.request_sync(
+                "/llm/fastchat", {"query": "ok"}, timeout=2)["response"],
+                "OK")
+        client.shutdown()
+
+    def test_async_llm_client_auth(self):
+        import asyncio
+        from threading import current_thread
+        from skill_fallback_llm.client import AsyncLLMClient
+        header_threads = list()
+
+        def get_headers(refresh=False):
+            header_threads.append(current_thread().name)
+            return {"Authorization": "Bearer new" if refresh else "Bearer old"}
+
+        url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        client = AsyncLLMClient(url, get_headers=get_headers)
+        # An expired token is refreshed and the request retried
+        self.assertEqual(client.request_sync("/llm/auth",
+                                             {"query": "hi"})["response"],
+                         "HI")
+        self.assertEqual(len(header_threads), 2)
+
+        # Headers resolved by the coroutine are not resolved on the loop
+        future = asyncio.run_coroutine_threadsafe(
+            client.request("/llm/auth", {"query": "ok"}), client._loop)
+        self.assertEqual(future.result(5)["response"], "OK")
+        self.assertEqual(len(header_threads), 4)
+        self.assertNotIn("llm_client", header_threads)
+        client.shutdown()
+
+    @patch("skill_fallback_llm.client.get_hana_auth_headers")
+    def test_request_backend(self, get_headers):
+        from time import monotonic
+        from requests.exceptions import Timeout
+        from neon_utils.hana_utils import ServerException
+        from skill_fallback_llm.client import request_backend
+        from skill_fallback_llm.resilience import is_transient_error
+        get_headers.side_effect = lambda _, refresh=False: \
+            {"Authorization": "Bearer new" if refresh else "Bearer old"}
+        url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        self.assertEqual(request_backend("/llm/fastchat", {"query": "hi"},
+                                         url, 5)["response"], "HI")
+
+        # Stalled requests time out without holding a thread
+        for _ in range(10):
+            started = monotonic()
+            with self.assertRaises(Timeout) as ctx:
+                request_backend("/llm/stall", {"query": "hi"}, url, 0.1)
+            self.assertLess(monotonic() - started, 0.5)
+            self.assertTrue(is_transient_error(ctx.exception))
+        self.assertEqual(request_backend("/llm/fastchat", {"query": "ok"},
+                                         url, 5)["response"], "OK")
+
+        # An expired token is refreshed and the request retried
+        self.assertEqual(request_backend("/llm/auth", {"query": "hi"},
+                                         url, 5)["response"], "HI")
+        self.assertTrue(get_headers.call_args.kwargs["refresh"])
+        with self.assertRaises(ServerException):
+            request_backend("/llm/error", {"query": "hi"}, url, 5)
+
+        # A token rejected after refreshing is cleared
+        get_headers.side_effect = lambda _, refresh=False: \
+            {"Authorization": "Bearer revoked"}
+        with patch("skill_fallback_llm.client.clear_hana_auth") as clear:
+            with self.assertRaises(ServerException):
+                request_backend("/llm/auth", {"query": "hi"}, url, 5)
+            clear.assert_called_once_with(url, 401)
+
+        # The retry is not sent after the deadline
+        def _slow_headers(_, refresh=False):
+            if refresh:
+                sleep(0.3)
+            return {"Authorization": "Bearer old"}
+
+        get_headers.side_effect = _slow_headers
+        with self.assertRaises(TimeoutError):
+            request_backend("/llm/auth", {"query": "hi"}, url, 0.2)
+
+    def test_hana_auth(self):
+        from os.path import isfile, join
+        from tempfile import mkdtemp
+        from neon_utils import hana_utils
+        from skill_fallback_llm.client import clear_hana_auth, \
+            get_hana_auth_headers
+        real_config, real_headers = \
+            hana_utils._client_config, hana_utils._headers
+        hana_utils._client_config = {"access_token": "OLD", "expiration": 0}
+        hana_utils._headers = {"Authorization": "Bearer OLD"}
+
+        def _get_token(_):
+            hana_utils._client_config = {"access_token": "NEW"}
+
+        # Headers are rebuilt after logging in again
+        with patch.object(hana_utils, "_init_client"), \
+                patch.object(hana_utils, "_get_token", _get_token), \
+                patch.object(hana_utils, "_refresh_token",
+                             side_effect=hana_utils.ServerException()):
+            self.assertEqual(get_hana_auth_headers("https://hana",
+                                                   refresh=True),
+                             {"Authorization": "Bearer NEW"})
+
+        # A rejected token is removed from the cache
+        token_file = join(mkdtemp(), "token.json")
+        with open(token_file, "w") as f:
+            f.write("{}")
+        with patch.object(hana_utils, "_get_client_config_path",
+                          return_value=token_file):
+            clear_hana_auth("https://hana", 401)
+            self.assertTrue(isfile(token_file))
+            self.assertEqual(hana_utils._headers, {})
+            clear_hana_auth("https://hana", 403)
+            self.assertFalse(isfile(token_file))
+        hana_utils._client_config, hana_utils._headers = \
+            real_config, real_headers
+
+
+class TestResilience(unittest.TestCase):
+    @patch("skill_fallback_llm.resilience.sleep")
+    def test_call_with_retries(self, sleep):
+        from time import monotonic
+        from neon_utils.hana_utils import ServerException
+        from skill_fallback_llm.resilience import call_with_retries
+        func = Mock(side_effect=[ConnectionError(), TimeoutError(), "ok"])
+        self.assertEqual(call_with_retries(func, monotonic() + 10, 2), "ok")
+        self.assertEqual(func.call_count, 3)
+        self.assertEqual(sleep.call_count, 2)
+        for call in func.call_args_list:
+            self.assertLessEqual(call.args[0], 10)
+
+        # Retries are limited
+        func = Mock(side_effect=ConnectionError())
+        with self.assertRaises(ConnectionError):
+            call_with_retries(func, monotonic() + 10, 2)
+        self.assertEqual(func.call_count, 3)
+
+        # Client errors are not retried
+        func = Mock(side_effect=ServerException("Error response 422: bad"))
+        with self.assertRaises(ServerException):
+            call_with_retries(func, monotonic() + 10, 2)
+        func.assert_called_once()
+
+        # Expired deadline
+        with self.assertRaises(TimeoutError):
+            call_with_retries(func, monotonic() - 1)
+
+    @patch("skill_fallback_llm.resilience.monotonic")
+    def test_circuit_breaker(self, monotonic):
+        from skill_fallback_llm.resilience import CircuitBreaker
+        monotonic.return_value = 0
+        breaker = CircuitBreaker(failure_threshold=2, reset_timeout=10)
+        self.assertTrue(breaker.allow_request())
+        breaker.record_failure()
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+        breaker.record_failure()
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+        self.assertFalse(breaker.allow_request())
+
+        # One trial request is allowed after the reset timeout
+        monotonic.return_value = 11
+        self.assertEqual(breaker.state, CircuitBreaker.HALF_OPEN)
+        self.assertFalse(breaker.is_open)
+        self.assertTrue(breaker.allow_request())
+        self.assertTrue(breaker.is_open)
+        self.assertFalse(breaker.allow_request())
+        breaker.record_failure()
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+
+        monotonic.return_value = 22
+        self.assertTrue(breaker.allow_request())
+        breaker.record_success()
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+        self.assertEqual(breaker.rejected, 2)
+
+
+class TestMetrics(unittest.TestCase):
+    def test_latency_histogram(self):
+        from skill_fallback_llm.metrics import LatencyHistogram
+        histogram = LatencyHistogram()
+        self.assertEqual(histogram.percentile(50), 0.0)
+        for i in range(1, 101):
+            histogram.record(i / 100)
+        snapshot = histogram.snapshot()
+        self.assertEqual(snapshot["count"], 100)
+        self.assertAlmostEqual(snapshot["mean"], 0.505)
+        self.assertEqual(snapshot["max"], 1.0)
+        # Percentiles are accurate to within one bucket
+        self.assertAlmostEqual(snapshot["p50"], 0.5, delta=0.1)
+        self.assertAlmostEqual(snapshot["p95"], 0.95, delta=0.19)
+        self.assertLessEqual(snapshot["p99"], 1.0)
+        self.assertGreaterEqual(snapshot["p99"], 0.99 / 1.2)
+
+    def test_latency_metrics(self):
+        from skill_fallback_llm.metrics import LatencyMetrics
+        metrics = LatencyMetrics()
+        with metrics.span("test"):
+            pass
+        metrics.record("other", 2)
+        snapshot = metrics.snapshot()
+        self.assertEqual(list(snapshot.keys()), ["other", "test"])
+        self.assertEqual(snapshot["test"]["count"], 1)
+        self.assertEqual(snapshot["other"]["p50"], 2)
+
+
+class TestWorkers(unittest.TestCase):
+    def test_user_work_queue_ordering(self):
+        from skill_fallback_llm.workers import UserWorkQueue
+        queue = UserWorkQueue(max_workers=4, max_queued_per_user=10)
+        release = Event()
+        done = Event()
+        results = list()
+
+        def _task(idx):
+            release.wait(5)
+            results.append(idx)
+            if len(results) == 5:
+                done.set()
+
+        for i in range(5):
+            self.assertTrue(queue.submit("user", _task, i))
+        # Wait for the first task to start
+        self.assertTrue(wait_for(
+            lambda: queue.get_stats()['queued'] <= 4))
+        self.assertEqual(queue.get_stats()['user_queue_depth'], {"user": 4})
+        release.set()
+        self.assertTrue(done.wait(5))
+        self.assertEqual(results, [0, 1, 2, 3, 4])
+        queue.shutdown(wait=True)
+        stats = queue.get_stats()
+        self.assertEqual(stats['completed'], 5)
+        self.assertEqual(stats['queued'], 0)
+
+    def test_user_work_queue_backpressure(self):
+        from skill_fallback_llm.workers import UserWorkQueue
+        queue = UserWorkQueue(max_workers=1, max_queued_per_user=1,
+                              max_queued=2)
+        release = Event()
+        self.assertTrue(queue.submit("user_1", release.wait, 5))
+        # Wait for the first task to start
+        self.assertTrue(wait_for(
+            lambda: not queue.get_stats()['queued']))
+        self.assertTrue(queue.submit("user_1", release.wait, 5))
+        self.assertFalse(queue.submit("user_1", release.wait, 5))
+        self.assertTrue(queue.submit("user_2", release.wait, 5))
+        for i in range(3, 10):
+            self.assertFalse(queue.submit(f"user_{i}", release.wait, 5))
+        self.assertEqual(queue.get_stats()['rejected'], 8)
+        # Rejected users don't leave an empty queue behind
+        self.assertEqual(set(queue._pending), {"user_1", "user_2"})
+        release.set()
+        queue.shutdown(wait=True)
+
+    def test_user_work_queue_priority(self):
+        from skill_fallback_llm.workers import Priority, UserWorkQueue
+        queue = UserWorkQueue(max_workers=1, interactive_weight=3)
+        release = Event()
+        done = Event()
+        results = list()
+
+        def _task(user):
+            results.append(user)
+            if len(results) == 7:
+                done.set()
+
+        self.assertTrue(queue.submit("blocker", release.wait, 5))
+        self.assertTrue(wait_for(
+            lambda: not queue.get_stats()['queued']))
+        for user in ("b1", "b2", "b3"):
+            queue.submit(user, _task, user)
+        for user in ("i1", "i2", "i3", "i4"):
+            queue.submit(user, _task, user, priority=Priority.INTERACTIVE)
+        self.assertEqual(queue.get_stats()['ready_users'],
+                         {"interactive": 4, "background": 3})
+        self.assertEqual(queue.get_user_stats("i1"),
+                         {"queued": {"interactive": 1, "background": 0},
+                          "running": False})
+        self.assertTrue(queue.get_user_stats("blocker")["running"])
+        release.set()
+        self.assertTrue(done.wait(5))
+        queue.shutdown(wait=True)
+        # Interactive tasks go first without starving background tasks
+        self.assertEqual(results, ["i1", "i2", "i3", "b1", "i4", "b2", "b3"])
+
+
+class TestRateLimit(unittest.TestCase):
+    @patch("skill_fallback_llm.ratelimit.monotonic")
+    def test_user_rate_limiter(self, monotonic):
+        from skill_fallback_llm.ratelimit import UserRateLimiter
+        monotonic.return_value = 100
+        limiter = UserRateLimiter(requests_per_minute=6, burst=2)
+        self.assertTrue(limiter.allow("user"))
+        self.assertTrue(limiter.allow("user"))
+        self.assertFalse(limiter.has_capacity("user"))
+        self.assertFalse(limiter.allow("user"))
+        # Other users have their own limit
+        self.assertTrue(limiter.allow("other"))
+        self.assertEqual(limiter.get_stats(),
+                         {"tracked_users": 2, "allowed": 3, "limited": 1,
+                          "limited_users": ["user"]})
+        # One token is added every 10 seconds
+        monotonic.return_value = 110
+        self.assertTrue(limiter.has_capacity("user"))
+        self.assertTrue(limiter.allow("user"))
+        self.assertFalse(limiter.allow("user"))
+        self.assertEqual(limiter.get_user_stats("user"),
+                         {"tokens": 0.0, "allowed": 3, "limited": 2})
+        monotonic.return_value = 200
+        self.assertEqual(limiter.prune(), 2)
+        self.assertEqual(limiter.get_stats()["tracked_users"], 0)
+
 
 if __name__ == '__main__':
     unittest.main()
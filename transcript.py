@@ -0,0 +1,120 @@
+# NEON AI (TM) SOFTWARE, Software Development Kit & Application Framework
+# All trademark and other rights reserved by their respective owners
+# Copyright 2008-2025 Neongecko.com Inc.
+# Contributors: Daniel McKnight, Guy Daniels, Elon Gasper, Richard Leeds,
+# Regina Bloomstine, Casimiro Ferreira, Andrii Pernatii, Kirill Hrymailo
+# BSD-3 License
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+# 3. Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived from this
+#    software without specific prior written permission.
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO,
+# THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+# CONTRIBUTORS  BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA,
+# OR PROFITS;  OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+# LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+# NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE,  EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+from base64 import b64encode
+from html import escape
+from typing import Callable, Dict, Iterable, Iterator, List, Tuple
+
+from .history import HistoryEntry
+
+TEXT = "text"
+HTML = "html"
+
+
+def format_text_line(entry: HistoryEntry) -> str:
+    """
+    Format a history entry as a line of a plain text transcript
+    :param entry: Turn or (speaker, text) entry to format
+    :returns: line of text
+    """
+    speaker, text = entry
+    text = text.replace('\n\n', '\n').replace('\n', '\n\t...')
+    return f"[{speaker}] {text}\n"
+
+
+def format_html_line(entry: HistoryEntry) -> str:
+    """
+    Format a history entry as a paragraph of an HTML transcript
+    :param entry: Turn or (speaker, text) entry to format
+    :returns: HTML paragraph
+    """
+    speaker, text = entry
+    text = escape(text).replace('\n\n', '\n').replace('\n', '<br>')
+    return f"<p><b>[{escape(speaker)}]</b> {text}</p>\n"
+
+
+_FORMATTERS: Dict[str, Callable[[HistoryEntry], str]] = {
+    TEXT: format_text_line, HTML: format_html_line}
+_EXTENSIONS = {TEXT: "txt", HTML: "html"}
+
+
+def iter_transcript(entries: Iterable[HistoryEntry],
+                    fmt: str = TEXT) -> Iterator[str]:
+    """
+    Render a transcript one line at a time
+    :param entries: history entries, oldest first
+    :param fmt: `text` or `html`
+    :returns: iterator of transcript lines
+    """
+    if fmt not in _FORMATTERS:
+        raise ValueError(f"Invalid transcript format: {fmt}")
+    return map(_FORMATTERS[fmt], entries)
+
+
+def render_transcript(entries: Iterable[HistoryEntry],
+                      fmt: str = TEXT) -> str:
+    """
+    Render a complete transcript
+    :param entries: history entries, oldest first
+    :param fmt: `text` or `html`
+    :returns: transcript
+    """
+    return "".join(iter_transcript(entries, fmt))
+
+
+def split_transcript(entries: Iterable[HistoryEntry], fmt: str = TEXT,
+                     max_part_bytes: int = 0) -> Tuple[str, Dict[str, str]]:
+    """
+    Render a transcript as an email body and attachments. The body holds as
+    many of the oldest entries as fit in `max_part_bytes`; the rest are split
+    into attachments of up to `max_part_bytes` each. An entry is never split
+    across parts.
+    :param entries: history entries, oldest first
+    :param fmt: `text` or `html`
+    :param max_part_bytes: max UTF-8 size of each part (0 for no limit)
+    :returns: email body, dict of attachment file names to Base64 content
+    """
+    parts: List[bytes] = list()
+    lines: List[bytes] = list()
+    size = 0
+    for line in iter_transcript(entries, fmt):
+        line = line.encode("utf-8")
+        if lines and max_part_bytes and size + len(line) > max_part_bytes:
+            parts.append(b"".join(lines))
+            lines = list()
+            size = 0
+        lines.append(line)
+        size += len(line)
+    parts.append(b"".join(lines))
+    attachments = dict()
+    for idx, part in enumerate(parts[1:], start=2):
+        if fmt == HTML:
+            part = b"<html><body>\n" + part + b"</body></html>\n"
+        attachments[f"chat_history_{idx}.{_EXTENSIONS[fmt]}"] = \
+            b64encode(part).decode("ascii")
+    return parts[0].decode("utf-8"), attachments
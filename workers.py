@@ -0,0 +1,197 @@
+# NEON AI (TM) SOFTWARE, Software Development Kit & Application Framework
+# All trademark and other rights reserved by their respective owners
+# Copyright 2008-2025 Neongecko.com Inc.
+# Contributors: Daniel McKnight, Guy Daniels, Elon Gasper, Richard Leeds,
+# Regina Bloomstine, Casimiro Ferreira, Andrii Pernatii, Kirill Hrymailo
+# BSD-3 License
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+# 3. Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived from this
+#    software without specific prior written permission.
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO,
+# THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+# CONTRIBUTORS  BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA,
+# OR PROFITS;  OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+# LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+# NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE,  EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from enum import Enum
+from threading import Lock
+from time import monotonic
+from typing import Callable, Deque, Dict, Set, Tuple
+
+from ovos_utils.log import LOG
+
+
+class Priority(Enum):
+    INTERACTIVE = "interactive"
+    BACKGROUND = "background"
+
+
+class UserWorkQueue:
+    """
+    Runs tasks on a bounded pool of worker threads. Tasks submitted for the
+    same user run one at a time in the order they were submitted. Users take
+    turns, and users whose next task is interactive are served before users
+    waiting on background tasks.
+    """
+    def __init__(self, max_workers: int = 4, max_queued_per_user: int = 3,
+                 max_queued: int = 100, interactive_weight: int = 3):
+        """
+        :param max_workers: number of worker threads
+        :param max_queued_per_user: max number of tasks waiting for one user
+        :param max_queued: max number of tasks waiting for all users
+        :param interactive_weight: max number of interactive tasks started
+            in a row while background tasks are waiting
+        """
+        self._executor = ThreadPoolExecutor(max_workers=max_workers,
+                                            thread_name_prefix="llm_worker")
+        self._max_workers = max_workers
+        self._max_queued_per_user = max_queued_per_user
+        self._max_queued = max_queued
+        self._interactive_weight = interactive_weight
+        self._lock = Lock()
+        self._pending: Dict[str, Deque[Tuple[float, Priority, Callable,
+                                             tuple]]] = dict()
+        # Users with a task ready to run, by the priority of that task
+        self._ready: Dict[Priority, Deque[str]] = {p: deque()
+                                                   for p in Priority}
+        self._active: Set[str] = set()
+        self._interactive_streak = 0
+        self._queued = 0
+        self.submitted = 0
+        self.rejected = 0
+        self.completed = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def submit(self, user: str, func: Callable, *args,
+               priority: Priority = Priority.BACKGROUND) -> bool:
+        """
+        Queue a task to run for a user
+        :param user: user the task is associated with
+        :param func: callable to run
+        :param args: positional args to pass to `func`
+        :param priority: scheduling priority of the task
+        :returns: True if the task was queued, False if the queue is full
+        """
+        with self._lock:
+            user_queued = len(self._pending.get(user, ()))
+            if user_queued >= self._max_queued_per_user or \
+                    self._queued >= self._max_queued:
+                self.rejected += 1
+                LOG.warning(f"Rejecting task for {user}. "
+                            f"user_queued={user_queued}|"
+                            f"total_queued={self._queued}")
+                return False
+            # Only users with pending tasks have a queue
+            pending = self._pending.setdefault(user, deque())
+            pending.append((monotonic(), priority, func, args))
+            self._queued += 1
+            self.submitted += 1
+            if user not in self._active and len(pending) == 1:
+                self._mark_ready(user)
+        return True
+
+    def _mark_ready(self, user: str):
+        """
+        Queue a user to run their next task. Must be called with the lock
+        held.
+        :param user: user with a pending task
+        """
+        self._ready[self._pending[user][0][1]].append(user)
+        self._executor.submit(self._run_next)
+
+    def _next_user(self) -> str:
+        """
+        Choose the next user to run a task for. Must be called with the lock
+        held.
+        :returns: user to run a task for
+        """
+        interactive = self._ready[Priority.INTERACTIVE]
+        background = self._ready[Priority.BACKGROUND]
+        if interactive and (not background or self._interactive_streak <
+                            self._interactive_weight):
+            self._interactive_streak += 1
+            return interactive.popleft()
+        self._interactive_streak = 0
+        return background.popleft()
+
+    def _run_next(self):
+        """
+        Run the next pending task for the next ready user. If the user has
+        more pending tasks, they are re-queued behind any other waiting
+        users.
+        """
+        with self._lock:
+            user = self._next_user()
+            queued_time, _, func, args = self._pending[user].popleft()
+            self._active.add(user)
+            self._queued -= 1
+        wait = monotonic() - queued_time
+        try:
+            func(*args)
+        except Exception as e:
+            LOG.exception(e)
+        with self._lock:
+            self.completed += 1
+            self.total_wait += wait
+            self.max_wait = max(self.max_wait, wait)
+            self._active.remove(user)
+            if self._pending[user]:
+                self._mark_ready(user)
+            else:
+                self._pending.pop(user)
+
+    def get_stats(self) -> dict:
+        """
+        Get a snapshot of queue statistics
+        :returns: dict queue depth and task wait time stats
+        """
+        with self._lock:
+            return {"workers": self._max_workers,
+                    "queued": self._queued,
+                    "active_users": len(self._active),
+                    "ready_users": {p.value: len(users) for p, users
+                                    in self._ready.items()},
+                    "user_queue_depth": {user: len(tasks) for user, tasks
+                                         in self._pending.items() if tasks},
+                    "submitted": self.submitted,
+                    "rejected": self.rejected,
+                    "completed": self.completed,
+                    "avg_wait_seconds": self.total_wait / self.completed
+                    if self.completed else 0.0,
+                    "max_wait_seconds": self.max_wait}
+
+    def get_user_stats(self, user: str) -> dict:
+        """
+        Get a snapshot of a single user's queue
+        :param user: user to get queue stats for
+        :returns: dict number of queued tasks by priority and whether a task
+            is running
+        """
+        with self._lock:
+            queued = {p.value: 0 for p in Priority}
+            for _, priority, _, _ in self._pending.get(user, ()):
+                queued[priority.value] += 1
+            return {"queued": queued, "running": user in self._active}
+
+    def shutdown(self, wait: bool = False):
+        """
+        Stop accepting tasks and shut down worker threads
+        :param wait: if True, block until running tasks complete
+        """
+        self._executor.shutdown(wait=wait, cancel_futures=True)